@@ -11,7 +11,7 @@ https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 
 from pathlib import Path 
-from decouple import config 
+from decouple import Csv, config 
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -39,16 +39,22 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
 
+    # third party apps
+    'rest_framework',
+
     # dev apps 
     'main', 
 ]
 
 MIDDLEWARE = [
+    'main.instrumentation.QueryInstrumentationMiddleware',
+    'main.routers.PinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'main.audit.ActingUserMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -77,17 +83,76 @@ WSGI_APPLICATION = 'inventory.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
+# Connections persist for DB_CONN_MAX_AGE seconds and are health-checked
+# before reuse, so a request doesn't pay for a new connection. Behind a
+# transaction-mode pooler (PgBouncer) set DB_POOLER, which turns off the
+# server-side cursors .iterator() would otherwise hold across transactions.
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': config('DB_ENGINE', default='django.db.backends.postgresql'),
         'NAME': config('DB_NAME'), 
         'USER': config('DB_USER'), 
         'PASSWORD': config('DB_PASSWORD'), 
-        'HOST_ADDRESS': config('DB_HOST'), 
+        'HOST': config('DB_HOST'), 
         'PORT': config('DB_PORT'), 
+        'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=60, cast=int),
+        'CONN_HEALTH_CHECKS': True,
+        'DISABLE_SERVER_SIDE_CURSORS': config('DB_POOLER', default=False, cast=bool),
+    }
+}
+
+# Optional read replica for reports, exports, search and dashboards (see
+# main.routers); unset DB_REPLICA_NAME and everything uses the primary.
+# Locally, DB_ENGINE=django.db.backends.sqlite3 with DB_NAME and
+# DB_REPLICA_NAME naming two files works too. Tests use the primary for it.
+
+REPLICA_DATABASE = 'replica'
+
+if config('DB_REPLICA_NAME', default=''):
+    DATABASES[REPLICA_DATABASE] = {
+        **DATABASES['default'],
+        'NAME': config('DB_REPLICA_NAME'),
+        'HOST': config('DB_REPLICA_HOST', default=DATABASES['default']['HOST']),
+        'PORT': config('DB_REPLICA_PORT', default=DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['main.routers.ReplicaRouter']
+
+
+# Caches
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# The default alias is the shared tier of main.bom and main.refdata; point it
+# at Redis or Memcached in production so invalidations reach every process
+# (the local-memory default is only shared within one process).
+
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default=''),
     }
 }
 
+if CACHES['default']['BACKEND'].endswith('.LocMemCache'):
+    # The default cap of 300 entries would evict version tokens constantly.
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': 100000}
+
+# Two-tier caches: ALIAS is the shared tier, LOCAL_MAX_ENTRIES bounds the
+# in-process LRU in front of it, TIMEOUT is the shared entries' lifetime.
+
+BOM_CACHE = {
+    'ALIAS': 'default',
+    'LOCAL_MAX_ENTRIES': config('BOM_CACHE_LOCAL_MAX_ENTRIES', default=10000, cast=int),
+    'TIMEOUT': 24 * 60 * 60,
+}
+
+REFERENCE_CACHE = {
+    'ALIAS': 'default',
+    'LOCAL_MAX_ENTRIES': config('REFERENCE_CACHE_LOCAL_MAX_ENTRIES', default=50000, cast=int),
+    'TIMEOUT': 24 * 60 * 60,
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -132,4 +197,64 @@ STATIC_URL = '/static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-AUTH_USER_MODEL = 'main.User' 
\ No newline at end of file
+AUTH_USER_MODEL = 'main.User' 
+
+# Time-ordered (UUIDv7) primary keys for BaseModel instead of uuid4; opt in,
+# since the ids then reveal when each row was created.
+TIME_ORDERED_IDS = config('TIME_ORDERED_IDS', default=False, cast=bool)
+
+
+# Django REST framework
+# https://www.django-rest-framework.org/api-guide/settings/
+
+REST_FRAMEWORK = {
+    'DEFAULT_PERMISSION_CLASSES': [
+        'rest_framework.permissions.IsAuthenticated',
+    ],
+    'DEFAULT_PAGINATION_CLASS': 'main.pagination.CreatedAtCursorPagination',
+    'PAGE_SIZE': 50,
+}
+
+
+# Query budgets per view name, checked by main.instrumentation on every
+# request: "queries" and "duplicates" count SQL statements (session
+# authentication accounts for two, and each reference model read through a
+# cold main.refdata cache for one), "db_ms" is time spent in the database.
+# Over-budget requests are logged, or fail when QUERY_BUDGET_ENFORCE is on
+# (the test suite turns it on).
+
+QUERY_BUDGET_ENFORCE = config('QUERY_BUDGET_ENFORCE', default=False, cast=bool)
+
+# Who may scrape /metrics besides staff: requests carrying
+# "Authorization: Bearer <METRICS_TOKEN>", and clients whose REMOTE_ADDR is
+# in METRICS_ALLOWED_NETWORKS (comma-separated CIDRs). Behind a reverse
+# proxy every request comes from the proxy, so use the token there.
+
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+METRICS_ALLOWED_NETWORKS = config('METRICS_ALLOWED_NETWORKS', default='', cast=Csv())
+
+QUERY_BUDGETS = {
+    'supplier-list': {'queries': 3, 'duplicates': 0},
+    'supplier-detail': {'queries': 3, 'duplicates': 0},
+    'material-list': {'queries': 4, 'duplicates': 0},
+    'material-detail': {'queries': 4, 'duplicates': 0},
+    'stock-list': {'queries': 4, 'duplicates': 0},
+    'stock-detail': {'queries': 4, 'duplicates': 0},
+    # The nearest snapshot and the movements since.
+    'stock-as-of': {'queries': 4, 'duplicates': 0},
+    'product-list': {'queries': 4, 'duplicates': 0},
+    'product-detail': {'queries': 4, 'duplicates': 0},
+    'order-list': {'queries': 5, 'duplicates': 0},
+    'order-detail': {'queries': 5, 'duplicates': 0},
+    'order-status': {'queries': 8, 'duplicates': 0},
+    'purchase-list': {'queries': 5, 'duplicates': 0},
+    'purchase-detail': {'queries': 5, 'duplicates': 0},
+    'job-detail': {'queries': 3, 'duplicates': 0},
+    'order-dashboard': {'queries': 3, 'duplicates': 0},
+    # One search query, and the fallback index's freshness check off Postgres.
+    'search': {'queries': 4, 'duplicates': 0, 'db_ms': 20},
+    # Numbering newly committed events (lock, last number, pending probe, one
+    # UPDATE, and a savepoint pair under tests) before one read.
+    'outbox': {'queries': 9, 'duplicates': 0},
+    'availability': {'queries': 4, 'duplicates': 0},
+}
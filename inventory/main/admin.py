@@ -1,3 +1,181 @@
+"""Admin for tables with millions of rows.
+
+Every changelist renders in a fixed number of queries, whatever its size:
+
+* ``EstimatedCountPaginator`` replaces the exact ``COUNT(*)`` with the
+  planner's estimate on large tables, and ``show_full_result_count`` is off
+  so a filtered page doesn't count the whole table a second time;
+* ``list_select_related`` fetches what each row's ``__str__`` and columns
+  dereference in the page query itself;
+* foreign keys are edited through raw-id or autocomplete widgets, so change
+  forms never load a whole table into a ``<select>``;
+* the archive filter defaults to live rows and the other filters are on
+  indexed columns, so filtered pages can use the ``is_archived = false``
+  partial indexes.
+
+Audit columns are stamped from the acting user (``main.audit``), and
+users still recorded on rows are refused deletion from one query rather
+than a ``PROTECT`` collection over every table; deactivate them instead.
+"""
 from django.contrib import admin
+from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+
+from main import audit
+from main.models import (
+    Client, Job, Material, MaterialConsumption, MaterialUnit, Order, OrderProduct, Product, ProductMaterial, Purchase,
+    Stock, StockMovement, Supplier, User,
+)
+from main.pagination import EstimatedCountPaginator
+
+AUDIT_FIELDS = ('created_by', 'updated_by', 'created_at', 'updated_at')
+
+
+class ArchivedFilter(admin.SimpleListFilter):
+    """Live rows unless archived ones are asked for."""
+    title = 'archived'
+    parameter_name = 'archived'
+
+    def lookups(self, request, model_admin):
+        return (('live', 'Live'), ('archived', 'Archived'), ('all', 'All'))
+
+    def queryset(self, request, queryset):
+        value = self.value() or 'live'
+        if value == 'all':
+            return queryset
+        return queryset.filter(is_archived=value == 'archived')
+
+    def choices(self, changelist):
+        value = self.value() or 'live'
+        for lookup, title in self.lookup_choices:
+            yield {
+                'selected': value == lookup,
+                'query_string': changelist.get_query_string({self.parameter_name: lookup}),
+                'display': title,
+            }
+
+
+class AuditedAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_filter = (ArchivedFilter,)
+    readonly_fields = AUDIT_FIELDS
+    list_per_page = 50
+
+
+@admin.register(User)
+class UserAdmin(BaseUserAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    readonly_fields = AUDIT_FIELDS
+    actions = ('deactivate',)
+
+    @admin.action(description='Deactivate selected users')
+    def deactivate(self, request, queryset):
+        count = audit.deactivate(queryset.values_list('pk', flat=True))
+        self.message_user(request, f'{count} users deactivated.')
+
+    def get_deleted_objects(self, objs, request):
+        # Refuse users that rows point at from one EXISTS query, before
+        # Django collects every row their audit columns protect.
+        referenced = audit.in_use(obj.pk for obj in objs)
+        if referenced:
+            protected = [
+                f'{obj} is recorded on inventory rows; deactivate instead.' for obj in objs if obj.pk in referenced
+            ]
+            return [], {}, set(), protected
+        return super().get_deleted_objects(objs, request)
+
+
+@admin.register(Supplier)
+class SupplierAdmin(AuditedAdmin):
+    list_display = ('name', 'created_at')
+    search_fields = ('name',)
+
+
+@admin.register(Client)
+class ClientAdmin(AuditedAdmin):
+    list_display = ('name', 'created_at')
+    search_fields = ('name',)
+
+
+class MaterialUnitInline(admin.TabularInline):
+    model = MaterialUnit
+    extra = 0
+
+
+@admin.register(Material)
+class MaterialAdmin(AuditedAdmin):
+    inlines = (MaterialUnitInline,)
+    list_display = ('name', 'supplier', 'created_at')
+    list_select_related = ('supplier',)
+    list_filter = (ArchivedFilter, 'supplier')
+    autocomplete_fields = ('supplier',)
+    search_fields = ('name',)
+
+
+@admin.register(Product)
+class ProductAdmin(AuditedAdmin):
+    list_display = ('name', 'price', 'material_cost', 'costed_at')
+    search_fields = ('name',)
+
+
+@admin.register(ProductMaterial)
+class ProductMaterialAdmin(AuditedAdmin):
+    list_display = ('__str__', 'quantity')
+    list_select_related = ('material', 'product')
+    raw_id_fields = ('material', 'product')
+
+
+@admin.register(Stock)
+class StockAdmin(AuditedAdmin):
+    list_display = ('__str__', 'created_at')
+    list_select_related = ('material',)
+    raw_id_fields = ('material',)
+
+
+@admin.register(Purchase)
+class PurchaseAdmin(AuditedAdmin):
+    list_display = ('__str__', 'quantity', 'qty_unit', 'base_quantity', 'requested_at', 'arrived_at', 'is_draft')
+    list_select_related = ('material', 'supplier')
+    list_filter = (ArchivedFilter, 'supplier')
+    readonly_fields = AUDIT_FIELDS + ('base_quantity',)
+    raw_id_fields = ('material', 'requested_user')
+    autocomplete_fields = ('supplier',)
+
+
+@admin.register(Order)
+class OrderAdmin(AuditedAdmin):
+    list_display = ('id', 'client', 'order_status', 'requested_at', 'finished_at')
+    list_select_related = ('client',)
+    list_filter = (ArchivedFilter, 'order_status')
+    autocomplete_fields = ('client',)
+
+
+@admin.register(OrderProduct)
+class OrderProductAdmin(AuditedAdmin):
+    list_display = ('__str__', 'order_id')
+    list_select_related = ('product',)
+    raw_id_fields = ('order', 'product')
+
+
+@admin.register(MaterialConsumption)
+class MaterialConsumptionAdmin(AuditedAdmin):
+    list_display = ('__str__', 'quantity', 'is_allocated', 'created_at')
+    list_select_related = ('material', 'order_product__product')
+    raw_id_fields = ('order_product', 'material')
+
+
+@admin.register(StockMovement)
+class StockMovementAdmin(AuditedAdmin):
+    list_display = ('__str__', 'material', 'created_at')
+    list_select_related = ('material',)
+    raw_id_fields = ('material', 'purchase', 'material_consumption')
+
 
-# Register your models here.
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_display = ('__str__', 'run_after', 'locked_by', 'finished_at')
+    list_filter = ('status',)
+    readonly_fields = ('locked_by', 'locked_at', 'created_at', 'finished_at')
@@ -0,0 +1,93 @@
+"""Move archived purchase and consumption history out of the hot tables.
+
+Archiving a row only sets ``is_archived``; the row stays in ``purchase`` or
+``materialconsumption`` and every scan, vacuum and index on those tables
+keeps paying for it. ``move`` takes archived rows created before a cutoff
+and moves them, in small batches, into cold tables with the same columns
+(``ArchivedPurchase``, ``ArchivedMaterialConsumption``). Each batch is one
+short transaction, ``INSERT ... SELECT`` into the cold table and
+``DELETE`` from the hot one, so locks are held for one batch at a time and
+the rows never leave the database. Rows are found through a partial
+index on archived rows only, which shrinks as they move out.
+
+Ids are kept, so the stock movements of a moved row still point at it.
+The ``archive_history`` command runs the move.
+
+``history`` is the read side: the ``values()`` of the hot table with the
+cold table's matching rows appended, for callers that want history too.
+"""
+import time
+
+from django.db import connections, router, transaction
+
+from main.models import ArchivedMaterialConsumption, ArchivedPurchase, MaterialConsumption, Purchase
+
+ARCHIVES = {
+    Purchase: ArchivedPurchase,
+    MaterialConsumption: ArchivedMaterialConsumption,
+}
+
+
+def attnames(model):
+    """The columns ``model`` shares with its archive table, as attribute names."""
+    return [field.attname for field in ARCHIVES[model]._meta.concrete_fields]
+
+
+def due(model, before):
+    return model.objects.filter(is_archived=True, created_at__lt=before)
+
+
+def move_batch(model, before, batch_size=1000):
+    """Move up to ``batch_size`` archived rows created before ``before``; returns how many moved."""
+    archive = ARCHIVES[model]
+    db = router.db_for_write(model)
+    connection = connections[db]
+    quote = connection.ops.quote_name
+    with transaction.atomic(using=db):
+        rows = due(model, before).using(db).order_by('created_at', 'id')
+        if connection.features.has_select_for_update_skip_locked:
+            rows = rows.select_for_update(skip_locked=True)
+        ids = list(rows.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return 0
+        names = attnames(model)
+        select, params = model.objects.using(db).filter(pk__in=ids).values_list(*names).query.sql_with_params()
+        columns = ', '.join(quote(archive._meta.get_field(name).column) for name in names)
+        with connection.cursor() as cursor:
+            cursor.execute(f'INSERT INTO {quote(archive._meta.db_table)} ({columns}) {select}', params)
+        model.objects.using(db).filter(pk__in=ids).delete()
+    return len(ids)
+
+
+def move(model, before, batch_size=1000, pause=0.0, limit=None, stop=None):
+    """Move archived rows created before ``before`` batch by batch; returns how many moved.
+
+    ``pause`` seconds between batches leave room for replication and other
+    writers; ``stop()`` is checked between batches.
+    """
+    stop = stop or (lambda: False)
+    moved = 0
+    while not stop() and (limit is None or moved < limit):
+        size = batch_size if limit is None else min(batch_size, limit - moved)
+        n = move_batch(model, before, size)
+        moved += n
+        if n < size:
+            break
+        if pause:
+            time.sleep(pause)
+    return moved
+
+
+def history(model, *fields, include_history=True, **filters):
+    """``values(*fields)`` of the rows of ``model`` matching ``filters``, moved history included.
+
+    ``fields`` default to every column the tables share and may span
+    relations (``material__name``). The result is a ``UNION ALL`` and can
+    only be ordered, sliced or iterated further, so filter through
+    ``filters``.
+    """
+    fields = fields or attnames(model)
+    rows = model.objects.filter(**filters).values(*fields)
+    if not include_history:
+        return rows
+    return rows.union(ARCHIVES[model].objects.filter(**filters).values(*fields), all=True)
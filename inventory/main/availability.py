@@ -0,0 +1,147 @@
+"""Can we build ``quantity`` of each product from the stock we hold?
+
+``check`` answers a whole request with one BOM lookup (``main.bom``) and one
+balance query. ``acheck`` is the same for async views: every product's BOM
+and every material's balance is requested separately and concurrently
+through a ``BatchLoader``, which collects the keys asked for during one
+turn of the event loop into a single lookup and lets concurrent callers
+asking for the same key share it. A burst of identical storefront checks
+therefore costs one round trip, and a burst of different ones is still
+answered set-wise.
+"""
+import asyncio
+import uuid
+import weakref
+
+from asgiref.sync import sync_to_async
+
+from main import bom, ledger
+from main.models import StockBalance
+
+
+def parse_items(value):
+    """``"<product_id>:<quantity>,..."`` -> ``{product_id: quantity}``; raises ``ValueError``."""
+    quantities = {}
+    for item in filter(None, value.split(',')):
+        product_id, _, quantity = item.partition(':')
+        product_id, quantity = uuid.UUID(product_id), int(quantity or 1)
+        if quantity <= 0:
+            raise ValueError(f'Quantity of {product_id} must be positive.')
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    return quantities
+
+
+def evaluate(quantities, boms, available):
+    """Availability of ``{product_id: quantity}`` given BOMs and ``{material_id: available}``.
+
+    Each product is judged on its own against the full stock; products
+    competing for the same material are not netted against each other.
+    """
+    result = {}
+    for product_id, quantity in quantities.items():
+        lines = boms.get(product_id, ())
+        buildable = min(
+            (available.get(line.material_id, 0) // line.quantity for line in lines if line.quantity > 0),
+            default=None,
+        )
+        short = {
+            str(line.material_id): line.quantity * quantity - available.get(line.material_id, 0)
+            for line in lines
+            if line.quantity * quantity > available.get(line.material_id, 0)
+        }
+        result[str(product_id)] = {
+            'quantity': quantity,
+            'available': not short,
+            'buildable': None if buildable is None else max(int(buildable), 0),
+            'short': short,
+        }
+    return result
+
+
+def check(quantities):
+    boms = bom.get_boms(quantities)
+    material_ids = {line.material_id for lines in boms.values() for line in lines}
+    balances = ledger.get_balances(material_ids)
+    return evaluate(quantities, boms, {m: b.available for m, b in balances.items()})
+
+
+class BatchLoader:
+    """Coalesce concurrent single-key lookups into batched calls.
+
+    ``load_many`` is a coroutine function taking a list of keys and
+    returning ``{key: value}``. Keys requested while a batch for them is
+    pending or in flight wait for that batch instead of starting another.
+    A loader belongs to one event loop.
+    """
+
+    def __init__(self, load_many):
+        self.load_many = load_many
+        self.pending = {}
+        self.inflight = {}
+        self.stats = {'requested': 0, 'shared': 0, 'batches': 0}
+
+    async def load(self, key):
+        self.stats['requested'] += 1
+        future = self.pending.get(key) or self.inflight.get(key)
+        if future is not None:
+            self.stats['shared'] += 1
+        else:
+            loop = asyncio.get_running_loop()
+            if not self.pending:
+                loop.call_soon(self.dispatch)
+            future = self.pending[key] = loop.create_future()
+        # Shielded so one cancelled caller doesn't cancel the others' lookup.
+        return await asyncio.shield(future)
+
+    def dispatch(self):
+        batch, self.pending = self.pending, {}
+        self.inflight.update(batch)
+        self.stats['batches'] += 1
+        asyncio.ensure_future(self.run(batch))
+
+    async def run(self, batch):
+        try:
+            values = await self.load_many(list(batch))
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for key, future in batch.items():
+                if not future.done():
+                    future.set_result(values.get(key))
+        finally:
+            for key in batch:
+                self.inflight.pop(key, None)
+
+
+async def _load_boms(product_ids):
+    return await sync_to_async(bom.get_boms)(product_ids)
+
+
+async def _load_available(material_ids):
+    available = dict.fromkeys(material_ids, 0)
+    rows = StockBalance.objects.filter(material_id__in=material_ids).values_list('material_id', 'on_hand', 'reserved')
+    async for material_id, on_hand, reserved in rows:
+        available[material_id] = on_hand - reserved
+    return available
+
+
+_loaders = weakref.WeakKeyDictionary()
+
+
+def loaders():
+    """The ``(bom, available)`` loaders of the running event loop."""
+    loop = asyncio.get_running_loop()
+    if loop not in _loaders:
+        _loaders[loop] = (BatchLoader(_load_boms), BatchLoader(_load_available))
+    return _loaders[loop]
+
+
+async def acheck(quantities):
+    bom_loader, available_loader = loaders()
+    product_ids = list(quantities)
+    boms = dict(zip(product_ids, await asyncio.gather(*(bom_loader.load(p) for p in product_ids))))
+    material_ids = list({line.material_id for lines in boms.values() for line in lines})
+    available = dict(zip(material_ids, await asyncio.gather(*(available_loader.load(m) for m in material_ids))))
+    return evaluate(quantities, boms, available)
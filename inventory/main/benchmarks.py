@@ -0,0 +1,200 @@
+"""Timed core workflows, for comparing performance across commits.
+
+Each benchmark is a function of a ``Context`` registered with
+``@benchmark``; ``run`` calls it ``repeat`` times after ``warmup``
+untimed calls and records the wall time and the queries of every call
+(``main.instrumentation.record``). Benchmarks that write run inside a
+transaction that is rolled back, so every call sees the same data and the
+database is left as it was. Random choices come from a seeded generator,
+so two runs against the same data (``main.synthetic``) do the same work.
+
+``run`` returns a JSON-ready dict; ``compare`` lines two of them up.
+"""
+import random
+import statistics
+import subprocess
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from main import availability, exporters, fulfilment, instrumentation, ledger, planning, snapshots, summary
+from main.models import (
+    Client, Material, MaterialConsumption, Order, OrderProduct, Product, Purchase, StockMovement, User,
+)
+
+BENCHMARKS = {}
+SAMPLE_SIZE = 10000
+
+
+def benchmark(name, writes=False):
+    """Register ``func(context)`` as benchmark ``name``; ``writes`` ones are rolled back."""
+    def register(func):
+        BENCHMARKS[name] = (func, writes)
+        return func
+    return register
+
+
+class Context:
+    """Ids sampled once per run for the benchmarks to draw from."""
+
+    def __init__(self, seed=0):
+        self.rng = random.Random(seed)
+        self.user = User.objects.order_by('-is_staff', 'created_at').first()
+        if self.user is None:
+            raise ValueError('No user to run the benchmarks as; generate data first.')
+        self.client_ids = self.sample(Client.objects.filter(is_archived=False))
+        self.material_ids = self.sample(Material.objects.filter(is_archived=False))
+        self.product_ids = self.sample(Product.objects.filter(is_archived=False))
+        self.pending_order_ids = self.sample(Order.objects.filter(order_status='pending', is_archived=False))
+        self.reserved_ids = self.sample(
+            MaterialConsumption.objects.filter(is_allocated=False, is_archived=False)
+        )
+        if not (self.client_ids and self.material_ids and self.product_ids):
+            raise ValueError('Need live clients, materials and products; generate data first.')
+
+    @staticmethod
+    def sample(queryset):
+        return list(queryset.order_by('pk').values_list('pk', flat=True)[:SAMPLE_SIZE])
+
+    def pick(self, ids, k):
+        return self.rng.sample(ids, min(k, len(ids)))
+
+
+@benchmark('order_entry', writes=True)
+def order_entry(context):
+    """Check availability of a 3-line order, then place it."""
+    quantities = {p: context.rng.randint(1, 5) for p in context.pick(context.product_ids, 3)}
+    availability.check(quantities)
+    audit = {'created_by': context.user, 'updated_by': context.user}
+    order = Order.objects.create(
+        client_id=context.rng.choice(context.client_ids), requested_at=timezone.now(), **audit,
+    )
+    OrderProduct.objects.bulk_create(summary.price_lines([
+        OrderProduct(order=order, product_id=p, quantity=q, **audit) for p, q in quantities.items()
+    ]))
+    summary.refresh([order.pk])
+
+
+@benchmark('allocation.approve', writes=True)
+def approve(context):
+    """Reserve the materials of 20 pending orders."""
+    fulfilment.fulfil_orders(context.pick(context.pending_order_ids, 20), context.user)
+
+
+@benchmark('allocation.allocate', writes=True)
+def allocate(context):
+    """Turn 50 reservations into allocations."""
+    ledger.allocate(context.pick(context.reserved_ids, 50), context.user)
+
+
+@benchmark('stock_lookup.balances')
+def balances(context):
+    ledger.get_balances(context.pick(context.material_ids, 50))
+
+
+@benchmark('stock_lookup.availability')
+def buildable(context):
+    availability.check({p: 1 for p in context.pick(context.product_ids, 5)})
+
+
+@benchmark('reporting.dashboard')
+def dashboard(context):
+    list(summary.dashboard(since=timezone.localdate() - timedelta(days=30), by_client=True))
+
+
+@benchmark('reporting.export')
+def export(context):
+    """Stream the last 30 days of purchases as CSV."""
+    for _ in exporters.export('purchases', 'csv', since=timezone.now() - timedelta(days=30)):
+        pass
+
+
+@benchmark('reporting.stock_as_of')
+def stock_as_of(context):
+    """Balances of 50 materials at a random moment of the last year."""
+    at = timezone.now() - timedelta(seconds=context.rng.randint(0, 365 * 86400))
+    snapshots.as_of(at, context.pick(context.material_ids, 50))
+
+
+@benchmark('reporting.plan')
+def plan(context):
+    planning.plan()
+
+
+def _call(func, context, writes):
+    if not writes:
+        func(context)
+        return
+    with transaction.atomic():
+        func(context)
+        transaction.set_rollback(True)
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)]
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(names=None, repeat=20, warmup=2, seed=0):
+    """Run the benchmarks ``names`` (default all); returns the results as a JSON-ready dict."""
+    context = Context(seed)
+    results = {}
+    for name in names or list(BENCHMARKS):
+        func, writes = BENCHMARKS[name]
+        for _ in range(warmup):
+            _call(func, context, writes)
+        timings, queries = [], []
+        for _ in range(repeat):
+            with instrumentation.record() as recording:
+                _call(func, context, writes)
+            timings.append(recording.elapsed * 1000)
+            queries.append(recording.count)
+        results[name] = {
+            'runs': repeat,
+            'ms': {
+                'min': min(timings),
+                'p50': statistics.median(timings),
+                'p95': _percentile(timings, 0.95),
+                'max': max(timings),
+                'mean': statistics.fmean(timings),
+            },
+            'queries': statistics.median(queries),
+        }
+    return {
+        'meta': {
+            'commit': _commit(),
+            'vendor': connection.vendor,
+            'seed': seed,
+            'repeat': repeat,
+            'warmup': warmup,
+            'started_at': timezone.now().isoformat(),
+            'rows': {
+                model.__name__: model.objects.count()
+                for model in (Order, OrderProduct, MaterialConsumption, StockMovement, Purchase, Material, Product)
+            },
+        },
+        'results': results,
+    }
+
+
+def compare(old, new):
+    """``[(name, old p50 ms, new p50 ms, new / old)]`` for benchmarks present in both runs."""
+    rows = []
+    for name, result in new['results'].items():
+        before = old['results'].get(name)
+        if before is None:
+            continue
+        a, b = before['ms']['p50'], result['ms']['p50']
+        rows.append((name, a, b, b / a if a else float('inf')))
+    return rows
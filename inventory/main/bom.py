@@ -0,0 +1,182 @@
+"""Cached flattened bills of materials.
+
+``get_boms`` answers "which materials, how much per unit and in what unit"
+for many products with, in the common case, one round trip to the shared
+cache and no database query. Each product's BOM is kept in two tiers:
+
+* a bounded in-process LRU holding ready-to-use tuples of ``BomLine``;
+* the shared Django cache (``settings.BOM_CACHE['ALIAS']``) holding the
+  same lines packed into bytes.
+
+Both tiers are keyed by a per-product version token stored in the shared
+cache. ``invalidate`` (wired to model signals in ``main.signals``) replaces
+the token, so every process sees the change on its next lookup.
+"""
+import struct
+import threading
+import uuid
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+
+from main import units
+from main.constants import QTY_UNIT_CHOICES
+from main.models import ProductMaterial
+
+BomLine = namedtuple('BomLine', ['material_id', 'quantity', 'qty_unit'])
+
+_UNITS = [unit for unit, _ in QTY_UNIT_CHOICES]
+# Material id, quantity in millionths (``main.units.SCALE``) and unit.
+_ROW = struct.Struct('<16sqB')
+
+_lock = threading.Lock()
+_local = OrderedDict()
+_stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0, 'invalidations': 0}
+
+
+def _config():
+    config = {'ALIAS': 'default', 'LOCAL_MAX_ENTRIES': 10000, 'TIMEOUT': 24 * 60 * 60}
+    config.update(getattr(settings, 'BOM_CACHE', {}))
+    return config
+
+
+def _cache():
+    return caches[_config()['ALIAS']]
+
+
+def _version_key(product_id):
+    return f'bom:ver:{product_id}'
+
+
+def _data_key(product_id, version):
+    # ``q6``: rows hold millionths; blobs packed in whole units are never read back.
+    return f'bom:q6:{product_id}:{version}'
+
+
+def pack(lines):
+    return b''.join(
+        _ROW.pack(line.material_id.bytes, units.to_scaled(line.quantity), _UNITS.index(line.qty_unit)) for line in lines
+    )
+
+
+def unpack(data):
+    return tuple(
+        BomLine(uuid.UUID(bytes=material_id), units.to_decimal(quantity), _UNITS[unit])
+        for material_id, quantity, unit in _ROW.iter_unpack(data)
+    )
+
+
+def _count(name, n=1):
+    if n:
+        with _lock:
+            _stats[name] += n
+
+
+def stats():
+    """Return a snapshot of the hit/miss counters."""
+    with _lock:
+        return dict(_stats, local_entries=len(_local))
+
+
+def reset_stats():
+    with _lock:
+        for name in _stats:
+            _stats[name] = 0
+
+
+def clear_local():
+    with _lock:
+        _local.clear()
+
+
+def load(product_ids):
+    """Flatten the live BOM of ``product_ids`` straight from the database."""
+    flattened = {product_id: OrderedDict() for product_id in product_ids}
+    rows = ProductMaterial.objects.filter(
+        product_id__in=product_ids, is_archived=False,
+    ).values_list('product_id', 'material_id', 'quantity', 'material__qty_unit').order_by('product_id', 'material_id')
+    for product_id, material_id, quantity, qty_unit in rows:
+        lines = flattened[product_id]
+        if material_id in lines:
+            quantity += lines[material_id].quantity
+        lines[material_id] = BomLine(material_id, quantity, qty_unit)
+    return {product_id: tuple(lines.values()) for product_id, lines in flattened.items()}
+
+
+def get_bom(product_id):
+    return get_boms([product_id])[product_id]
+
+
+def get_boms(product_ids):
+    """Return ``{product_id: (BomLine, ...)}`` for ``product_ids``."""
+    product_ids = list(dict.fromkeys(product_ids))
+    if not product_ids:
+        return {}
+    config = _config()
+    cache = _cache()
+    versions = cache.get_many([_version_key(p) for p in product_ids])
+    result = {}
+    wanted = {}
+    with _lock:
+        for product_id in product_ids:
+            version = versions.get(_version_key(product_id))
+            entry = _local.get(product_id)
+            if version is not None and entry is not None and entry[0] == version:
+                _local.move_to_end(product_id)
+                result[product_id] = entry[1]
+            elif version is not None:
+                wanted[_data_key(product_id, version)] = (product_id, version)
+    _count('local_hits', len(result))
+
+    shared = cache.get_many(list(wanted)) if wanted else {}
+    fresh = {}
+    for key, data in shared.items():
+        product_id, version = wanted[key]
+        fresh[product_id] = (version, unpack(data))
+    _count('shared_hits', len(fresh))
+
+    missing = [p for p in product_ids if p not in result and p not in fresh]
+    _count('misses', len(missing))
+    if missing:
+        loaded = load(missing)
+        to_store = {}
+        for product_id in missing:
+            version = versions.get(_version_key(product_id))
+            if version is None:
+                version = uuid.uuid4().hex
+                if not cache.add(_version_key(product_id), version, timeout=None):
+                    # Invalidated since we looked: the BOM we read may
+                    # already be stale, so serve it without caching it.
+                    result[product_id] = loaded[product_id]
+                    continue
+            fresh[product_id] = (version, loaded[product_id])
+            to_store[_data_key(product_id, version)] = pack(loaded[product_id])
+        cache.set_many(to_store, timeout=config['TIMEOUT'])
+
+    with _lock:
+        for product_id, entry in fresh.items():
+            _local[product_id] = entry
+            _local.move_to_end(product_id)
+            result[product_id] = entry[1]
+        while len(_local) > config['LOCAL_MAX_ENTRIES']:
+            _local.popitem(last=False)
+    return result
+
+
+def invalidate(product_ids):
+    """Drop the cached BOM of ``product_ids`` in every process."""
+    product_ids = list(product_ids)
+    if not product_ids:
+        return
+    _cache().set_many({_version_key(p): uuid.uuid4().hex for p in product_ids}, timeout=None)
+    with _lock:
+        for product_id in product_ids:
+            _local.pop(product_id, None)
+    _count('invalidations', len(product_ids))
+
+
+def invalidate_material(material_id):
+    invalidate(set(
+        ProductMaterial.objects.filter(material_id=material_id).values_list('product_id', flat=True)
+    ))
@@ -18,4 +18,25 @@ ORDER_STATUS_CHOICES = [
     ('approved', 'approved'), 
     ('in progress', 'in progress'), 
     ('completed', 'completed'), 
-]
\ No newline at end of file
+]
+
+MOVEMENT_TYPE_CHOICES = [
+    ('receipt', 'receipt'),
+    ('reserve', 'reserve'),
+    ('allocate', 'allocate'),
+    ('release', 'release'),
+    ('adjustment', 'adjustment'),
+]
+
+JOB_STATUS_CHOICES = [
+    ('queued', 'queued'),
+    ('running', 'running'),
+    ('done', 'done'),
+    ('failed', 'failed'),
+]
+
+OUTBOX_ACTION_CHOICES = [
+    ('created', 'created'),
+    ('updated', 'updated'),
+    ('archived', 'archived'),
+]
@@ -0,0 +1,208 @@
+"""Streaming exports of stock, consumption and purchase history.
+
+Each dataset is a ``values()`` queryset whose material, supplier and product
+names are joined in SQL, read with ``iterator(chunk_size=...)`` so Postgres
+serves it through a server-side cursor. Writers turn one chunk of rows at a
+time into bytes; nothing holds more than a chunk in memory, which lets the
+same generators back the ``export_inventory`` command and a
+``StreamingHttpResponse``.
+"""
+import csv
+import importlib.util
+import io
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from uuid import UUID
+
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from main.archive import ARCHIVES
+from main.models import MaterialConsumption, Purchase, Stock
+
+
+def stock_rows():
+    return Stock.objects.values(
+        'id', 'quantity', 'created_at', 'updated_at', 'is_archived', 'material_id',
+        material_name=F('material__name'),
+        qty_unit=F('material__qty_unit'),
+        supplier_name=F('material__supplier__name'),
+    )
+
+
+def consumption_rows(model=MaterialConsumption):
+    return model.objects.values(
+        'id', 'quantity', 'is_allocated', 'created_at', 'updated_at', 'is_archived', 'material_id',
+        order_id=F('order_product__order_id'),
+        product_name=F('order_product__product__name'),
+        material_name=F('material__name'),
+        qty_unit=F('material__qty_unit'),
+        supplier_name=F('material__supplier__name'),
+    )
+
+
+def purchase_rows(model=Purchase):
+    return model.objects.values(
+        'id', 'quantity', 'qty_unit', 'requested_at', 'arrived_at', 'created_at', 'updated_at', 'is_archived',
+        'material_id', 'supplier_id',
+        material_name=F('material__name'),
+        supplier_name=F('supplier__name'),
+        requested_by=F('requested_user__username'),
+    )
+
+
+DATASETS = {
+    'stock': stock_rows,
+    'consumption': consumption_rows,
+    'purchases': purchase_rows,
+}
+
+HISTORY = {
+    'consumption': ARCHIVES[MaterialConsumption],
+    'purchases': ARCHIVES[Purchase],
+}
+
+
+def dataset(name, include_archived=False, since=None, until=None):
+    def narrow(queryset):
+        if not include_archived:
+            queryset = queryset.filter(is_archived=False)
+        if since is not None:
+            queryset = queryset.filter(created_at__gte=since)
+        if until is not None:
+            queryset = queryset.filter(created_at__lt=until)
+        return queryset
+
+    queryset = narrow(DATASETS[name]())
+    if include_archived and name in HISTORY:
+        # Archived rows main.archive has moved to the cold table.
+        queryset = queryset.union(narrow(DATASETS[name](HISTORY[name])), all=True)
+    return queryset.order_by('created_at', 'id')
+
+
+def parse_timestamp(value):
+    """Parse an ISO timestamp, assuming the current time zone if it has none; ``None`` if it isn't one."""
+    try:
+        parsed = parse_datetime(value)
+    except ValueError:
+        # Well formed but not a real date or time, e.g. 2024-02-30T00:00.
+        return None
+    if parsed is not None and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def _plain(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (UUID, Decimal)):
+        return str(value)
+    return value
+
+
+def chunks(queryset, chunk_size):
+    chunk = []
+    for row in queryset.iterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def write_csv(queryset, chunk_size):
+    columns = None
+    for chunk in chunks(queryset, chunk_size):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if columns is None:
+            columns = list(chunk[0])
+            writer.writerow(columns)
+        writer.writerows([_plain(row[c]) for c in columns] for row in chunk)
+        yield buffer.getvalue().encode()
+
+
+def write_jsonl(queryset, chunk_size):
+    for chunk in chunks(queryset, chunk_size):
+        yield ''.join(json.dumps({k: _plain(v) for k, v in row.items()}) + '\n' for row in chunk).encode()
+
+
+def write_columnar(queryset, chunk_size):
+    """One JSON object per chunk holding a list per column (a row group)."""
+    for chunk in chunks(queryset, chunk_size):
+        columns = {column: [_plain(row[column]) for row in chunk] for column in chunk[0]}
+        yield (json.dumps(columns) + '\n').encode()
+
+
+class _Sink(io.RawIOBase):
+    """Write-only file object that hands back whatever was written since the last drain."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer.extend(data)
+        return len(data)
+
+    def drain(self):
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+def write_parquet(queryset, chunk_size):
+    """Parquet with one row group per chunk; needs the optional ``pyarrow``."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError('Parquet export needs pyarrow; install it or use the "columnar" format.')
+    sink = _Sink()
+    writer = schema = None
+    for chunk in chunks(queryset, chunk_size):
+        columns = {column: [_plain(row[column]) for row in chunk] for column in chunk[0]}
+        if schema is None:
+            # A column that is all NULL in the first chunk is typed as string
+            # so later chunks with values still match the file schema.
+            schema = pa.schema([
+                (column, pa.string() if all(v is None for v in values) else pa.array(values).type)
+                for column, values in columns.items()
+            ])
+            writer = pq.ParquetWriter(sink, schema)
+        writer.write_table(pa.table(columns, schema=schema))
+        yield sink.drain()
+    if writer is not None:
+        writer.close()
+        yield sink.drain()
+
+
+FORMATS = {
+    'csv': (write_csv, 'text/csv'),
+    'jsonl': (write_jsonl, 'application/x-ndjson'),
+    'columnar': (write_columnar, 'application/x-ndjson'),
+    'parquet': (write_parquet, 'application/vnd.apache.parquet'),
+}
+
+
+# Optional modules a format needs; not in requirements.txt.
+REQUIRES = {'parquet': 'pyarrow'}
+
+
+def unavailable(fmt):
+    """Why ``fmt`` can't be written here, or ``None``; check before streaming starts."""
+    module = REQUIRES.get(fmt)
+    if module and importlib.util.find_spec(module) is None:
+        return f'The {fmt} format needs {module}; install it or use another format.'
+    return None
+
+
+def export(name, fmt, chunk_size=2000, **filters):
+    """Yield the encoded export of dataset ``name`` in format ``fmt``."""
+    write, _ = FORMATS[fmt]
+    return write(dataset(name, **filters), chunk_size)
@@ -0,0 +1,107 @@
+"""Reading and compacting the outbox written by ``main.outbox``.
+
+Consumers keep the sequence number (``OutboxEvent.seq``) of the last event
+they handled and ``pull`` the events after it, in order, from the unique
+index on ``seq`` - never a scan.
+
+Insertion ids can't be the sequence: they are handed out when an event is
+inserted, not when its transaction commits, so on Postgres a later id can
+become visible before an earlier one, and a consumer whose cursor moved
+past the gap would never see the earlier event. Instead ``sequence``
+numbers the committed events that have no ``seq`` yet, in id order, under
+a lock, so each number is given after every smaller one and a cursor can
+never skip one. ``pull`` sequences before reading; un-numbered events are
+found through a partial index, so that costs one index probe when there
+are none.
+
+``compact`` keeps the outbox small: events older than a cutoff that a
+later event of the same row supersedes are deleted in batches, so a
+consumer starting from an old cursor still sees the latest state of every
+row. The ``outbox.compact`` job does that and schedules its next run.
+"""
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Exists, Max, OuterRef
+from django.utils import timezone
+
+from main import jobs
+from main.models import OutboxEvent
+
+KEEP = timedelta(days=7)
+COMPACT_EVERY = timedelta(hours=1)
+# Arbitrary key of the Postgres advisory lock that serialises ``sequence``.
+SEQUENCE_LOCK = 0x6f7574626f78
+
+
+def as_dict(event):
+    return {
+        'seq': event.seq, 'kind': event.kind, 'id': event.object_id, 'action': event.action,
+        'at': event.created_at, 'data': event.payload,
+    }
+
+
+def sequence(batch_size=10000):
+    """Number committed events that have no ``seq`` yet; returns the last number given."""
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_xact_lock(%s)', [SEQUENCE_LOCK])
+        last = OutboxEvent.objects.aggregate(last=Max('seq'))['last'] or 0
+        while True:
+            pending = list(OutboxEvent.objects.filter(seq__isnull=True).order_by('id').only('id')[:batch_size])
+            for event in pending:
+                last += 1
+                event.seq = last
+            if pending:
+                OutboxEvent.objects.bulk_update(pending, ['seq'], batch_size=1000)
+            if len(pending) < batch_size:
+                return last
+
+
+def pull(after=0, limit=1000, kinds=None):
+    """Up to ``limit`` events after sequence number ``after``; returns ``(events, cursor)``.
+
+    ``cursor`` is where the next pull starts. With ``kinds``, events of
+    other kinds are skipped, but the cursor still moves past them.
+    """
+    if limit < 1:
+        raise ValueError(f'limit must be at least 1, got {limit}.')
+    last = sequence()
+    events = OutboxEvent.objects.filter(seq__gt=after, seq__lte=last).order_by('seq')
+    if kinds:
+        events = events.filter(kind__in=kinds)
+    page = list(events[:limit])
+    if len(page) == limit:
+        return page, page[-1].seq
+    return page, max(after, last)
+
+
+def compact(before=None, batch_size=1000):
+    """Delete events older than ``before`` (default ``KEEP`` ago) superseded by a later one; returns how many."""
+    if before is None:
+        before = timezone.now() - KEEP
+    superseded = OutboxEvent.objects.filter(created_at__lt=before, seq__isnull=False).filter(Exists(
+        OutboxEvent.objects.filter(
+            kind=OuterRef('kind'), object_id=OuterRef('object_id'), id__gt=OuterRef('id'), seq__isnull=False,
+        )
+    ))
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            ids = list(superseded.order_by('id').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                return deleted
+            deleted += OutboxEvent.objects.filter(id__in=ids).delete()[0]
+
+
+def schedule(at=None):
+    """Queue the ``outbox.compact`` job due at ``at`` (default now); a no-op if that run is queued already."""
+    at = at or timezone.now()
+    return jobs.enqueue('outbox.compact', key=f'outbox.compact:{at:%Y%m%d%H%M}', run_after=at)
+
+
+@jobs.handler('outbox.compact')
+def compact_job(batch):
+    compact()
+    schedule(timezone.now() + COMPACT_EVERY)
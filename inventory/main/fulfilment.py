@@ -0,0 +1,98 @@
+"""Set-wise order fulfilment.
+
+``fulfil_orders`` turns the ``OrderProduct`` lines of many pending orders
+into ``MaterialConsumption`` rows at once. The bills of materials of every
+product involved come from ``main.bom`` in one lookup, demand is summed in
+memory, the affected ``StockBalance`` rows are locked in material order and
+all consumptions are written with ``bulk_create``, so the number of queries
+does not grow with the number of orders.
+"""
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+from django.db import transaction
+
+from main import bom as boms, ledger, summary
+from main.models import MaterialConsumption, Order, OrderProduct
+
+
+@dataclass
+class FulfilmentResult:
+    fulfilled: list = field(default_factory=list)
+    short: dict = field(default_factory=dict)
+    consumptions: list = field(default_factory=list)
+
+
+def explode(lines, bom):
+    """Return ``{order_id: {material_id: quantity}}`` for the given lines.
+
+    ``lines`` are ``(order_product_id, order_id, product_id, quantity)``
+    tuples and ``bom`` maps a product id to its ``BomLine``s.
+    """
+    demand = defaultdict(lambda: defaultdict(int))
+    for _, order_id, product_id, quantity in lines:
+        for line in bom.get(product_id, ()):
+            demand[order_id][line.material_id] += line.quantity * quantity
+    return demand
+
+
+def fulfil_orders(order_ids, user, allocate=False, batch_size=None):
+    """Reserve (or allocate) materials for many pending orders in one pass.
+
+    Orders are served oldest ``requested_at`` first; an order is only
+    fulfilled when every material it needs is available, otherwise it is
+    reported in ``result.short`` with the missing quantity per material and
+    left pending. Fulfilled orders move to ``approved``.
+    """
+    result = FulfilmentResult()
+    with transaction.atomic():
+        orders = list(
+            Order.objects.select_for_update()
+            .filter(pk__in=order_ids, order_status='pending', is_archived=False)
+            .order_by('requested_at', 'pk')
+            .values_list('pk', flat=True)
+        )
+        if not orders:
+            return result
+        lines = list(
+            OrderProduct.objects.filter(order_id__in=orders, is_archived=False)
+            .values_list('pk', 'order_id', 'product_id', 'quantity')
+        )
+        bom = boms.get_boms({product_id for _, _, product_id, _ in lines})
+        demand = explode(lines, bom)
+
+        material_ids = {m for needs in demand.values() for m in needs}
+        balances = ledger.lock_balances(material_ids)
+        available = {m: balances[m].available for m in material_ids}
+
+        for order_id in orders:
+            needs = demand.get(order_id, {})
+            missing = {m: q - available[m] for m, q in needs.items() if q > available[m]}
+            if missing:
+                result.short[order_id] = missing
+                continue
+            for material_id, quantity in needs.items():
+                available[material_id] -= quantity
+            result.fulfilled.append(order_id)
+
+        fulfilled = set(result.fulfilled)
+        consumptions = [
+            MaterialConsumption(
+                order_product_id=order_product_id,
+                material_id=line.material_id,
+                quantity=line.quantity * quantity,
+                is_allocated=allocate,
+                comment='',
+                created_by=user,
+                updated_by=user,
+            )
+            for order_product_id, order_id, product_id, quantity in lines
+            if order_id in fulfilled
+            for line in bom.get(product_id, ())
+        ]
+        MaterialConsumption.objects.bulk_create(consumptions, batch_size=batch_size)
+        ledger.record_consumptions(consumptions)
+        if fulfilled:
+            summary.set_status(fulfilled, 'approved', user)
+        result.consumptions = consumptions
+    return result
@@ -0,0 +1,59 @@
+"""Primary-key generators for ``BaseModel.id``.
+
+Random ``uuid4`` keys land all over the primary-key B-tree, so as tables
+grow every insert dirties a random leaf page and pages keep splitting.
+``uuid7`` keys (RFC 9562) start with a millisecond timestamp, so new rows
+are appended to the right-hand edge of the index like a sequence while
+still being globally unique and unguessable enough for URLs.
+
+Both kinds live happily in the same ``uuid`` column, so switching is just a
+matter of ``settings.TIME_ORDERED_IDS``. It is off by default: a ``uuid7``
+gives away when its row was created to anyone who sees the id.
+"""
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from django.conf import settings
+
+_lock = threading.Lock()
+_last_ms = 0
+_seq = 0
+
+
+def uuid7():
+    """Return a time-ordered UUID, monotonic within this process.
+
+    The 12 ``rand_a`` bits carry a counter that starts at a random value
+    every millisecond; if it overflows the timestamp is nudged forward, so
+    ids generated by one process always sort in creation order.
+    """
+    global _last_ms, _seq
+    ms = time.time_ns() // 1_000_000
+    with _lock:
+        if ms > _last_ms:
+            _last_ms = ms
+            _seq = int.from_bytes(os.urandom(2), 'big') & 0x7FF
+        else:
+            _seq += 1
+            if _seq > 0xFFF:
+                _last_ms += 1
+                _seq = 0
+            ms = _last_ms
+        seq = _seq
+    rand_b = int.from_bytes(os.urandom(8), 'big') & ((1 << 62) - 1)
+    return uuid.UUID(int=(ms << 80) | (0x7 << 76) | (seq << 64) | (0b10 << 62) | rand_b)
+
+
+def uuid7_datetime(value):
+    """Creation time encoded in a ``uuid7``."""
+    return datetime.fromtimestamp((value.int >> 80) / 1000, tz=timezone.utc)
+
+
+def new_id():
+    """Default for ``BaseModel.id``: ``uuid4``, or ``uuid7`` with ``TIME_ORDERED_IDS``."""
+    if getattr(settings, 'TIME_ORDERED_IDS', False):
+        return uuid7()
+    return uuid.uuid4()
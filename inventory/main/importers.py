@@ -0,0 +1,366 @@
+"""Streaming bulk import of suppliers, materials and purchases.
+
+An import is a chain of generators, so only one chunk of rows is ever in
+memory whatever the size of the file:
+
+    read_rows -> skip -> validate -> chunked -> Importer.write
+
+``validate`` cleans each row with the model's own field validators
+(``qty_unit`` against ``QTY_UNIT_CHOICES`` and so on) and resolves foreign
+keys from in-memory lookup tables loaded once per run. ``Importer`` writes
+chunks with ``bulk_create`` (or ``COPY`` on Postgres), commits every
+``transaction_size`` rows and records a checkpoint after each commit so an
+interrupted import can resume where it stopped.
+"""
+import csv
+import io
+import json
+import os
+import time
+import uuid
+from decimal import Decimal
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from main import ledger, outbox, search, units
+from main.models import Material, Purchase, Supplier, User
+
+
+class ImportFailed(Exception):
+    pass
+
+
+class RowError(Exception):
+
+    def __init__(self, line, errors):
+        self.line = line
+        self.errors = errors
+        super().__init__(f'line {line}: {errors}')
+
+
+def read_rows(path, fmt=None):
+    """Yield ``(line_number, dict)`` from a CSV or JSONL file, one at a time.
+
+    A JSONL line that isn't a JSON object comes through as a ``RowError``
+    instead of a dict, for ``validate`` to report, so it is skipped (and
+    counted by a checkpoint) like any other invalid row.
+    """
+    fmt = fmt or os.path.splitext(path)[1].lstrip('.').lower()
+    with open(path, newline='', encoding='utf-8') as f:
+        if fmt == 'csv':
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+        elif fmt in ('jsonl', 'ndjson'):
+            for line_number, line in enumerate(f, 1):
+                if line.strip():
+                    yield line_number, _json_row(line_number, line)
+        else:
+            raise ImportFailed(f'Unsupported format {fmt!r}; expected csv or jsonl.')
+
+
+def _json_row(line_number, line):
+    try:
+        row = json.loads(line)
+    except ValueError as e:
+        return RowError(line_number, {'line': f'Invalid JSON: {e}'})
+    if not isinstance(row, dict):
+        return RowError(line_number, {'line': 'Expected a JSON object.'})
+    return row
+
+
+def skip(rows, count):
+    for i, row in enumerate(rows):
+        if i >= count:
+            yield row
+
+
+def chunked(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _lookup(queryset, *key_fields):
+    """``{key: id}`` for ``queryset``; ambiguous keys map to ``None``."""
+    table = {}
+    for row in queryset.filter(is_archived=False).values_list('pk', *key_fields).iterator(chunk_size=10000):
+        key = row[1] if len(key_fields) == 1 else row[1:]
+        table[key] = None if key in table else row[0]
+    return table
+
+
+def _ids(queryset, field='pk'):
+    """``{id: field}`` of the live rows of ``queryset``, to check ids given in a file."""
+    return dict(queryset.filter(is_archived=False).values_list('pk', field).iterator(chunk_size=10000))
+
+
+class Spec:
+    """How rows of one kind map onto a model."""
+    model = None
+    columns = ()
+
+    def __init__(self, user):
+        self.user = user
+
+    def load_lookups(self):
+        pass
+
+    def resolve(self, row, values, errors):
+        pass
+
+    def before_write(self, objs):
+        pass
+
+    def after_write(self, objs):
+        pass
+
+
+def _resolve(table, key, label, errors, ids, scope=None):
+    """The id ``key`` stands for: itself if it is one of ``ids``, else the id ``table`` gives its name.
+
+    Names are looked up as ``(scope, key)`` when ``scope`` is given.
+    """
+    if not key:
+        errors[label] = 'This field is required.'
+        return None
+    try:
+        pk = uuid.UUID(str(key))
+    except ValueError:
+        pass
+    else:
+        if pk not in ids:
+            errors[label] = f'Unknown {label} {key!r}.'
+            return None
+        return pk
+    name = key if scope is None else (scope, key)
+    if name not in table:
+        errors[label] = f'Unknown {label} {key!r}.'
+    elif table[name] is None:
+        errors[label] = f'Ambiguous {label} {key!r}; use its id.'
+    return table.get(name)
+
+
+class SupplierSpec(Spec):
+    model = Supplier
+    columns = ('name', 'email', 'contact_no')
+
+    def after_write(self, objs):
+        search.index_objects(objs)
+
+
+class MaterialSpec(Spec):
+    model = Material
+    columns = ('name', 'price', 'tax', 'qty_unit')
+
+    def load_lookups(self):
+        self.suppliers = _lookup(Supplier.objects.all(), 'name')
+        self.supplier_ids = _ids(Supplier.objects.all())
+
+    def resolve(self, row, values, errors):
+        values['supplier_id'] = _resolve(self.suppliers, row.get('supplier'), 'supplier', errors, self.supplier_ids)
+
+    def after_write(self, objs):
+        search.index_objects(objs)
+
+
+class PurchaseSpec(Spec):
+    model = Purchase
+    columns = ('quantity', 'qty_unit', 'requested_at', 'arrived_at')
+
+    def load_lookups(self):
+        self.suppliers = _lookup(Supplier.objects.all(), 'name')
+        self.supplier_ids = _ids(Supplier.objects.all())
+        self.materials = _lookup(Material.objects.all(), 'supplier_id', 'name')
+        self.material_suppliers = _ids(Material.objects.all(), 'supplier_id')
+        self.users = dict(User.objects.values_list('username', 'pk'))
+        self.factors = units.factors()
+
+    def resolve(self, row, values, errors):
+        supplier_id = _resolve(self.suppliers, row.get('supplier'), 'supplier', errors, self.supplier_ids)
+        values['supplier_id'] = supplier_id
+        material = row.get('material')
+        material_id = _resolve(self.materials, material, 'material', errors, self.material_suppliers, scope=supplier_id)
+        if material_id and supplier_id and self.material_suppliers[material_id] != supplier_id:
+            errors['material'] = f'Material {material!r} is not supplied by this supplier.'
+        values['material_id'] = material_id
+        username = row.get('requested_user')
+        if username and username not in self.users:
+            errors['requested_user'] = f'Unknown user {username!r}.'
+        values['requested_user_id'] = self.users.get(username, self.user.pk)
+        qty_unit = values.get('qty_unit')
+        factor = self.factors.get((values['material_id'], qty_unit)) if qty_unit else Decimal(1)
+        if factor is None:
+            if values['material_id']:
+                errors['qty_unit'] = f'No conversion from {qty_unit} for this material.'
+        elif abs(values.get('quantity') or 0) * factor * units.SCALE > units.MAX_SCALED:
+            errors['quantity'] = "Too large to convert to the material's unit."
+
+    def before_write(self, objs):
+        units.stamp(objs, table=self.factors)
+
+    def after_write(self, objs):
+        ledger.post_movements(m for purchase in objs for m in ledger.purchase_movements(purchase))
+
+
+SPECS = {'suppliers': SupplierSpec, 'materials': MaterialSpec, 'purchases': PurchaseSpec}
+
+
+def validate(rows, spec, errors_out):
+    """Turn raw rows into unsaved model instances.
+
+    Invalid rows are reported through ``errors_out`` (a callable taking a
+    ``RowError``) and dropped.
+    """
+    opts = spec.model._meta
+    fields = [opts.get_field(column) for column in spec.columns]
+    for line, row in rows:
+        if isinstance(row, RowError):
+            errors_out(row)
+            continue
+        values, errors = {}, {}
+        for field in fields:
+            raw = row.get(field.name)
+            if raw in ('', None):
+                if field.null:
+                    values[field.name] = None
+                    continue
+                if field.has_default():
+                    raw = field.get_default()
+            try:
+                value = field.clean(raw, None)
+            except ValidationError as e:
+                errors[field.name] = ' '.join(e.messages)
+                continue
+            if value is not None and field.get_internal_type() == 'DateTimeField' and timezone.is_naive(value):
+                value = timezone.make_aware(value)
+            values[field.name] = value
+        spec.resolve(row, values, errors)
+        if errors:
+            errors_out(RowError(line, errors))
+            continue
+        yield spec.model(created_by=spec.user, updated_by=spec.user, **values)
+
+
+class Importer:
+
+    def __init__(self, path, kind, user, fmt=None, chunk_size=1000, transaction_size=10000,
+                 checkpoint=None, use_copy=True, max_errors=None, progress=None, report_error=None):
+        if kind not in SPECS:
+            raise ImportFailed(f'Unknown kind {kind!r}; expected one of {", ".join(SPECS)}.')
+        self.path = path
+        self.kind = kind
+        self.fmt = fmt
+        self.spec = SPECS[kind](user)
+        self.chunk_size = chunk_size
+        self.transaction_size = transaction_size
+        self.checkpoint = checkpoint
+        self.use_copy = use_copy and connection.vendor == 'postgresql'
+        self.max_errors = max_errors
+        self.progress = progress or (lambda importer: None)
+        self.report_error = report_error or (lambda error: None)
+        self.error_count = 0
+        self.imported = 0
+        self.consumed = 0
+        self.started = None
+
+    @property
+    def rate(self):
+        elapsed = time.perf_counter() - self.started if self.started else 0
+        return self.imported / elapsed if elapsed else 0.0
+
+    def load_checkpoint(self):
+        if not self.checkpoint or not os.path.exists(self.checkpoint):
+            return 0
+        with open(self.checkpoint) as f:
+            state = json.load(f)
+        if state.get('path') != os.path.abspath(self.path) or state.get('kind') != self.kind:
+            raise ImportFailed(f'Checkpoint {self.checkpoint} belongs to a different import.')
+        return state['rows']
+
+    def save_checkpoint(self, rows):
+        if not self.checkpoint:
+            return
+        tmp = f'{self.checkpoint}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'path': os.path.abspath(self.path), 'kind': self.kind, 'rows': rows}, f)
+        os.replace(tmp, self.checkpoint)
+
+    def on_error(self, error):
+        self.error_count += 1
+        self.report_error(error)
+        if self.max_errors is not None and self.error_count > self.max_errors:
+            raise ImportFailed(f'More than {self.max_errors} invalid rows; last: {error}')
+
+    def run(self):
+        self.started = time.perf_counter()
+        done = self.load_checkpoint()
+        self.consumed = done
+        self.spec.load_lookups()
+
+        def counted(rows):
+            for row in rows:
+                self.consumed += 1
+                yield row
+
+        rows = counted(skip(read_rows(self.path, self.fmt), done))
+        chunks = chunked(validate(rows, self.spec, self.on_error), self.chunk_size)
+        chunks_per_transaction = max(1, self.transaction_size // self.chunk_size)
+        while True:
+            written = 0
+            with transaction.atomic():
+                for chunk in islice(chunks, chunks_per_transaction):
+                    self.write(chunk)
+                    self.imported += len(chunk)
+                    written += 1
+            self.save_checkpoint(self.consumed)
+            self.progress(self)
+            if written < chunks_per_transaction:
+                break
+        if self.checkpoint and os.path.exists(self.checkpoint):
+            os.remove(self.checkpoint)
+        return self
+
+    def write(self, objs):
+        self.spec.before_write(objs)
+        if not (self.use_copy and self.copy(objs)):
+            self.spec.model.objects.bulk_create(objs)
+        elif outbox.tracked(self.spec.model):
+            outbox.record(objs, created=True)
+        self.spec.after_write(objs)
+
+    def copy(self, objs):
+        """Load ``objs`` with ``COPY ... FROM STDIN``; False if the driver can't."""
+        with connection.cursor() as cursor:
+            return self._copy(cursor.cursor, objs)
+
+    def _copy(self, raw, objs):
+        if not hasattr(raw, 'copy_expert') and not hasattr(raw, 'copy'):
+            return False
+        opts = self.spec.model._meta
+        fields = opts.concrete_fields
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for obj in objs:
+            row = []
+            for field in fields:
+                value = field.get_db_prep_save(field.pre_save(obj, True), connection)
+                row.append('\\N' if value is None else value)
+            writer.writerow(row)
+        columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+        sql = f"COPY {connection.ops.quote_name(opts.db_table)} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+        buffer.seek(0)
+        if hasattr(raw, 'copy_expert'):
+            raw.copy_expert(sql, buffer)
+        else:
+            with raw.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+        return True
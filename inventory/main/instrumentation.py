@@ -0,0 +1,221 @@
+"""Per-view SQL and latency instrumentation.
+
+``record()`` hooks every database connection with ``execute_wrapper`` and
+collects each query's SQL and duration into a ``Recording``.
+Queries are grouped by fingerprint (the SQL with ``IN (%s, %s, ...)``
+lists collapsed), so the same statement run once per row - the N+1
+pattern the ``created_by``/``updated_by`` foreign keys invite - shows up as
+a fingerprint with a count above one.
+
+``QueryInstrumentationMiddleware`` records every request, adds a
+``Server-Timing`` header and folds the numbers into process-local metrics
+per view name, served in the Prometheus text format by the ``metrics``
+view. ``settings.QUERY_BUDGETS`` maps view names to limits on queries,
+duplicate queries and DB milliseconds; a request over budget is logged,
+or raises ``QueryBudgetExceeded`` when ``settings.QUERY_BUDGET_ENFORCE``
+is on, which is how the test suite turns budgets into failures. Metrics
+are per process; scrape every worker.
+"""
+import logging
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+from main.middleware import ScopedMiddleware
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+_IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+
+
+def fingerprint(sql):
+    return _IN_LIST.sub('IN (...)', sql)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class Recording:
+
+    def __init__(self):
+        self.queries = []
+        self.started = time.perf_counter()
+        self.elapsed = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - started))
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def db_time(self):
+        return sum(duration for _, duration in self.queries)
+
+    @property
+    def duplicates(self):
+        """``{fingerprint: times run}`` for statements run more than once."""
+        counts = Counter(fingerprint(sql) for sql, _ in self.queries)
+        return {sql: n for sql, n in counts.items() if n > 1}
+
+    @property
+    def duplicate_count(self):
+        return sum(n - 1 for n in self.duplicates.values())
+
+    def over(self, budget):
+        """Human-readable list of the ways this recording exceeds ``budget``."""
+        problems = []
+        if 'queries' in budget and self.count > budget['queries']:
+            problems.append(f'{self.count} queries > {budget["queries"]}')
+        if 'duplicates' in budget and self.duplicate_count > budget['duplicates']:
+            problems.append(f'{self.duplicate_count} duplicate queries > {budget["duplicates"]}')
+        if 'db_ms' in budget and self.db_time * 1000 > budget['db_ms']:
+            problems.append(f'{self.db_time * 1000:.1f}ms in the database > {budget["db_ms"]}ms')
+        if problems:
+            problems += [f'  {n}x {sql}' for sql, n in self.duplicates.items()]
+        return problems
+
+
+@contextmanager
+def record():
+    """Record every query run on any connection of this thread."""
+    recording = Recording()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recording))
+        try:
+            yield recording
+        finally:
+            recording.elapsed = time.perf_counter() - recording.started
+
+
+def check_budget(view_name, recording):
+    budget = getattr(settings, 'QUERY_BUDGETS', {}).get(view_name)
+    if not budget:
+        return
+    problems = recording.over(budget)
+    if not problems:
+        return
+    message = f'{view_name} over its query budget: ' + '\n'.join(problems)
+    if getattr(settings, 'QUERY_BUDGET_ENFORCE', False):
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+class Metrics:
+    """Process-local counters and histograms keyed by view and method."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.requests = Counter()
+        self.queries = Counter()
+        self.duplicates = Counter()
+        self.db_seconds = defaultdict(float)
+        self.seconds = defaultdict(float)
+        self.duration_buckets = defaultdict(lambda: [0] * len(DURATION_BUCKETS))
+        self.query_buckets = defaultdict(lambda: [0] * len(QUERY_BUCKETS))
+
+    def observe(self, view, method, status, recording):
+        key = (view, method)
+        with self.lock:
+            self.requests[(view, method, str(status))] += 1
+            self.queries[key] += recording.count
+            self.duplicates[key] += recording.duplicate_count
+            self.db_seconds[key] += recording.db_time
+            self.seconds[key] += recording.elapsed
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if recording.elapsed <= bound:
+                    self.duration_buckets[key][i] += 1
+            for i, bound in enumerate(QUERY_BUCKETS):
+                if recording.count <= bound:
+                    self.query_buckets[key][i] += 1
+
+    def exposition(self):
+        """The metrics in the Prometheus text exposition format."""
+        lines = []
+
+        def labels(view, method, **extra):
+            pairs = {'view': view, 'method': method, **extra}
+            return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs.items()) + '}'
+
+        with self.lock:
+            lines += ['# HELP inventory_http_requests_total Requests served.',
+                      '# TYPE inventory_http_requests_total counter']
+            for (view, method, status), n in sorted(self.requests.items()):
+                lines.append(f'inventory_http_requests_total{labels(view, method, status=status)} {n}')
+            for name, values, help_text in (
+                ('inventory_db_queries_total', self.queries, 'SQL queries run.'),
+                ('inventory_db_duplicate_queries_total', self.duplicates,
+                 'Queries repeating an earlier fingerprint of the same request.'),
+                ('inventory_db_query_seconds_total', self.db_seconds, 'Time spent in the database.'),
+            ):
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+                for (view, method), value in sorted(values.items()):
+                    lines.append(f'{name}{labels(view, method)} {value}')
+            for name, buckets, bounds, sums, help_text in (
+                ('inventory_http_request_duration_seconds', self.duration_buckets, DURATION_BUCKETS, self.seconds,
+                 'Time to serve a request.'),
+                ('inventory_db_queries_per_request', self.query_buckets, QUERY_BUCKETS, self.queries,
+                 'SQL queries per request.'),
+            ):
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+                for (view, method), counts in sorted(buckets.items()):
+                    for bound, n in zip(bounds, counts):
+                        lines.append(f'{name}_bucket{labels(view, method, le=bound)} {n}')
+                    total = sum(n for (v, m, _), n in self.requests.items() if (v, m) == (view, method))
+                    lines.append(f'{name}_bucket{labels(view, method, le="+Inf")} {total}')
+                    lines.append(f'{name}_sum{labels(view, method)} {sums[(view, method)]}')
+                    lines.append(f'{name}_count{labels(view, method)} {total}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+metrics = Metrics()
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    return match.view_name or match.route
+
+
+class QueryInstrumentationMiddleware(ScopedMiddleware):
+    """Record every request.
+
+    Under ASGI, queries run by ``sync_to_async`` happen on other threads'
+    connections and are not seen, so async views report time only.
+    """
+
+    def scope(self, request):
+        return record()
+
+    def finish(self, request, response, recording):
+        name = view_name(request)
+        metrics.observe(name, request.method, response.status_code, recording)
+        response['Server-Timing'] = (
+            f'db;dur={recording.db_time * 1000:.1f};desc="{recording.count} queries", '
+            f'total;dur={recording.elapsed * 1000:.1f}'
+        )
+        check_budget(name, recording)
+        return response
@@ -0,0 +1,198 @@
+"""Database-backed background jobs.
+
+Work is queued as ``Job`` rows, usually inside the transaction of the
+request that caused it, so a job exists exactly when the change that needs
+it was committed. ``run_jobs`` workers claim queued jobs in batches with
+``SELECT ... FOR UPDATE SKIP LOCKED`` where the database supports it, so
+any number of workers share the queue without blocking each other or
+running a job twice; the claim itself is an ``UPDATE ... WHERE status =
+'queued'`` stamped with a per-claim token, which keeps it safe on
+databases without row locks too.
+
+Handlers are registered per ``kind`` with ``@handler`` and receive every
+claimed job of their kind at once, so a batch of a hundred order approvals
+costs one pass of the set-wise code instead of a hundred. A handler
+returns ``{job_id: message}`` for jobs it could not finish; those, and
+every job of a batch that raised, are retried with exponential backoff
+until ``max_attempts``, unless the message is a ``Permanent`` one, which
+fails the job at once. A batch that raised is retried one job per batch
+so a single bad job can't hold back the rest.
+
+An ``idempotency_key`` makes enqueueing the same work twice a no-op while
+the first job is queued, running or done; a failed job with that key is
+requeued instead.
+"""
+import os
+import random
+import socket
+import time
+import traceback
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from main.models import Job
+
+HANDLERS = {}
+
+
+class Permanent(str):
+    """A failure message for a job that retrying can't fix, e.g. one whose work no longer applies."""
+
+
+def handler(kind):
+    """Register ``func(jobs)`` as the handler of jobs of ``kind``."""
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+
+def enqueue(kind, payload=None, key=None, run_after=None, max_attempts=5):
+    return enqueue_many(kind, [(payload or {}, key)], run_after=run_after, max_attempts=max_attempts)[0]
+
+
+def enqueue_many(kind, items, run_after=None, max_attempts=5):
+    """Queue ``(payload, idempotency_key)`` pairs; returns the jobs now holding them."""
+    now = timezone.now()
+    jobs = [
+        Job(kind=kind, payload=payload, idempotency_key=key, run_after=run_after or now, max_attempts=max_attempts)
+        for payload, key in items
+    ]
+    keys = [job.idempotency_key for job in jobs if job.idempotency_key]
+    with transaction.atomic():
+        Job.objects.bulk_create(jobs, ignore_conflicts=True)
+        if not keys:
+            return jobs
+        Job.objects.filter(idempotency_key__in=keys, status='failed').update(
+            status='queued', attempts=0, run_after=run_after or now, last_error='', finished_at=None,
+        )
+        existing = {job.idempotency_key: job for job in Job.objects.filter(idempotency_key__in=keys)}
+    return [existing.get(job.idempotency_key, job) if job.idempotency_key else job for job in jobs]
+
+
+def claim(batch_size, kinds=None):
+    """Mark up to ``batch_size`` due jobs as running for this worker and return them."""
+    token = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+    now = timezone.now()
+    with transaction.atomic():
+        due = Job.objects.filter(status='queued', run_after__lte=now).order_by('run_after', 'id')
+        if kinds:
+            due = due.filter(kind__in=kinds)
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        ids = list(due.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return []
+        Job.objects.filter(pk__in=ids, status='queued').update(
+            status='running', locked_by=token, locked_at=now, attempts=F('attempts') + 1,
+        )
+    return list(Job.objects.filter(pk__in=ids, locked_by=token, status='running'))
+
+
+def backoff(attempts, base=2.0, cap=600.0):
+    return timedelta(seconds=min(cap, base * 2 ** (attempts - 1)) * random.uniform(0.5, 1.0))
+
+
+def _owned(jobs):
+    """The rows of ``jobs`` still locked by the claim that returned them.
+
+    A job whose worker looked stale was requeued by ``requeue_stale`` and
+    may since have been claimed again; it is no longer ours to finish.
+    """
+    pks = defaultdict(list)
+    for job in jobs:
+        pks[job.locked_by].append(job.pk)
+    owned = Q(pk__in=[])
+    for token, ids in pks.items():
+        owned |= Q(pk__in=ids, locked_by=token)
+    return Job.objects.filter(owned, status='running')
+
+
+def _finish(done, failures):
+    now = timezone.now()
+    if done:
+        _owned(done).update(status='done', finished_at=now, last_error='')
+    if not failures:
+        return
+    # Before the loop below clears ``locked_by``.
+    owned = _owned([job for job, _ in failures])
+    retried = []
+    for job, message in failures:
+        job.last_error = message
+        if job.attempts >= job.max_attempts or isinstance(message, Permanent):
+            job.status, job.finished_at = 'failed', now
+        else:
+            job.status, job.run_after = 'queued', now + backoff(job.attempts)
+        job.locked_by = job.locked_at = None
+        retried.append(job)
+    owned.bulk_update(retried, ['status', 'run_after', 'last_error', 'finished_at', 'locked_by', 'locked_at'])
+
+
+def _call(kind, jobs):
+    """Run one handler call; returns ``(done, [(job, message)])``."""
+    func = HANDLERS.get(kind)
+    if func is None:
+        return [], [(job, f'No handler for {kind!r}.') for job in jobs]
+    try:
+        with transaction.atomic():
+            failed = func(jobs) or {}
+    except Exception:
+        message = traceback.format_exc(limit=5)
+        return [], [(job, message) for job in jobs]
+    return (
+        [job for job in jobs if job.pk not in failed],
+        [(job, failed[job.pk]) for job in jobs if job.pk in failed],
+    )
+
+
+def run(jobs):
+    """Run claimed ``jobs`` grouped by kind; returns ``(done, failed)`` counts."""
+    by_kind = defaultdict(list)
+    for job in jobs:
+        by_kind[job.kind].append(job)
+    done_count = failed_count = 0
+    for kind, batch in by_kind.items():
+        done, failures = _call(kind, batch)
+        if failures and not done and len(batch) > 1 and kind in HANDLERS:
+            # The whole batch raised: run the jobs one by one to isolate the culprit.
+            done, failures = [], []
+            for job in batch:
+                d, f = _call(kind, [job])
+                done += d
+                failures += f
+        _finish(done, failures)
+        done_count += len(done)
+        failed_count += len(failures)
+    return done_count, failed_count
+
+
+def requeue_stale(after):
+    """Put jobs whose worker stopped responding ``after`` ago back in the queue."""
+    return Job.objects.filter(status='running', locked_at__lt=timezone.now() - after).update(
+        status='queued', locked_by=None, locked_at=None,
+    )
+
+
+def work(batch_size=100, poll_interval=1.0, stale_after=timedelta(minutes=10), kinds=None, burst=False, stop=None):
+    """Claim and run jobs until ``stop()`` is true (or the queue is empty with ``burst``)."""
+    stop = stop or (lambda: False)
+    processed = 0
+    last_sweep = 0.0
+    while not stop():
+        if time.monotonic() - last_sweep > stale_after.total_seconds() / 2:
+            requeue_stale(stale_after)
+            last_sweep = time.monotonic()
+        jobs = claim(batch_size, kinds)
+        if jobs:
+            run(jobs)
+            processed += len(jobs)
+        elif burst:
+            break
+        else:
+            time.sleep(poll_interval)
+    return processed
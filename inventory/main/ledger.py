@@ -0,0 +1,341 @@
+"""Append-only stock ledger and the running balances derived from it.
+
+Every change to how much of a material we hold is written as a
+``StockMovement`` and folded into the material's ``StockBalance`` row in
+the same transaction, so on-hand, reserved and available quantities are
+single-row lookups instead of aggregations over ``Stock`` history.
+
+Movement semantics:
+
+* ``receipt``    - a ``Purchase`` arrived: on hand goes up (and is adjusted
+  if the purchase is edited or archived afterwards).
+* ``reserve``    - a ``MaterialConsumption`` was recorded: reserved goes up.
+* ``allocate``   - the consumption was allocated: the reserved quantity
+  leaves the shelf, so on hand and reserved both go down.
+* ``release``    - an unallocated consumption was archived: reserved goes down.
+* ``adjustment`` - manual correction / opening balance of on hand, or the
+  change to an already posted purchase or consumption (edited quantity,
+  moved to another material).
+
+A purchase or consumption owes the ledger the difference between what its
+current state should have posted and what its movements already add up to,
+per material, so edits, archiving and restoring in any order net out.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Sum, Value, When
+
+from main.models import MaterialConsumption, StockBalance, StockMovement
+
+
+def get_balance(material_id):
+    """Return the ``StockBalance`` for a material (an unsaved zero row if none)."""
+    balance = StockBalance.objects.filter(material_id=material_id).first()
+    if balance is None:
+        balance = StockBalance(material_id=material_id)
+    return balance
+
+
+def get_balances(material_ids):
+    """Return ``{material_id: StockBalance}`` for many materials in one query."""
+    material_ids = list(material_ids)
+    balances = {b.material_id: b for b in StockBalance.objects.filter(material_id__in=material_ids)}
+    for material_id in material_ids:
+        balances.setdefault(material_id, StockBalance(material_id=material_id))
+    return balances
+
+
+def on_hand(material_id):
+    return get_balance(material_id).on_hand
+
+
+def reserved(material_id):
+    return get_balance(material_id).reserved
+
+
+def available(material_id):
+    return get_balance(material_id).available
+
+
+def lock_balances(material_ids):
+    """Lock the balance rows of ``material_ids`` in primary-key order.
+
+    Missing rows are created first so they can be locked too. Always taking
+    the locks in the same order means two concurrent writers touching an
+    overlapping set of materials queue up instead of deadlocking. Must be
+    called inside ``transaction.atomic()``.
+    """
+    material_ids = sorted(set(material_ids))
+    StockBalance.objects.bulk_create(
+        [StockBalance(material_id=material_id) for material_id in material_ids],
+        ignore_conflicts=True,
+    )
+    return {
+        b.material_id: b
+        for b in StockBalance.objects.select_for_update().filter(material_id__in=material_ids).order_by('material_id')
+    }
+
+
+def apply_deltas(on_hand_deltas, reserved_deltas):
+    """Add per-material deltas to the balances with a single ``UPDATE``."""
+    material_ids = sorted(set(on_hand_deltas) | set(reserved_deltas))
+    if not material_ids:
+        return
+    StockBalance.objects.bulk_create(
+        [StockBalance(material_id=material_id) for material_id in material_ids],
+        ignore_conflicts=True,
+    )
+
+    def _case(deltas):
+        whens = [When(material_id=m, then=Value(d)) for m, d in deltas.items() if d]
+        if not whens:
+            return Value(0)
+        return Case(*whens, default=Value(0), output_field=DecimalField(max_digits=20, decimal_places=6))
+
+    StockBalance.objects.filter(material_id__in=material_ids).update(
+        on_hand=F('on_hand') + _case(on_hand_deltas),
+        reserved=F('reserved') + _case(reserved_deltas),
+        version=F('version') + 1,
+    )
+
+
+def post_movements(movements):
+    """Append ``movements`` to the ledger and fold them into the balances.
+
+    Both writes happen in one transaction; the number of queries does not
+    depend on how many movements or materials are posted.
+    """
+    movements = list(movements)
+    if not movements:
+        return movements
+    on_hand_deltas = defaultdict(int)
+    reserved_deltas = defaultdict(int)
+    for movement in movements:
+        on_hand_deltas[movement.material_id] += movement.on_hand_delta
+        reserved_deltas[movement.material_id] += movement.reserved_delta
+    with transaction.atomic():
+        StockMovement.objects.bulk_create(movements)
+        apply_deltas(on_hand_deltas, reserved_deltas)
+    return movements
+
+
+def _movement(material_id, movement_type, user_id, on_hand_delta=0, reserved_delta=0, **kwargs):
+    return StockMovement(
+        material_id=material_id,
+        movement_type=movement_type,
+        on_hand_delta=on_hand_delta,
+        reserved_delta=reserved_delta,
+        created_by_id=user_id,
+        updated_by_id=user_id,
+        **kwargs,
+    )
+
+
+def _received(purchase):
+    """What ``purchase`` adds to stock, in the material's own unit."""
+    return purchase.base_quantity
+
+
+def purchase_target(purchase):
+    """What ``purchase`` should have added to on hand.
+
+    Nothing until it arrives, once it's archived, or while its quantity
+    can't be converted to the material's unit (``main.units.restamp``
+    posts it once it can).
+    """
+    if purchase.arrived_at is None or purchase.is_archived or purchase.base_quantity is None:
+        return 0
+    return _received(purchase)
+
+
+def purchase_movements(purchase, posted=None):
+    """Movements still owed to the ledger by ``purchase``.
+
+    ``posted`` is ``(movement types, {material_id: on-hand total})`` already
+    recorded for it; a freshly created purchase has none. The first
+    movement is its ``receipt``; when its quantity is edited later, or it is
+    archived or restored, an ``adjustment`` posts the difference. Stock
+    posted on a material the purchase is no longer for moves to its current
+    material the same way.
+    """
+    types, totals = posted or ((), {})
+    user_id = purchase.updated_by_id
+    movements = [
+        _movement(material_id, 'adjustment', user_id, on_hand_delta=-total, purchase=purchase, comment='purchase moved')
+        for material_id, total in totals.items()
+        if material_id != purchase.material_id and total
+    ]
+    owed = purchase_target(purchase) - totals.get(purchase.material_id, 0)
+    if owed:
+        movement_type = 'receipt' if 'receipt' not in types and owed > 0 else 'adjustment'
+        movements.append(_movement(
+            purchase.material_id, movement_type, user_id,
+            on_hand_delta=owed, purchase=purchase, comment='' if movement_type == 'receipt' else 'purchase changed',
+        ))
+    return movements
+
+
+def purchase_postings(purchase_ids):
+    """``{purchase_id: (movement types, {material_id: on-hand total})}`` already posted for ``purchase_ids``."""
+    posted = defaultdict(lambda: (set(), defaultdict(int)))
+    rows = (
+        StockMovement.objects.filter(purchase_id__in=list(purchase_ids))
+        .values('purchase_id', 'material_id', 'movement_type').annotate(total=Sum('on_hand_delta')).order_by()
+    )
+    for row in rows:
+        types, totals = posted[row['purchase_id']]
+        types.add(row['movement_type'])
+        totals[row['material_id']] += row['total'] or 0
+    return dict(posted)
+
+
+def consumption_target(consumption):
+    """What ``consumption`` should have added to ``(on hand, reserved)``.
+
+    Its quantity is reserved while it is live, leaves on hand once it is
+    allocated (archived or not), and adds nothing once it is archived
+    unallocated.
+    """
+    if consumption.is_allocated:
+        return -consumption.quantity, 0
+    if consumption.is_archived:
+        return 0, 0
+    return 0, consumption.quantity
+
+
+def consumption_movements(consumption, posted=None):
+    """Movements still owed to the ledger by ``consumption``.
+
+    ``posted`` is ``(movement types, {material_id: (on-hand total, reserved
+    total)})`` already recorded for it; a freshly created consumption has
+    none, so callers that just inserted the rows can skip looking them up.
+    The first reservation, allocation and release post ``reserve``,
+    ``allocate`` and ``release``; edits to the quantity or material,
+    restoring and archiving again post the difference as an ``adjustment``.
+    """
+    types, totals = posted or ((), {})
+    user_id = consumption.updated_by_id
+    material_id = consumption.material_id
+    movements = []
+
+    def post(material_id, movement_type, on_hand_delta=0, reserved_delta=0):
+        if not (on_hand_delta or reserved_delta):
+            return
+        if movement_type in types:
+            movement_type = 'adjustment'
+        movements.append(_movement(
+            material_id, movement_type, user_id, on_hand_delta=on_hand_delta, reserved_delta=reserved_delta,
+            material_consumption=consumption, comment='consumption changed' if movement_type == 'adjustment' else '',
+        ))
+
+    for other, (on_hand, reserved) in totals.items():
+        if other != material_id:
+            post(other, 'adjustment', -on_hand, -reserved)
+    on_hand, reserved = totals.get(material_id, (0, 0))
+    target_on_hand, target_reserved = consumption_target(consumption)
+    if consumption.is_allocated and not on_hand:
+        # Reserve whatever isn't yet, then take it all off the shelf.
+        quantity = consumption.quantity
+        post(material_id, 'reserve', reserved_delta=quantity - reserved)
+        post(material_id, 'allocate', -quantity, -quantity)
+    elif on_hand:
+        post(material_id, 'adjustment', target_on_hand - on_hand, target_reserved - reserved)
+    elif target_reserved > reserved:
+        post(material_id, 'reserve' if not reserved else 'adjustment', reserved_delta=target_reserved - reserved)
+    else:
+        post(material_id, 'release' if not target_reserved else 'adjustment', reserved_delta=target_reserved - reserved)
+    return movements
+
+
+def consumption_postings(consumption_ids):
+    """``{consumption_id: (movement types, {material_id: (on-hand total, reserved total)})}`` already posted."""
+    posted = defaultdict(lambda: (set(), {}))
+    rows = (
+        StockMovement.objects.filter(material_consumption_id__in=list(consumption_ids))
+        .values('material_consumption_id', 'material_id', 'movement_type')
+        .annotate(on_hand=Sum('on_hand_delta'), reserved=Sum('reserved_delta')).order_by()
+    )
+    for row in rows:
+        types, totals = posted[row['material_consumption_id']]
+        types.add(row['movement_type'])
+        on_hand, reserved = totals.get(row['material_id'], (0, 0))
+        totals[row['material_id']] = (on_hand + (row['on_hand'] or 0), reserved + (row['reserved'] or 0))
+    return dict(posted)
+
+
+def record_purchase(purchase):
+    return record_purchases([purchase])
+
+
+def record_purchases(purchases):
+    """Post what saved ``purchases`` still owe the ledger, in two queries however many there are.
+
+    Callers have just written the purchase rows, so their row locks keep a
+    concurrent save of the same purchase from posting the same difference.
+    """
+    purchases = list(purchases)
+    posted = purchase_postings(purchase.pk for purchase in purchases)
+    return post_movements(
+        movement for purchase in purchases for movement in purchase_movements(purchase, posted.get(purchase.pk))
+    )
+
+
+def record_consumption(consumption):
+    posted = consumption_postings([consumption.pk]).get(consumption.pk) if consumption.pk else None
+    return post_movements(consumption_movements(consumption, posted))
+
+
+def record_consumptions(consumptions):
+    """Post the ledger movements for many just-created consumptions at once."""
+    movements = []
+    for consumption in consumptions:
+        movements.extend(consumption_movements(consumption))
+    return post_movements(movements)
+
+
+def record_adjustment(material_id, quantity, user, comment=''):
+    return post_movements([_movement(
+        material_id, 'adjustment', user.pk, on_hand_delta=quantity, comment=comment,
+    )])
+
+
+def allocate(consumption_ids, user):
+    """Mark unallocated consumptions as allocated and post their movements."""
+    with transaction.atomic():
+        consumptions = list(
+            MaterialConsumption.objects.select_for_update()
+            .filter(pk__in=consumption_ids, is_allocated=False, is_archived=False)
+        )
+        if not consumptions:
+            return []
+        lock_balances(c.material_id for c in consumptions)
+        MaterialConsumption.objects.filter(pk__in=[c.pk for c in consumptions]).update(
+            is_allocated=True, updated_by=user,
+        )
+        posted = consumption_postings(c.pk for c in consumptions)
+        movements = []
+        for consumption in consumptions:
+            consumption.is_allocated = True
+            consumption.updated_by_id = user.pk
+            movements.extend(consumption_movements(consumption, posted.get(consumption.pk)))
+        return post_movements(movements)
+
+
+def replay(material_ids=None, after=None, until=None):
+    """Sum the ledger per material; returns ``{material_id: (on_hand, reserved)}``.
+
+    ``after`` and ``until`` bound the movements summed by ``created_at``
+    (exclusive and inclusive), for ``main.snapshots``.
+    """
+    movements = StockMovement.objects.all()
+    if material_ids is not None:
+        movements = movements.filter(material_id__in=material_ids)
+    if after is not None:
+        movements = movements.filter(created_at__gt=after)
+    if until is not None:
+        movements = movements.filter(created_at__lte=until)
+    rows = movements.values('material_id').annotate(
+        on_hand=Sum('on_hand_delta'), reserved=Sum('reserved_delta'),
+    ).order_by()
+    return {row['material_id']: (row['on_hand'] or 0, row['reserved'] or 0) for row in rows}
@@ -0,0 +1,49 @@
+import signal
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from main import archive, exporters
+from main.models import MaterialConsumption, Purchase
+
+MODELS = {'purchases': Purchase, 'consumption': MaterialConsumption}
+
+
+class Command(BaseCommand):
+    help = (
+        'Move archived purchases and consumption created before a cutoff into the cold archive tables, '
+        'one short transaction per batch.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--table', action='append', choices=list(MODELS), default=[],
+                            help='Table to move (repeatable); defaults to both.')
+        parser.add_argument('--older-than-days', type=int, default=90, help='Move rows created this long ago.')
+        parser.add_argument('--before', help='Move rows created before this ISO timestamp instead.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows moved per transaction.')
+        parser.add_argument('--pause', type=float, default=0.0, help='Seconds to sleep between batches.')
+        parser.add_argument('--limit', type=int, help='Stop after moving this many rows per table.')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the rows that would move.')
+
+    def handle(self, *args, table, older_than_days, before, batch_size, pause, limit, dry_run, **options):
+        if before:
+            cutoff = exporters.parse_timestamp(before)
+            if cutoff is None:
+                raise CommandError(f'--before is not an ISO timestamp: {before!r}')
+        else:
+            cutoff = timezone.now() - timedelta(days=older_than_days)
+
+        # Finish the current batch on SIGTERM/SIGINT; every batch is committed on its own.
+        stopping = []
+        signal.signal(signal.SIGTERM, lambda *args: stopping.append(True))
+        signal.signal(signal.SIGINT, lambda *args: stopping.append(True))
+
+        for name in table or list(MODELS):
+            model = MODELS[name]
+            if dry_run:
+                self.stdout.write(f'{name}: {archive.due(model, cutoff).count()} rows to move')
+                continue
+            moved = archive.move(model, cutoff, batch_size=batch_size, pause=pause, limit=limit,
+                                 stop=lambda: bool(stopping))
+            self.stdout.write(self.style.SUCCESS(f'{name}: {moved} rows moved to {archive.ARCHIVES[model]._meta.db_table}.'))
@@ -0,0 +1,136 @@
+import asyncio
+import random
+import statistics
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client
+
+from main import availability
+from main.models import Product, User
+
+SYNC_PATH = '/availability/'
+ASYNC_PATH = '/availability/async/'
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-test the availability check through WSGI and ASGI and compare latency. '
+        'Without --wsgi-url/--asgi-url both handlers are driven in-process.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--products', type=int, default=5, help='Products per request.')
+        parser.add_argument('--distinct', type=int, default=10, help='Distinct request bodies in the burst.')
+        parser.add_argument('--random-seed', type=int, default=0)
+        parser.add_argument('--user', help='Username to log in as for in-process runs.')
+        parser.add_argument('--host', default='localhost', help='Host header for in-process runs.')
+        parser.add_argument('--wsgi-url', help='Base URL of a WSGI server, e.g. gunicorn inventory.wsgi.')
+        parser.add_argument('--asgi-url', help='Base URL of an ASGI server, e.g. uvicorn inventory.asgi:application.')
+        parser.add_argument('--cookie', default='', help='Cookie header (a session id) sent to the servers.')
+
+    def handle(self, *args, requests, concurrency, products, distinct, random_seed, user, host,
+               wsgi_url, asgi_url, cookie, **options):
+        rng = random.Random(random_seed)
+        product_ids = list(Product.objects.filter(is_archived=False).values_list('pk', flat=True)[:10000])
+        if len(product_ids) < products:
+            raise CommandError(f'Need at least {products} live products.')
+        bodies = [
+            ','.join(f'{p}:{rng.randint(1, 5)}' for p in rng.sample(product_ids, products))
+            for _ in range(distinct)
+        ]
+        queries = [f'?items={rng.choice(bodies)}' for _ in range(requests)]
+
+        if wsgi_url or asgi_url:
+            runs = []
+            if wsgi_url:
+                runs.append(('wsgi', self.over_http(wsgi_url.rstrip('/') + SYNC_PATH, queries, concurrency, cookie)))
+            if asgi_url:
+                runs.append(('asgi', self.over_http(asgi_url.rstrip('/') + ASYNC_PATH, queries, concurrency, cookie)))
+        else:
+            if not user:
+                raise CommandError('--user is required for in-process runs.')
+            try:
+                user = User.objects.get(username=user)
+            except User.DoesNotExist:
+                raise CommandError(f'Unknown user {user!r}.')
+            runs = [
+                ('wsgi', self.in_process_sync(user, host, queries, concurrency)),
+                ('asgi', self.in_process_async(user, host, queries, concurrency)),
+            ]
+
+        for name, (elapsed, timings, errors, extra) in runs:
+            timings.sort()
+            self.stdout.write(
+                f'{name}: {len(timings)} requests in {elapsed:.2f}s ({len(timings) / elapsed:,.0f}/s)  '
+                f'p50 {statistics.median(timings):.2f}ms  '
+                f'p99 {timings[max(int(len(timings) * 0.99) - 1, 0)]:.2f}ms  '
+                f'max {timings[-1]:.2f}ms  {errors} errors{extra}'
+            )
+
+    @staticmethod
+    def over_http(url, queries, concurrency, cookie):
+        headers = {'Cookie': cookie} if cookie else {}
+
+        def get(query):
+            started = time.perf_counter()
+            with urllib.request.urlopen(urllib.request.Request(url + query, headers=headers)) as response:
+                response.read()
+                ok = response.status == 200
+            return (time.perf_counter() - started) * 1000, ok
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            results = list(pool.map(get, queries))
+        elapsed = time.perf_counter() - started
+        return elapsed, [t for t, _ in results], sum(not ok for _, ok in results), ''
+
+    @staticmethod
+    def in_process_sync(user, host, queries, concurrency):
+        def client():
+            c = Client(HTTP_HOST=host)
+            c.force_login(user)
+            return c
+
+        clients = [client() for _ in range(concurrency)]
+
+        def get(i):
+            started = time.perf_counter()
+            response = clients[i % concurrency].get(SYNC_PATH + queries[i])
+            return (time.perf_counter() - started) * 1000, response.status_code == 200
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            results = list(pool.map(get, range(len(queries))))
+        elapsed = time.perf_counter() - started
+        return elapsed, [t for t, _ in results], sum(not ok for _, ok in results), ''
+
+    @staticmethod
+    def in_process_async(user, host, queries, concurrency):
+        client = AsyncClient(HTTP_HOST=host)
+        client.force_login(user)
+
+        async def burst():
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def get(query):
+                async with semaphore:
+                    started = time.perf_counter()
+                    response = await client.get(ASYNC_PATH + query)
+                    return (time.perf_counter() - started) * 1000, response.status_code == 200
+
+            started = time.perf_counter()
+            results = await asyncio.gather(*(get(q) for q in queries))
+            elapsed = time.perf_counter() - started
+            bom_loader, available_loader = availability.loaders()
+            extra = (
+                f'  (bom lookups {bom_loader.stats["requested"]} -> {bom_loader.stats["batches"]} batches, '
+                f'balance lookups {available_loader.stats["requested"]} -> {available_loader.stats["batches"]} batches)'
+            )
+            return elapsed, [t for t, _ in results], sum(not ok for _, ok in results), extra
+
+        return asyncio.run(burst())
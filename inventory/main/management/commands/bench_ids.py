@@ -0,0 +1,64 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from main.ids import uuid7
+
+GENERATORS = {'uuid4': uuid.uuid4, 'uuid7': uuid7}
+
+
+class Command(BaseCommand):
+    help = 'Compare insert throughput and primary-key index size of uuid4 and uuid7 keys.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, rows, batch_size, **options):
+        for name, generate in GENERATORS.items():
+            table = f'bench_ids_{name}'
+            with connection.cursor() as cursor:
+                cursor.execute(f'DROP TABLE IF EXISTS {table}')
+                cursor.execute(
+                    f'CREATE TABLE {table} (id {self.uuid_type()} PRIMARY KEY, payload integer NOT NULL)'
+                )
+                try:
+                    elapsed = self.insert(cursor, table, generate, rows, batch_size)
+                    size = self.index_size(cursor, table)
+                finally:
+                    cursor.execute(f'DROP TABLE {table}')
+            size_text = f'{size / 1024 / 1024:.1f} MiB' if size is not None else 'n/a'
+            self.stdout.write(
+                f'{name}: {rows} rows in {elapsed:.2f}s ({rows / elapsed:,.0f} rows/s), pk index {size_text}'
+            )
+
+    @staticmethod
+    def uuid_type():
+        return 'uuid' if connection.vendor == 'postgresql' else 'char(32)'
+
+    @staticmethod
+    def insert(cursor, table, generate, rows, batch_size):
+        as_value = str if connection.vendor == 'postgresql' else (lambda u: u.hex)
+        started = time.perf_counter()
+        for offset in range(0, rows, batch_size):
+            batch = [(as_value(generate()), i) for i in range(offset, min(offset + batch_size, rows))]
+            with transaction.atomic():
+                cursor.executemany(f'INSERT INTO {table} (id, payload) VALUES (%s, %s)', batch)
+        return time.perf_counter() - started
+
+    @staticmethod
+    def index_size(cursor, table):
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT pg_relation_size(%s)', [f'{table}_pkey'])
+            return cursor.fetchone()[0]
+        if connection.vendor == 'sqlite':
+            try:
+                cursor.execute(
+                    "SELECT SUM(pgsize) FROM dbstat WHERE name = %s", [f'sqlite_autoindex_{table}_1'],
+                )
+            except Exception:
+                return None
+            return cursor.fetchone()[0]
+        return None
@@ -0,0 +1,119 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from main.models import Client, Material, Order, Purchase, Stock, Supplier, User
+
+
+class Command(BaseCommand):
+    help = (
+        'Show query plans and timings of the hot live-row access paths, '
+        'optionally after seeding a dataset of the given size.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, help='Insert this many stock/purchase/order rows first.')
+        parser.add_argument('--archived', type=float, default=0.3, help='Fraction of seeded rows that are archived.')
+        parser.add_argument('--chunk-size', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--random-seed', type=int, default=0)
+
+    def handle(self, *args, seed, archived, chunk_size, repeat, random_seed, **options):
+        self.random = random.Random(random_seed)
+        if seed:
+            self.seed(seed, archived, chunk_size)
+        material = Material.objects.order_by('?').first()
+        supplier = Supplier.objects.order_by('?').first()
+        client = Client.objects.order_by('?').first()
+        if not (material and supplier and client):
+            raise CommandError('No data to benchmark; run with --seed.')
+
+        queries = {
+            'stock on hand by material': lambda: Stock.objects.filter(
+                material=material, is_archived=False,
+            ).values('material').annotate(total=Sum('quantity')),
+            'purchases by supplier, latest arrivals': lambda: Purchase.objects.filter(
+                supplier=supplier, is_archived=False,
+            ).order_by('-arrived_at')[:50],
+            'pending orders, oldest first': lambda: Order.objects.filter(
+                order_status='pending', is_archived=False,
+            ).order_by('requested_at')[:50],
+            'orders by client, latest first': lambda: Order.objects.filter(
+                client=client, is_archived=False,
+            ).order_by('-requested_at')[:50],
+            'materials by supplier': lambda: Material.objects.filter(supplier=supplier, is_archived=False),
+        }
+        analyze = {'analyze': True} if connection.vendor == 'postgresql' else {}
+        for name, build in queries.items():
+            query = build()
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                list(build())
+                timings.append((time.perf_counter() - started) * 1000)
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(query.explain(**analyze))
+            timings.sort()
+            self.stdout.write(
+                f'p50 {statistics.median(timings):.2f}ms  '
+                f'p95 {timings[int(len(timings) * 0.95) - 1]:.2f}ms  '
+                f'max {timings[-1]:.2f}ms\n'
+            )
+
+    def seed(self, rows, archived, chunk_size):
+        user = User.objects.filter(username='bench').first()
+        if user is None:
+            user = User(username='bench')
+            user.created_by_id = user.updated_by_id = user.id
+            user.save()
+        audit = {'created_by': user, 'updated_by': user}
+        now = timezone.now()
+        suppliers = Supplier.objects.bulk_create([Supplier(name=f'supplier {i}', **audit) for i in range(200)])
+        clients = Client.objects.bulk_create([Client(name=f'client {i}', **audit) for i in range(2000)])
+        materials = Material.objects.bulk_create([
+            Material(
+                name=f'material {i}', price=self.random.uniform(1, 100), tax=18, qty_unit='kg',
+                supplier=self.random.choice(suppliers), **audit,
+            )
+            for i in range(5000)
+        ])
+        statuses = ['pending', 'approved', 'in progress', 'completed']
+
+        def stock(i):
+            return Stock(material=self.random.choice(materials), quantity=self.random.randint(1, 100), **archived_kw(), **audit)
+
+        def purchase(i):
+            material = self.random.choice(materials)
+            return Purchase(
+                supplier_id=material.supplier_id, material=material, quantity=self.random.randint(1, 1000),
+                requested_at=now - timedelta(days=self.random.randint(0, 720)),
+                arrived_at=now - timedelta(days=self.random.randint(0, 700)),
+                requested_user=user, **archived_kw(), **audit,
+            )
+
+        def order(i):
+            return Order(
+                client=self.random.choice(clients), order_status=self.random.choices(statuses, [1, 2, 2, 15])[0],
+                requested_at=now - timedelta(minutes=self.random.randint(0, 1_000_000)),
+                **archived_kw(), **audit,
+            )
+
+        def archived_kw():
+            return {'is_archived': self.random.random() < archived}
+
+        for model, build in ((Stock, stock), (Purchase, purchase), (Order, order)):
+            started = time.perf_counter()
+            count = rows // 3
+            for offset in range(0, count, chunk_size):
+                with transaction.atomic():
+                    model.objects.bulk_create([build(i) for i in range(min(chunk_size, count - offset))])
+            self.stdout.write(f'seeded {count} {model._meta.db_table} rows in {time.perf_counter() - started:.1f}s')
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
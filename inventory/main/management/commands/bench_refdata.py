@@ -0,0 +1,77 @@
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main import instrumentation, refdata
+from main.models import Client, Material, Supplier
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure the database hits the reference-data cache avoids on a simulated order-entry workload: '
+        'each order resolves its client and, per line, a material and its supplier.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=2000)
+        parser.add_argument('--lines', type=int, default=5, help='Material lines per order.')
+        parser.add_argument('--clients', type=int, default=200, help='Distinct clients ordering.')
+        parser.add_argument('--materials', type=int, default=1000, help='Distinct materials ordered.')
+        parser.add_argument('--random-seed', type=int, default=0)
+
+    def handle(self, *args, orders, lines, clients, materials, random_seed, **options):
+        rng = random.Random(random_seed)
+        client_ids = list(Client.objects.filter(is_archived=False).values_list('pk', flat=True)[:clients])
+        material_ids = list(Material.objects.filter(is_archived=False).values_list('pk', flat=True)[:materials])
+        if not client_ids or len(material_ids) < lines:
+            raise CommandError(f'Need at least one live client and {lines} live materials.')
+        workload = [(rng.choice(client_ids), rng.sample(material_ids, lines)) for _ in range(orders)]
+
+        # Start cold without clearing the shared cache other processes use.
+        refdata.invalidate(Client, client_ids)
+        refdata.invalidate(Material, material_ids)
+        refdata.invalidate(
+            Supplier,
+            set(Material.objects.filter(pk__in=material_ids).values_list('supplier_id', flat=True)),
+        )
+        refdata.reset_stats()
+
+        baseline = self.measure('database', self.from_database, workload)
+        for name in ('cached (cold)', 'cached (warm)'):
+            recording = self.measure(name, self.from_cache, workload)
+            self.stdout.write(
+                f'  {baseline.count - recording.count:,} of {baseline.count:,} database hits avoided '
+                f'({1 - recording.count / baseline.count:.1%})'
+            )
+        self.stdout.write(f'cache: {refdata.stats()}')
+
+    def measure(self, name, run, workload):
+        with instrumentation.record() as recording:
+            rendered = run(workload)
+        self.stdout.write(
+            f'{name}: {len(workload)} orders, {rendered} names in {recording.elapsed:.2f}s, '
+            f'{recording.count:,} queries ({recording.db_time * 1000:.0f}ms in the database)'
+        )
+        return recording
+
+    @staticmethod
+    def from_database(workload):
+        """What rendering an order did before: one query per ``__str__`` dereference."""
+        rendered = 0
+        for client_id, material_ids in workload:
+            names = [str(Client.objects.get(pk=client_id))]
+            for material_id in material_ids:
+                material = Material.objects.get(pk=material_id)
+                names += [str(material), str(material.supplier)]
+            rendered += len(names)
+        return rendered
+
+    @staticmethod
+    def from_cache(workload):
+        rendered = 0
+        for client_id, material_ids in workload:
+            names = [str(refdata.get(Client, client_id))]
+            for material in refdata.attach(refdata.get_many(Material, material_ids).values(), 'supplier'):
+                names += [str(material), str(material.supplier)]
+            rendered += len(names)
+        return rendered
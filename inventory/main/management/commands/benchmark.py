@@ -0,0 +1,52 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the core workflows (order entry, allocation, stock lookup, reporting) and write the results as JSON. '
+        'Writing workflows are rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', action='append', choices=list(benchmarks.BENCHMARKS), default=[],
+                            help='Benchmark to run (repeatable); defaults to all.')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', '-o', help='Write the JSON here instead of stdout.')
+        parser.add_argument('--compare', help='JSON of an earlier run to compare the p50 times with.')
+
+    def handle(self, *args, only, repeat, warmup, seed, output, compare, **options):
+        baseline = None
+        if compare:
+            try:
+                with open(compare) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f'Cannot read {compare}: {e}')
+        try:
+            results = benchmarks.run(only or None, repeat=repeat, warmup=warmup, seed=seed)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        text = json.dumps(results, indent=2)
+        if output:
+            with open(output, 'w') as f:
+                f.write(text + '\n')
+        else:
+            sys.stdout.write(text + '\n')
+
+        for name, result in results['results'].items():
+            self.stderr.write(
+                f'{name}: p50 {result["ms"]["p50"]:.2f}ms  p95 {result["ms"]["p95"]:.2f}ms  '
+                f'{result["queries"]:g} queries'
+            )
+        if baseline:
+            self.stderr.write(f'\nagainst {baseline["meta"].get("commit") or compare}:')
+            for name, before, after, ratio in benchmarks.compare(baseline, results):
+                self.stderr.write(f'{name}: {before:.2f}ms -> {after:.2f}ms ({ratio:.2f}x)')
@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from main import feed
+
+
+class Command(BaseCommand):
+    help = 'Delete outbox events superseded by a later event of the same row.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-days', type=float, default=feed.KEEP.days,
+                            help='Keep every event newer than this many days.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Events deleted per transaction.')
+        parser.add_argument('--schedule', action='store_true',
+                            help='Instead, queue the outbox.compact job, which then reschedules itself.')
+
+    def handle(self, *args, keep_days, batch_size, schedule, **options):
+        if schedule:
+            job = feed.schedule()
+            self.stdout.write(self.style.SUCCESS(f'Queued {job.kind} ({job.pk}).'))
+            return
+        deleted = feed.compact(timezone.now() - timedelta(days=keep_days), batch_size=batch_size)
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} superseded events.'))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from main import units
+from main.models import Purchase
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill in purchases' base quantities (the quantity in the material's own unit) "
+        'with one UPDATE per batch.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000, help='Purchases updated per statement.')
+        parser.add_argument('--all', action='store_true',
+                            help='Recompute every purchase, not just those without a base quantity.')
+
+    def handle(self, *args, batch_size, all, **options):
+        purchases = Purchase.objects.all() if all else Purchase.objects.filter(base_quantity__isnull=True)
+        last, updated = None, 0
+        while True:
+            batch = purchases.order_by('pk')
+            if last is not None:
+                batch = batch.filter(pk__gt=last)
+            ids = list(batch.values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+            updated += units.restamp(Purchase.objects.filter(pk__in=ids))
+            last = ids[-1]
+        missing = Purchase.objects.filter(base_quantity__isnull=True).count()
+        self.stdout.write(self.style.SUCCESS(f'{updated} purchases converted.'))
+        if missing:
+            self.stdout.write(self.style.WARNING(
+                f'{missing} purchases have a unit with no conversion factor for their material; '
+                'add MaterialUnit rows and rerun.'
+            ))
@@ -0,0 +1,64 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main import costing
+
+
+class Command(BaseCommand):
+    help = 'Recompute material cost, tax and margin of every product, optionally as a what-if.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--markup', type=float, help='Reset product prices to cost + tax + this percentage.')
+        parser.add_argument(
+            '--supplier', action='append', default=[], metavar='SUPPLIER_ID=PERCENT',
+            help='What-if: change the prices of a supplier\'s materials by PERCENT. Implies --dry-run.',
+        )
+        parser.add_argument(
+            '--material', action='append', default=[], metavar='MATERIAL_ID=PERCENT',
+            help='What-if: change the price of one material by PERCENT. Implies --dry-run.',
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Report without writing to the database.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, markup=None, supplier, material, dry_run, batch_size, **options):
+        started = time.perf_counter()
+        catalogue = costing.Catalogue.load()
+        loaded = time.perf_counter()
+        suppliers = self.parse(supplier)
+        materials = self.parse(material)
+        if materials.keys() - catalogue.material_index.keys():
+            raise CommandError('Unknown material in --material.')
+        what_if = bool(suppliers or materials)
+        rollup = catalogue.what_if(suppliers=suppliers, materials=materials)
+        computed = time.perf_counter()
+
+        base = catalogue.rollup() if what_if else rollup
+        self.stdout.write(
+            f'{len(catalogue.product_ids)} products, {len(catalogue.material_ids)} materials, '
+            f'{len(catalogue.quantity)} BOM lines; loaded in {loaded - started:.3f}s, '
+            f'rolled up in {(computed - loaded) * 1000:.1f}ms'
+        )
+        if what_if:
+            delta = rollup.total - base.total
+            self.stdout.write(
+                f'what-if: total cost {base.total.sum():.2f} -> {rollup.total.sum():.2f} '
+                f'({delta.sum():+.2f}), {int((delta != 0).sum())} products affected, '
+                f'{int(((base.margin >= 0) & (rollup.margin < 0)).sum())} pushed below zero margin'
+            )
+        if dry_run or what_if:
+            return
+        saved = costing.save(rollup, markup=markup, batch_size=batch_size)
+        self.stdout.write(self.style.SUCCESS(f'{saved} products updated.'))
+
+    @staticmethod
+    def parse(values):
+        parsed = {}
+        for value in values:
+            key, _, percent = value.partition('=')
+            try:
+                parsed[uuid.UUID(key)] = float(percent)
+            except ValueError:
+                raise CommandError(f'Expected ID=PERCENT, got {value!r}.')
+        return parsed
@@ -0,0 +1,40 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main import exporters
+from main.routers import from_replica
+
+
+class Command(BaseCommand):
+    help = 'Stream a stock, consumption or purchase snapshot to a file without loading it into memory.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=list(exporters.DATASETS))
+        parser.add_argument('--format', choices=list(exporters.FORMATS), default='csv')
+        parser.add_argument('--output', '-o', help='Defaults to stdout.')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--include-archived', action='store_true')
+        parser.add_argument('--since', help='Only rows created at or after this ISO timestamp.')
+        parser.add_argument('--until', help='Only rows created before this ISO timestamp.')
+
+    def handle(self, *args, dataset, format, output=None, chunk_size, include_archived, since=None, until=None,
+               **options):
+        reason = exporters.unavailable(format)
+        if reason:
+            raise CommandError(reason)
+        filters = {'include_archived': include_archived}
+        for name, value in (('since', since), ('until', until)):
+            if value:
+                parsed = exporters.parse_timestamp(value)
+                if parsed is None:
+                    raise CommandError(f'--{name} is not an ISO timestamp: {value!r}')
+                filters[name] = parsed
+        stream = from_replica(exporters.export(dataset, format, chunk_size=chunk_size, **filters))
+        out = open(output, 'wb') if output else sys.stdout.buffer
+        try:
+            for data in stream:
+                out.write(data)
+        finally:
+            if output:
+                out.close()
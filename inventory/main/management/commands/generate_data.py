@@ -0,0 +1,37 @@
+from datetime import datetime, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from main import synthetic
+
+
+class Command(BaseCommand):
+    help = 'Fill every table with deterministic synthetic data (bulk inserts) for benchmarking.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100_000, help='Approximate total rows, 10k to 50M.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--days', type=int, default=365, help='Days of order history.')
+        parser.add_argument('--now', help='Date the history ends on (YYYY-MM-DD); defaults to today (UTC).')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per INSERT.')
+
+    def handle(self, *args, rows, seed, days, now, batch_size, **options):
+        if now:
+            try:
+                day = parse_date(now)
+            except ValueError:
+                day = None
+            if day is None:
+                raise CommandError(f'--now is not a date: {now!r}')
+            now = datetime(day.year, day.month, day.day, tzinfo=dt_timezone.utc)
+        try:
+            counts = synthetic.generate(
+                rows, seed=seed, days=days, now=now, batch_size=batch_size,
+                log=lambda message: self.stderr.write(message),
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        for model, n in counts.items():
+            self.stdout.write(f'{model}: {n}')
+        self.stdout.write(self.style.SUCCESS(f'{sum(counts.values())} rows generated.'))
@@ -0,0 +1,46 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main.importers import SPECS, ImportFailed, Importer
+from main.models import User
+
+
+class Command(BaseCommand):
+    help = 'Stream suppliers, materials or purchases from a CSV or JSONL file into the database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=list(SPECS))
+        parser.add_argument('path')
+        parser.add_argument('--user', required=True, help='Username recorded as creator of the imported rows.')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Defaults to the file extension.')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Rows per bulk insert.')
+        parser.add_argument('--transaction-size', type=int, default=10000, help='Rows per committed transaction.')
+        parser.add_argument('--checkpoint', help='Progress file used to resume; defaults to <path>.checkpoint.')
+        parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint.')
+        parser.add_argument('--no-copy', action='store_true', help='Use bulk_create even where COPY is available.')
+        parser.add_argument('--max-errors', type=int, help='Abort after this many invalid rows.')
+
+    def handle(self, *args, kind, path, user, format=None, chunk_size, transaction_size, checkpoint=None,
+               restart, no_copy, max_errors=None, **options):
+        try:
+            user = User.objects.get(username=user)
+        except User.DoesNotExist:
+            raise CommandError(f'Unknown user {user!r}.')
+        checkpoint = checkpoint or f'{path}.checkpoint'
+        if restart and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        importer = Importer(
+            path, kind, user, fmt=format, chunk_size=chunk_size, transaction_size=transaction_size,
+            checkpoint=checkpoint, use_copy=not no_copy, max_errors=max_errors,
+            progress=lambda i: self.stdout.write(f'{i.consumed} rows read, {i.imported} imported, {i.rate:,.0f} rows/s'),
+            report_error=lambda error: self.stderr.write(str(error)),
+        )
+        try:
+            importer.run()
+        except (ImportFailed, OSError, ValueError) as e:
+            raise CommandError(f'{e} (resume with the same command; checkpoint {checkpoint})')
+        self.stdout.write(self.style.SUCCESS(
+            f'{importer.imported} {kind} imported, {importer.error_count} invalid rows skipped, '
+            f'{importer.rate:,.0f} rows/s.'
+        ))
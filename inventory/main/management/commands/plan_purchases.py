@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main import planning
+from main.models import Supplier, User
+
+
+class Command(BaseCommand):
+    help = 'Update demand and lead-time statistics, derive reorder points and raise draft purchases.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', required=True, help='Username the draft purchases are requested by.')
+        parser.add_argument('--z', type=float, default=1.65, help='Safety-stock factor (1.65 ~ 95%% service level).')
+        parser.add_argument('--review-days', type=int, default=7, help='Days of demand to cover beyond the reorder point.')
+        parser.add_argument('--history-days', type=int, default=365, help='History read for materials planned for the first time.')
+        parser.add_argument('--dry-run', action='store_true', help='Report suggestions without writing to the database.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, user, z, review_days, history_days, dry_run, batch_size, **options):
+        try:
+            user = User.objects.get(username=user)
+        except User.DoesNotExist:
+            raise CommandError(f'Unknown user {user!r}.')
+        started = time.perf_counter()
+        result = planning.plan(z=z, review_days=review_days, history_days=history_days)
+        computed = time.perf_counter()
+        suggestions = result.suggestions()
+        self.stdout.write(
+            f'{len(result.material_ids)} materials, {result.days_folded} days folded through '
+            f'{result.through_date}; planned in {computed - started:.3f}s'
+        )
+        names = dict(Supplier.objects.filter(pk__in=suggestions).values_list('pk', 'name'))
+        for supplier_id, lines in suggestions.items():
+            self.stdout.write(f'{names.get(supplier_id, supplier_id)}: {len(lines)} materials')
+            for material_id, quantity, qty_unit in lines:
+                self.stdout.write(f'  {material_id}: {quantity} {qty_unit}')
+        if dry_run:
+            return
+        drafts = planning.save(result, user, batch_size=batch_size)
+        self.stdout.write(self.style.SUCCESS(
+            f'{sum(len(lines) for lines in drafts.values())} draft purchases for {len(drafts)} suppliers.'
+        ))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main import summary
+
+
+class Command(BaseCommand):
+    help = 'Recompute the order summary from orders and their lines and report (or fix) drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Refresh drifted orders and rewrite wrong buckets.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, fix, batch_size, **options):
+        drifted, buckets = summary.reconcile(batch_size=batch_size, fix=fix)
+        for order_id in drifted[:50]:
+            self.stdout.write(f'order {order_id} drifted')
+        if len(drifted) > 50:
+            self.stdout.write(f'... and {len(drifted) - 50} more')
+        verb = 'fixed' if fix else 'found'
+        self.stdout.write(f'{len(drifted)} drifted orders and {buckets} wrong buckets {verb}.')
+        if (drifted or buckets) and not fix:
+            raise CommandError('Order summary has drifted; rerun with --fix.')
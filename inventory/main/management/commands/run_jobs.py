@@ -0,0 +1,57 @@
+import multiprocessing
+import signal
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from main import jobs
+
+
+def work_in_process(options, results=None):
+    connections.close_all()
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda *args: stopping.append(True))
+    signal.signal(signal.SIGINT, lambda *args: stopping.append(True))
+    processed = jobs.work(stop=lambda: bool(stopping), **options)
+    if results is not None:
+        results.put(processed)
+    return processed
+
+
+class Command(BaseCommand):
+    help = 'Run background jobs from the database queue.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1, help='Worker processes to run.')
+        parser.add_argument('--batch-size', type=int, default=100, help='Jobs claimed per round trip.')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to sleep when the queue is empty.')
+        parser.add_argument('--stale-after', type=int, default=600, help='Requeue jobs running longer than this many seconds.')
+        parser.add_argument('--kind', action='append', default=[], help='Only run jobs of this kind (repeatable).')
+        parser.add_argument('--burst', action='store_true', help='Exit once no job is due.')
+
+    def handle(self, *args, processes, batch_size, poll_interval, stale_after, kind, burst, **options):
+        options = {
+            'batch_size': batch_size,
+            'poll_interval': poll_interval,
+            'stale_after': timedelta(seconds=stale_after),
+            'kinds': kind or None,
+            'burst': burst,
+        }
+        if processes <= 1:
+            processed = work_in_process(options)
+        else:
+            # Each worker finishes its current batch on SIGTERM/SIGINT
+            # (Ctrl-C reaches the whole process group) before exiting.
+            connections.close_all()
+            context = multiprocessing.get_context('fork')
+            results = context.Queue()
+            workers = [context.Process(target=work_in_process, args=(options, results)) for _ in range(processes)]
+            for worker in workers:
+                worker.start()
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGTERM, lambda *args: [w.terminate() for w in workers if w.is_alive()])
+            for worker in workers:
+                worker.join()
+            processed = sum(results.get() for worker in workers if worker.exitcode == 0)
+        self.stdout.write(self.style.SUCCESS(f'{processed} jobs processed.'))
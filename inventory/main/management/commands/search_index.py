@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from main import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the search entries of every material, product, supplier and client.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Entries written per statement.')
+
+    def handle(self, *args, batch_size, **options):
+        for kind, count in search.rebuild(batch_size=batch_size).items():
+            self.stdout.write(self.style.SUCCESS(f'{kind}: {count} entries'))
@@ -0,0 +1,94 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Sum
+
+from main import ledger
+from main.models import Material, Stock, StockBalance, StockMovement, User
+
+
+class Command(BaseCommand):
+    help = 'Replay the stock ledger in batches to verify or rebuild the per-material balances.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['verify', 'rebuild', 'seed'])
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--user', help='Username recorded on the opening adjustments written by "seed".',
+        )
+
+    def handle(self, *args, action, batch_size, user=None, **options):
+        if action == 'seed':
+            return self.seed(user, batch_size)
+        checked = drifted = 0
+        material_ids = Material.objects.order_by('pk').values_list('pk', flat=True)
+        for batch in self.batches(material_ids.iterator(chunk_size=batch_size), batch_size):
+            with transaction.atomic():
+                if action == 'rebuild':
+                    balances = ledger.lock_balances(batch)
+                else:
+                    balances = {b.material_id: b for b in StockBalance.objects.filter(material_id__in=batch)}
+                # Replayed once the balance rows are locked: movements committed before
+                # are counted, and writers still holding theirs add on top of the rebuild.
+                expected = ledger.replay(batch)
+                stale = []
+                for material_id in batch:
+                    want = expected.get(material_id, (0, 0))
+                    balance = balances.get(material_id)
+                    have = (balance.on_hand, balance.reserved) if balance else (0, 0)
+                    checked += 1
+                    if want == have:
+                        continue
+                    drifted += 1
+                    self.stdout.write(f'{material_id}: balance {have} != ledger {want}')
+                    if balance is None:
+                        balance = StockBalance(material_id=material_id)
+                    balance.on_hand, balance.reserved = want
+                    balance.version += 1
+                    stale.append(balance)
+                if action == 'rebuild' and stale:
+                    StockBalance.objects.bulk_update(stale, ['on_hand', 'reserved', 'version'])
+        verb = 'fixed' if action == 'rebuild' else 'drifted'
+        self.stdout.write(self.style.SUCCESS(f'{checked} materials checked, {drifted} {verb}.'))
+        if drifted and action == 'verify':
+            raise CommandError('Stock balances do not match the ledger.')
+
+    def seed(self, username, batch_size):
+        """Open the ledger with one adjustment per material from its ``Stock`` rows.
+
+        Materials that already have movements are skipped, so this is safe to
+        run more than once.
+        """
+        if not username:
+            raise CommandError('--user is required for seed.')
+        try:
+            user = User.objects.get(username=username)
+        except User.DoesNotExist:
+            raise CommandError(f'Unknown user {username!r}.')
+        seeded = 0
+        totals = (
+            Stock.objects.filter(is_archived=False)
+            .exclude(material__movements__isnull=False)
+            .values('material_id').annotate(quantity=Sum('quantity')).order_by('material_id')
+        )
+        for batch in self.batches(totals.iterator(chunk_size=batch_size), batch_size):
+            ledger.post_movements(
+                StockMovement(
+                    material_id=row['material_id'], movement_type='adjustment',
+                    on_hand_delta=row['quantity'], comment='opening balance from stock',
+                    created_by=user, updated_by=user,
+                )
+                for row in batch if row['quantity']
+            )
+            seeded += len(batch)
+        self.stdout.write(self.style.SUCCESS(f'{seeded} materials seeded from stock.'))
+
+    @staticmethod
+    def batches(iterable, size):
+        batch = []
+        for item in iterable:
+            batch.append(item)
+            if len(batch) == size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
@@ -0,0 +1,36 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from main import exporters, snapshots
+
+
+class Command(BaseCommand):
+    help = 'Take point-in-time stock snapshots, or queue the job that takes them periodically.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--at', help='Take the snapshot as of this ISO timestamp (default a few minutes ago).')
+        parser.add_argument('--backfill-days', type=int, help='Instead, take one every --every-hours over this many past days.')
+        parser.add_argument('--every-hours', type=float, default=snapshots.EVERY.total_seconds() / 3600)
+        parser.add_argument('--schedule', action='store_true',
+                            help='Instead, queue the stock.snapshot job, which then reschedules itself.')
+
+    def handle(self, *args, at=None, backfill_days=None, every_hours, schedule, **options):
+        if schedule:
+            job = snapshots.schedule()
+            self.stdout.write(self.style.SUCCESS(f'Queued {job.kind} ({job.pk}).'))
+            return
+        if backfill_days:
+            if every_hours <= 0:
+                raise CommandError('--every-hours must be positive.')
+            until = timezone.now() - snapshots.SETTLE
+            count = snapshots.backfill(until - timedelta(days=backfill_days), until, timedelta(hours=every_hours))
+            self.stdout.write(self.style.SUCCESS(f'{count} snapshots up to {until:%Y-%m-%d %H:%M}.'))
+            return
+        if at is not None:
+            at = exporters.parse_timestamp(at)
+            if at is None:
+                raise CommandError('--at is not an ISO timestamp.')
+        snapshot = snapshots.take(at)
+        self.stdout.write(self.style.SUCCESS(f'Snapshot {snapshot}.'))
@@ -0,0 +1,61 @@
+import json
+import os
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+
+from main import feed, outbox
+
+
+class Command(BaseCommand):
+    help = 'Write outbox events after a sequence number as JSON lines, optionally following new ones.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--after', type=int, help='Sequence number to start after (default 0, or the cursor file).')
+        parser.add_argument('--cursor-file', help='Read the starting cursor from, and save progress to, this file.')
+        parser.add_argument('--kind', action='append', default=[], choices=list(outbox.FIELDS),
+                            help='Only events of this kind (repeatable).')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Events read per query.')
+        parser.add_argument('--follow', action='store_true', help='Keep polling for new events.')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to sleep when caught up.')
+
+    def handle(self, *args, after=None, cursor_file=None, kind, batch_size, follow, poll_interval, **options):
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1.')
+        if after is None:
+            after = self.load_cursor(cursor_file)
+        out = sys.stdout
+        try:
+            while True:
+                events, cursor = feed.pull(after, batch_size, kind or None)
+                for event in events:
+                    out.write(json.dumps(feed.as_dict(event), cls=DjangoJSONEncoder) + '\n')
+                out.flush()
+                if cursor != after:
+                    after = cursor
+                    self.save_cursor(cursor_file, after)
+                if len(events) < batch_size:
+                    if not follow:
+                        break
+                    time.sleep(poll_interval)
+        except KeyboardInterrupt:
+            pass
+
+    def load_cursor(self, path):
+        if not path or not os.path.exists(path):
+            return 0
+        try:
+            with open(path) as f:
+                return int(f.read().strip() or 0)
+        except ValueError:
+            raise CommandError(f'{path} does not hold a sequence number.')
+
+    def save_cursor(self, path, cursor):
+        if not path:
+            return
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w') as f:
+            f.write(f'{cursor}\n')
+        os.replace(tmp, path)
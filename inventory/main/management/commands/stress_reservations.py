@@ -0,0 +1,140 @@
+import multiprocessing
+import random
+import threading
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection, connections
+from django.db.models import Sum
+
+from main import ledger, reservations
+from main.models import Material, StockBalance, StockMovement, Supplier, User
+
+MODES = {'optimistic': reservations.reserve, 'locking': reservations.reserve_locking}
+
+
+def work(mode, user_id, material_ids, ops, lines, max_quantity, seed):
+    """Run ``ops`` random reservations; returns the outcome counts and reserved units."""
+    reserve = MODES[mode]
+    user = User.objects.get(pk=user_id)
+    rng = random.Random(seed)
+    counts = Counter()
+    try:
+        for _ in range(ops):
+            quantities = {m: rng.randint(1, max_quantity) for m in rng.sample(material_ids, lines)}
+            try:
+                reserve(quantities, user, comment='stress')
+            except reservations.InsufficientStock:
+                counts['short'] += 1
+            except reservations.ReservationConflict:
+                counts['conflict'] += 1
+            except DatabaseError:
+                counts['error'] += 1
+            else:
+                counts['ok'] += 1
+                counts['units'] += sum(quantities.values())
+    finally:
+        connection.close()
+    return counts
+
+
+def work_in_process(args):
+    connections.close_all()
+    return work(*args)
+
+
+class Command(BaseCommand):
+    help = 'Hammer a few materials with concurrent reservations and check nothing is oversold.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', required=True)
+        parser.add_argument('--mode', choices=[*MODES, 'both'], default='both')
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--processes', action='store_true', help='Run workers as processes instead of threads.')
+        parser.add_argument('--ops', type=int, default=200, help='Reservations per worker.')
+        parser.add_argument('--materials', type=int, default=10)
+        parser.add_argument('--lines', type=int, default=3, help='Materials per reservation.')
+        parser.add_argument('--stock', type=int, default=2000, help='Opening on-hand quantity per material.')
+        parser.add_argument('--max-quantity', type=int, default=5)
+        parser.add_argument('--keep', action='store_true', help='Keep the generated materials and movements.')
+
+    def handle(self, *args, user, mode, workers, processes, ops, materials, lines, stock, max_quantity, keep, **options):
+        try:
+            user = User.objects.get(username=user)
+        except User.DoesNotExist:
+            raise CommandError(f'Unknown user {user!r}.')
+        if lines > materials:
+            raise CommandError('--lines cannot exceed --materials.')
+        failed = False
+        for name in (MODES if mode == 'both' else [mode]):
+            supplier, material_ids = self.setup(user, materials, stock)
+            try:
+                started = time.perf_counter()
+                counts = self.run(name, user, material_ids, workers, processes, ops, lines, max_quantity)
+                elapsed = time.perf_counter() - started
+                failed |= not self.verify(name, material_ids, counts, elapsed)
+            finally:
+                if not keep:
+                    self.teardown(supplier, material_ids)
+        if failed:
+            raise CommandError('Oversold or drifted; see above.')
+
+    def setup(self, user, materials, stock):
+        audit = {'created_by': user, 'updated_by': user}
+        supplier = Supplier.objects.create(name=f'stress {time.time():.0f}', **audit)
+        created = Material.objects.bulk_create([
+            Material(name=f'stress {i}', price=1, tax=0, qty_unit='pieces', supplier=supplier, **audit)
+            for i in range(materials)
+        ])
+        material_ids = [m.pk for m in created]
+        for material_id in material_ids:
+            ledger.record_adjustment(material_id, stock, user, comment='stress opening balance')
+        return supplier, material_ids
+
+    def run(self, mode, user, material_ids, workers, processes, ops, lines, max_quantity):
+        jobs = [(mode, user.pk, material_ids, ops, lines, max_quantity, seed) for seed in range(workers)]
+        if processes:
+            connections.close_all()
+            with multiprocessing.get_context('fork').Pool(workers) as pool:
+                results = pool.map(work_in_process, jobs)
+        else:
+            results = [None] * workers
+
+            def target(i):
+                results[i] = work(*jobs[i])
+
+            threads = [threading.Thread(target=target, args=(i,)) for i in range(workers)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        return sum(results, Counter())
+
+    def verify(self, mode, material_ids, counts, elapsed):
+        balances = StockBalance.objects.filter(material_id__in=material_ids)
+        oversold = [b for b in balances if b.reserved > b.on_hand]
+        replayed = ledger.replay(material_ids)
+        drifted = [b for b in balances if replayed.get(b.material_id) != (b.on_hand, b.reserved)]
+        reserved = balances.aggregate(total=Sum('reserved'))['total'] or 0
+        attempts = counts['ok'] + counts['short'] + counts['conflict'] + counts['error']
+        self.stdout.write(
+            f'{mode}: {attempts} reservations in {elapsed:.2f}s ({attempts / elapsed:,.0f}/s); '
+            f'{counts["ok"]} ok, {counts["short"]} short, {counts["conflict"]} gave up, {counts["error"]} errors; '
+            f'{reserved} units reserved, {counts["units"]} reported'
+        )
+        ok = not oversold and not drifted and reserved == counts['units']
+        if ok:
+            self.stdout.write(self.style.SUCCESS(f'{mode}: no overselling, balances match the ledger.'))
+        else:
+            self.stdout.write(self.style.ERROR(
+                f'{mode}: {len(oversold)} oversold, {len(drifted)} drifted from the ledger.'
+            ))
+        return ok
+
+    @staticmethod
+    def teardown(supplier, material_ids):
+        StockMovement.objects.filter(material_id__in=material_ids).delete()
+        StockBalance.objects.filter(material_id__in=material_ids).delete()
+        Material.objects.filter(pk__in=material_ids).delete()
+        supplier.delete()
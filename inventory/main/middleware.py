@@ -0,0 +1,41 @@
+"""Base for the middleware that wraps each request in a context manager.
+
+``ActingUserMiddleware``, ``PinningMiddleware`` and
+``QueryInstrumentationMiddleware`` each only need to run the view inside a
+scope, so they share the sync/async plumbing here: a subclass gives
+``scope`` and, optionally, ``finish``, and works under WSGI and ASGI
+alike without a ``sync_to_async`` hop for async views.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+
+class ScopedMiddleware:
+    """Run every request inside ``scope(request)``; async views stay on the event loop."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        with self.scope(request) as value:
+            response = self.get_response(request)
+        return self.finish(request, response, value)
+
+    async def __acall__(self, request):
+        with self.scope(request) as value:
+            response = await self.get_response(request)
+        return self.finish(request, response, value)
+
+    def scope(self, request):
+        """The context manager the view runs in."""
+        raise NotImplementedError
+
+    def finish(self, request, response, value):
+        """The response to return, given what ``scope`` yielded; called once it has exited."""
+        return response
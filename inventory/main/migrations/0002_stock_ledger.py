@@ -0,0 +1,57 @@
+# Generated by Django 4.2.5 on 2026-10-17 07:16
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockBalance',
+            fields=[
+                ('material', models.OneToOneField(on_delete=django.db.models.deletion.PROTECT, primary_key=True, related_name='balance', serialize=False, to='main.material')),
+                ('on_hand', models.IntegerField(default=0)),
+                ('reserved', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'stockbalance',
+            },
+        ),
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('is_archived', models.BooleanField(default=False)),
+                ('movement_type', models.CharField(choices=[('receipt', 'receipt'), ('reserve', 'reserve'), ('allocate', 'allocate'), ('release', 'release'), ('adjustment', 'adjustment')], max_length=255)),
+                ('on_hand_delta', models.IntegerField(default=0)),
+                ('reserved_delta', models.IntegerField(default=0)),
+                ('comment', models.TextField(blank=True, default='')),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='created_%(class)s', related_query_name='created_%(class)s', to=settings.AUTH_USER_MODEL)),
+                ('material', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='movements', to='main.material')),
+                ('material_consumption', models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='movements', to='main.materialconsumption')),
+                ('purchase', models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='movements', to='main.purchase')),
+                ('updated_by', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='updated_%(class)s', related_query_name='updated_%(class)s', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'stockmovement',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='stockmovement',
+            constraint=models.UniqueConstraint(fields=('purchase', 'movement_type'), name='stockmovement_purchase_type_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='stockmovement',
+            constraint=models.UniqueConstraint(fields=('material_consumption', 'movement_type'), name='stockmovement_consumption_type_uniq'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.5 on 2026-10-17 07:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0003_orderproduct_order'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='costed_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='material_cost',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='material_tax',
+            field=models.FloatField(null=True),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.2.5 on 2026-10-17 07:21
+
+from django.db import migrations, models
+
+from main.schema import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('main', '0004_product_costing'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='material',
+            index=models.Index(condition=models.Q(('is_archived', False)), fields=['supplier'], name='material_supplier_live_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='materialconsumption',
+            index=models.Index(condition=models.Q(('is_archived', False)), fields=['material'], name='consumption_material_live_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='materialconsumption',
+            index=models.Index(condition=models.Q(('is_archived', False)), fields=['order_product'], name='consumption_op_live_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='order',
+            index=models.Index(condition=models.Q(('is_archived', False)), fields=['order_status', 'requested_at'], name='order_status_req_live_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='order',
+            index=models.Index(condition=models.Q(('is_archived', False)), fields=['client', 'requested_at'], name='order_client_req_live_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='orderproduct',
+            index=models.Index(condition=models.Q(('is_archived', False)), fields=['order'], name='orderproduct_order_live_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='productmaterial',
+            index=models.Index(condition=models.Q(('is_archived', False)), fields=['product'], name='productmat_product_live_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='productmaterial',
+            index=models.Index(condition=models.Q(('is_archived', False)), fields=['material'], name='productmat_material_live_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='purchase',
+            index=models.Index(condition=models.Q(('is_archived', False)), fields=['supplier', 'arrived_at'], name='purchase_supplier_arr_live_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='purchase',
+            index=models.Index(condition=models.Q(('is_archived', False)), fields=['material', 'arrived_at'], name='purchase_material_arr_live_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='stock',
+            index=models.Index(condition=models.Q(('is_archived', False)), fields=['material'], name='stock_material_live_idx'),
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 4.2.5 on 2026-10-17 07:22
+
+from django.db import migrations, models
+import main.ids
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0005_live_row_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='client',
+            name='id',
+            field=models.UUIDField(default=main.ids.new_id, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='material',
+            name='id',
+            field=models.UUIDField(default=main.ids.new_id, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='materialconsumption',
+            name='id',
+            field=models.UUIDField(default=main.ids.new_id, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='id',
+            field=models.UUIDField(default=main.ids.new_id, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='orderproduct',
+            name='id',
+            field=models.UUIDField(default=main.ids.new_id, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='id',
+            field=models.UUIDField(default=main.ids.new_id, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='productmaterial',
+            name='id',
+            field=models.UUIDField(default=main.ids.new_id, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='purchase',
+            name='id',
+            field=models.UUIDField(default=main.ids.new_id, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='stock',
+            name='id',
+            field=models.UUIDField(default=main.ids.new_id, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='stockmovement',
+            name='id',
+            field=models.UUIDField(default=main.ids.new_id, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='supplier',
+            name='id',
+            field=models.UUIDField(default=main.ids.new_id, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='id',
+            field=models.UUIDField(default=main.ids.new_id, primary_key=True, serialize=False),
+        ),
+    ]
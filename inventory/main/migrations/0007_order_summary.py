@@ -0,0 +1,50 @@
+# Generated by Django 4.2.5 on 2026-10-17 07:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0006_time_ordered_ids'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderSummaryEntry',
+            fields=[
+                ('order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary_entry', serialize=False, to='main.order')),
+                ('order_status', models.CharField(choices=[('pending', 'pending'), ('approved', 'approved'), ('in progress', 'in progress'), ('completed', 'completed')], max_length=255)),
+                ('day', models.DateField()),
+                ('line_count', models.IntegerField(default=0)),
+                ('units', models.IntegerField(default=0)),
+                ('value', models.FloatField(default=0)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='main.client')),
+            ],
+            options={
+                'db_table': 'ordersummaryentry',
+            },
+        ),
+        migrations.CreateModel(
+            name='OrderSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order_status', models.CharField(choices=[('pending', 'pending'), ('approved', 'approved'), ('in progress', 'in progress'), ('completed', 'completed')], max_length=255)),
+                ('day', models.DateField()),
+                ('order_count', models.IntegerField(default=0)),
+                ('line_count', models.IntegerField(default=0)),
+                ('units', models.IntegerField(default=0)),
+                ('value', models.FloatField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='order_summaries', to='main.client')),
+            ],
+            options={
+                'db_table': 'ordersummary',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='ordersummary',
+            constraint=models.UniqueConstraint(fields=('day', 'order_status', 'client'), name='ordersummary_bucket_uniq'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.5 on 2026-10-17 07:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0007_order_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MaterialPlan',
+            fields=[
+                ('material', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='plan', serialize=False, to='main.material')),
+                ('demand_rate', models.FloatField(default=0)),
+                ('demand_var', models.FloatField(default=0)),
+                ('lead_time_days', models.FloatField(null=True)),
+                ('reorder_point', models.FloatField(default=0)),
+                ('through_date', models.DateField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'materialplan',
+            },
+        ),
+        migrations.AddField(
+            model_name='purchase',
+            name='is_draft',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.5 on 2026-10-17 07:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0008_purchase_planning'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stockbalance',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,135 @@
+# Generated by Django 4.2.5 on 2026-10-17 07:57
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+from main.schema import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('main', '0010_job_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedMaterialConsumption',
+            fields=[
+                ('id', models.UUIDField(primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('is_archived', models.BooleanField(default=True)),
+                ('quantity', models.IntegerField()),
+                ('is_allocated', models.BooleanField(default=False)),
+                ('comment', models.TextField()),
+            ],
+            options={
+                'db_table': 'materialconsumption_archive',
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedPurchase',
+            fields=[
+                ('id', models.UUIDField(primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('is_archived', models.BooleanField(default=True)),
+                ('quantity', models.IntegerField(default=0)),
+                ('qty_unit', models.CharField(choices=[('kg', 'kg'), ('ltr', 'ltr'), ('meter', 'meter'), ('pieces', 'pieces')], max_length=255, null=True)),
+                ('requested_at', models.DateTimeField(null=True)),
+                ('arrived_at', models.DateTimeField(null=True)),
+                ('is_arrived', models.DateTimeField(null=True)),
+                ('is_draft', models.BooleanField(default=False)),
+            ],
+            options={
+                'db_table': 'purchase_archive',
+            },
+        ),
+        migrations.AlterField(
+            model_name='stockmovement',
+            name='material_consumption',
+            field=models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='movements', to='main.materialconsumption'),
+        ),
+        migrations.AlterField(
+            model_name='stockmovement',
+            name='purchase',
+            field=models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='movements', to='main.purchase'),
+        ),
+        AddIndexConcurrently(
+            model_name='materialconsumption',
+            index=models.Index(condition=models.Q(('is_archived', True)), fields=['created_at'], name='consumption_archived_crt_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='purchase',
+            index=models.Index(condition=models.Q(('is_archived', True)), fields=['created_at'], name='purchase_archived_crt_idx'),
+        ),
+        migrations.AddField(
+            model_name='archivedpurchase',
+            name='created_by',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='archivedpurchase',
+            name='material',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='main.material'),
+        ),
+        migrations.AddField(
+            model_name='archivedpurchase',
+            name='requested_user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='archivedpurchase',
+            name='supplier',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='main.supplier'),
+        ),
+        migrations.AddField(
+            model_name='archivedpurchase',
+            name='updated_by',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='archivedmaterialconsumption',
+            name='created_by',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='archivedmaterialconsumption',
+            name='material',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='main.material'),
+        ),
+        migrations.AddField(
+            model_name='archivedmaterialconsumption',
+            name='order_product',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='main.orderproduct'),
+        ),
+        migrations.AddField(
+            model_name='archivedmaterialconsumption',
+            name='updated_by',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='archivedpurchase',
+            index=models.Index(fields=['created_at'], name='purchase_archive_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedpurchase',
+            index=models.Index(fields=['material', 'arrived_at'], name='purchase_archive_mat_arr_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedmaterialconsumption',
+            index=models.Index(fields=['created_at'], name='consumption_archive_crt_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedmaterialconsumption',
+            index=models.Index(fields=['material'], name='consumption_archive_mat_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedmaterialconsumption',
+            index=models.Index(fields=['order_product'], name='consumption_archive_op_idx'),
+        ),
+    ]
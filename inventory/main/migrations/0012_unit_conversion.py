@@ -0,0 +1,40 @@
+# Generated by Django 4.2.5 on 2026-10-17 08:07
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0011_archive_history'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedpurchase',
+            name='base_quantity',
+            field=models.DecimalField(decimal_places=6, max_digits=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='purchase',
+            name='base_quantity',
+            field=models.DecimalField(decimal_places=6, max_digits=20, null=True),
+        ),
+        migrations.CreateModel(
+            name='MaterialUnit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('qty_unit', models.CharField(choices=[('kg', 'kg'), ('ltr', 'ltr'), ('meter', 'meter'), ('pieces', 'pieces')], max_length=255)),
+                ('factor', models.DecimalField(decimal_places=6, max_digits=18)),
+                ('material', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='units', to='main.material')),
+            ],
+            options={
+                'db_table': 'materialunit',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='materialunit',
+            constraint=models.UniqueConstraint(fields=('material', 'qty_unit'), name='materialunit_material_unit_uniq'),
+        ),
+    ]
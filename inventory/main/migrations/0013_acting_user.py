@@ -0,0 +1,20 @@
+# Generated by Django 4.2.5 on 2026-10-17 08:12
+
+from django.db import migrations
+import main.audit
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0012_unit_conversion'),
+    ]
+
+    operations = [
+        migrations.AlterModelManagers(
+            name='user',
+            managers=[
+                ('objects', main.audit.UserManager()),
+            ],
+        ),
+    ]
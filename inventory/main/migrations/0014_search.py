@@ -0,0 +1,49 @@
+# Generated by Django 4.2.5 on 2026-10-17 08:15
+
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+from main.schema import PostgresSQL
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('main', '0013_acting_user'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=16)),
+                ('object_id', models.UUIDField()),
+                ('title', models.CharField(max_length=255)),
+                ('body', models.TextField(blank=True, default='')),
+                ('vector', django.contrib.postgres.search.SearchVectorField(null=True)),
+                ('updated_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'searchentry',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='searchentry',
+            constraint=models.UniqueConstraint(fields=('kind', 'object_id'), name='searchentry_kind_object_uniq'),
+        ),
+        PostgresSQL(
+            'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+            migrations.RunSQL.noop,
+        ),
+        PostgresSQL(
+            'CREATE INDEX CONCURRENTLY searchentry_vector_idx ON searchentry USING gin (vector)',
+            'DROP INDEX CONCURRENTLY IF EXISTS searchentry_vector_idx',
+        ),
+        PostgresSQL(
+            'CREATE INDEX CONCURRENTLY searchentry_title_trgm_idx ON searchentry USING gin (title gin_trgm_ops)',
+            'DROP INDEX CONCURRENTLY IF EXISTS searchentry_title_trgm_idx',
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.5 on 2026-10-17 08:26
+
+import django.core.serializers.json
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0014_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('seq', models.BigIntegerField(null=True, unique=True)),
+                ('kind', models.CharField(max_length=32)),
+                ('object_id', models.UUIDField()),
+                ('action', models.CharField(choices=[('created', 'created'), ('updated', 'updated'), ('archived', 'archived')], max_length=16)),
+                ('payload', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'db_table': 'outboxevent',
+                'indexes': [models.Index(condition=models.Q(('seq__isnull', True)), fields=['id'], name='outboxevent_pending_idx'), models.Index(fields=['kind', 'object_id', 'id'], name='outboxevent_object_idx'), models.Index(fields=['created_at'], name='outboxevent_created_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.5 on 2026-10-17 08:29
+
+from django.db import migrations, models
+
+from main.schema import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('main', '0015_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('taken_at', models.DateTimeField(unique=True)),
+                ('material_count', models.PositiveIntegerField(default=0)),
+                ('balances', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'stocksnapshot',
+            },
+        ),
+        AddIndexConcurrently(
+            model_name='stockmovement',
+            index=models.Index(fields=['created_at'], name='stockmovement_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='stockmovement',
+            index=models.Index(fields=['material', 'created_at'], name='stockmovement_mat_created_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.5 on 2026-10-17 08:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0016_stock_snapshots'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='stockmovement',
+            name='stockmovement_purchase_type_uniq',
+        ),
+        migrations.AddConstraint(
+            model_name='stockmovement',
+            constraint=models.UniqueConstraint(condition=models.Q(('movement_type', 'receipt')), fields=('purchase',), name='stockmovement_purchase_receipt_uniq'),
+        ),
+    ]
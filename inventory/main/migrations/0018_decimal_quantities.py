@@ -0,0 +1,63 @@
+import zlib
+
+import numpy as np
+from django.db import migrations, models
+
+DTYPE = np.dtype([('material', 'S16'), ('on_hand', '<i8'), ('reserved', '<i8')])
+
+
+def rescale_snapshots(apps, schema_editor):
+    # Snapshots stored whole units; main.snapshots now stores millionths.
+    StockSnapshot = apps.get_model('main', 'StockSnapshot')
+    for snapshot in StockSnapshot.objects.iterator(chunk_size=100):
+        array = np.frombuffer(zlib.decompress(bytes(snapshot.balances)), dtype=DTYPE).copy()
+        array['on_hand'] *= 10 ** 6
+        array['reserved'] *= 10 ** 6
+        snapshot.balances = zlib.compress(array.tobytes())
+        snapshot.save(update_fields=['balances'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0017_purchase_adjustments'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='archivedmaterialconsumption',
+            name='quantity',
+            field=models.DecimalField(decimal_places=6, max_digits=20),
+        ),
+        migrations.AlterField(
+            model_name='materialconsumption',
+            name='quantity',
+            field=models.DecimalField(decimal_places=6, max_digits=20),
+        ),
+        migrations.AlterField(
+            model_name='stock',
+            name='quantity',
+            field=models.DecimalField(decimal_places=6, max_digits=20),
+        ),
+        migrations.AlterField(
+            model_name='stockbalance',
+            name='on_hand',
+            field=models.DecimalField(decimal_places=6, default=0, max_digits=20),
+        ),
+        migrations.AlterField(
+            model_name='stockbalance',
+            name='reserved',
+            field=models.DecimalField(decimal_places=6, default=0, max_digits=20),
+        ),
+        migrations.AlterField(
+            model_name='stockmovement',
+            name='on_hand_delta',
+            field=models.DecimalField(decimal_places=6, default=0, max_digits=20),
+        ),
+        migrations.AlterField(
+            model_name='stockmovement',
+            name='reserved_delta',
+            field=models.DecimalField(decimal_places=6, default=0, max_digits=20),
+        ),
+        migrations.RunPython(rescale_snapshots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def price_existing_lines(apps, schema_editor):
+    # Past prices are gone; the current one is what summaries used so far.
+    OrderProduct = apps.get_model('main', 'OrderProduct')
+    Product = apps.get_model('main', 'Product')
+    OrderProduct.objects.filter(unit_price__isnull=True).update(
+        unit_price=Subquery(Product.objects.filter(pk=OuterRef('product_id')).values('price')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0018_decimal_quantities'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderproduct',
+            name='unit_price',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.RunPython(price_existing_lines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.5 on 2026-10-17 09:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0019_orderproduct_unit_price'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='stockmovement',
+            name='stockmovement_consumption_type_uniq',
+        ),
+        migrations.AddConstraint(
+            model_name='stockmovement',
+            constraint=models.UniqueConstraint(condition=models.Q(('movement_type', 'adjustment'), _negated=True), fields=('material_consumption', 'movement_type'), name='stockmovement_consumption_type_uniq'),
+        ),
+    ]
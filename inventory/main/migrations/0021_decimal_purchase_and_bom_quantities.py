@@ -0,0 +1,28 @@
+# Generated by Django 4.2.5 on 2026-10-17 09:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0020_consumption_adjustments'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='archivedpurchase',
+            name='quantity',
+            field=models.DecimalField(decimal_places=6, default=0, max_digits=20),
+        ),
+        migrations.AlterField(
+            model_name='productmaterial',
+            name='quantity',
+            field=models.DecimalField(decimal_places=6, max_digits=20),
+        ),
+        migrations.AlterField(
+            model_name='purchase',
+            name='quantity',
+            field=models.DecimalField(decimal_places=6, default=0, max_digits=20),
+        ),
+    ]
@@ -1,27 +1,44 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models 
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser 
+from django.contrib.postgres.search import SearchVectorField
 
-from uuid import uuid4 
+from main.constants import QTY_UNIT_CHOICES, GENDER_CHOICES, ORDER_STATUS_CHOICES, MOVEMENT_TYPE_CHOICES, JOB_STATUS_CHOICES, OUTBOX_ACTION_CHOICES
+from main.audit import AuditManager, UserManager, stamp
+from main.outbox import OutboxManager
+from main.ids import new_id
 
-from main.constants import QTY_UNIT_CHOICES, GENDER_CHOICES, ORDER_STATUS_CHOICES
+# Partial-index condition for the rows every live query filters on.
+LIVE = models.Q(is_archived=False)
+# ...and for the archived rows main.archive moves out of the hot tables.
+ARCHIVED = models.Q(is_archived=True)
 
 class BaseModel(models.Model): 
 
-    id = models.UUIDField(primary_key=True, default=uuid4) 
+    id = models.UUIDField(primary_key=True, default=new_id) 
     created_by = models.ForeignKey('User', on_delete=models.PROTECT, related_name='created_%(class)s', related_query_name='created_%(class)s') 
     updated_by = models.ForeignKey('User', on_delete=models.PROTECT, related_name='updated_%(class)s', related_query_name='updated_%(class)s')  
     created_at = models.DateTimeField(auto_now_add=True) 
     updated_at = models.DateTimeField(auto_now=True) 
     is_archived = models.BooleanField(default=False) 
 
+    objects = AuditManager()
+
     class Meta: 
         abstract = True
 
+    def save(self, *args, **kwargs):
+        stamp([self], created=self._state.adding)
+        super().save(*args, **kwargs)
+
 class User(BaseModel, AbstractUser): 
     date_joined = models.DateField(auto_now=True)
     gender = models.CharField(max_length=255, null=True, choices=GENDER_CHOICES) 
     birth_date = models.DateField(null=True)
 
+    objects = UserManager()
+
     class Meta: 
         db_table = 'user' 
     
@@ -58,20 +75,47 @@ class Material(BaseModel):
     supplier = models.ForeignKey(Supplier, on_delete=models.PROTECT) 
 
     class Meta: 
-        db_table = 'material' 
+        db_table = 'material'
+        indexes = [
+            models.Index(fields=['supplier'], condition=LIVE, name='material_supplier_live_idx'),
+        ]
 
     def __str__(self): 
         return self.name 
 
+class MaterialUnit(models.Model):
+    """How many of a material's own ``qty_unit`` one ``qty_unit`` of it makes.
+
+    A material bought by the kg but counted in pieces has a ``kg`` row with
+    the pieces per kg; ``main.units`` converts quantities with these.
+    """
+    material = models.ForeignKey(Material, on_delete=models.CASCADE, related_name='units')
+    qty_unit = models.CharField(max_length=255, choices=QTY_UNIT_CHOICES)
+    factor = models.DecimalField(max_digits=18, decimal_places=6)
+
+    class Meta:
+        db_table = 'materialunit'
+        constraints = [
+            models.UniqueConstraint(fields=['material', 'qty_unit'], name='materialunit_material_unit_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.material_id}: 1 {self.qty_unit} = {self.factor}'
+
 class Stock(BaseModel): 
     material = models.ForeignKey(Material, on_delete=models.PROTECT) 
-    quantity = models.IntegerField() 
+    quantity = models.DecimalField(max_digits=20, decimal_places=6) 
+
+    objects = OutboxManager()
 
     class Meta: 
-        db_table = 'stock' 
+        db_table = 'stock'
+        indexes = [
+            models.Index(fields=['material'], condition=LIVE, name='stock_material_live_idx'),
+        ]
     
     def __str__(self): 
-        return f'{self.mateiral} - {self.quantity}'
+        return f'{self.material} - {self.quantity}'
     
 
     
@@ -83,6 +127,9 @@ class Product(BaseModel):
     tax = models.FloatField() 
     qty_unit = models.CharField(max_length=255, choices=QTY_UNIT_CHOICES) 
     materials = models.ManyToManyField(Material, through='ProductMaterial') 
+    material_cost = models.FloatField(null=True)
+    material_tax = models.FloatField(null=True)
+    costed_at = models.DateTimeField(null=True)
 
     class Meta: 
         db_table = 'product' 
@@ -93,11 +140,16 @@ class Product(BaseModel):
 class ProductMaterial(BaseModel): 
     product = models.ForeignKey(Product, on_delete=models.PROTECT) 
     material = models.ForeignKey(Material, on_delete=models.PROTECT) 
-    quantity = models.IntegerField() 
+    # In the material's own unit, exact to a millionth like the ledger.
+    quantity = models.DecimalField(max_digits=20, decimal_places=6) 
     comment = models.TextField() 
 
     class Meta: 
-        db_table = 'productmaterial' 
+        db_table = 'productmaterial'
+        indexes = [
+            models.Index(fields=['product'], condition=LIVE, name='productmat_product_live_idx'),
+            models.Index(fields=['material'], condition=LIVE, name='productmat_material_live_idx'),
+        ]
         
     def __str__(self): 
         return f'{self.material} - {self.product}' 
@@ -105,15 +157,25 @@ class ProductMaterial(BaseModel):
 class Purchase(BaseModel): 
     supplier = models.ForeignKey(Supplier, on_delete=models.PROTECT) 
     material = models.ForeignKey(Material, on_delete=models.PROTECT) 
-    quantity = models.IntegerField(default=0) 
+    quantity = models.DecimalField(max_digits=20, decimal_places=6, default=0) 
     qty_unit = models.CharField(max_length=255, choices=QTY_UNIT_CHOICES, null=True) 
+    # ``quantity`` in the material's own unit, kept by main.units.
+    base_quantity = models.DecimalField(max_digits=20, decimal_places=6, null=True)
     requested_at = models.DateTimeField(null=True) 
     requested_user = models.ForeignKey(User, on_delete=models.PROTECT)
     arrived_at = models.DateTimeField(null=True) 
     is_arrived = models.DateTimeField(null=True) 
+    is_draft = models.BooleanField(default=False)
+
+    objects = OutboxManager()
 
     class Meta: 
-        db_table = 'purchase' 
+        db_table = 'purchase'
+        indexes = [
+            models.Index(fields=['supplier', 'arrived_at'], condition=LIVE, name='purchase_supplier_arr_live_idx'),
+            models.Index(fields=['material', 'arrived_at'], condition=LIVE, name='purchase_material_arr_live_idx'),
+            models.Index(fields=['created_at'], condition=ARCHIVED, name='purchase_archived_crt_idx'),
+        ]
 
     def __str__(self): 
         return f'{self.material} - {self.supplier}'
@@ -126,19 +188,31 @@ class Order(BaseModel):
     finished_at = models.DateTimeField(null=True) 
     comment = models.CharField(max_length=255, null=True) 
 
+    objects = OutboxManager()
+
     class Meta: 
-        db_table = 'order' 
+        db_table = 'order'
+        indexes = [
+            models.Index(fields=['order_status', 'requested_at'], condition=LIVE, name='order_status_req_live_idx'),
+            models.Index(fields=['client', 'requested_at'], condition=LIVE, name='order_client_req_live_idx'),
+        ]
 
     def __str__(self): 
         t = self.requested_at.strftime('%d:%m:%y')
         return f'{self.client} - {str(t)}'
     
 class OrderProduct(BaseModel): 
+    order = models.ForeignKey(Order, on_delete=models.PROTECT, null=True, related_name='order_products')
     product = models.ForeignKey(Product, on_delete=models.PROTECT)
     quantity = models.IntegerField() 
+    # ``Product.price`` when the line was created, filled in by main.summary.
+    unit_price = models.FloatField(null=True, blank=True)
 
     class Meta: 
-        db_table = 'orderproduct' 
+        db_table = 'orderproduct'
+        indexes = [
+            models.Index(fields=['order'], condition=LIVE, name='orderproduct_order_live_idx'),
+        ]
     
     def __str__(self): 
         return f'{self.product} - {str(self.quantity)}'
@@ -146,14 +220,296 @@ class OrderProduct(BaseModel):
 class MaterialConsumption(BaseModel): 
     order_product = models.ForeignKey(OrderProduct, on_delete=models.PROTECT) 
     material = models.ForeignKey(Material, on_delete=models.PROTECT) 
-    quantity = models.IntegerField() 
+    quantity = models.DecimalField(max_digits=20, decimal_places=6) 
     is_allocated = models.BooleanField(default=False) 
     comment = models.TextField() 
 
+    objects = OutboxManager()
+
     class Meta: 
-        db_table = 'materialconsumption' 
+        db_table = 'materialconsumption'
+        indexes = [
+            models.Index(fields=['material'], condition=LIVE, name='consumption_material_live_idx'),
+            models.Index(fields=['order_product'], condition=LIVE, name='consumption_op_live_idx'),
+            models.Index(fields=['created_at'], condition=ARCHIVED, name='consumption_archived_crt_idx'),
+        ]
 
     def __str__(self): 
         return f'{self.material} - {self.order_product}'
-    
 
+
+class ArchivedModel(models.Model):
+    """``BaseModel`` columns of a row moved out of its hot table by ``main.archive``.
+
+    Foreign keys keep their columns, so joins still work, but not their
+    constraints, so whatever they point at can be archived in turn.
+    """
+    id = models.UUIDField(primary_key=True)
+    created_by = models.ForeignKey('User', on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    updated_by = models.ForeignKey('User', on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    is_archived = models.BooleanField(default=True)
+
+    class Meta:
+        abstract = True
+
+
+class ArchivedPurchase(ArchivedModel):
+    supplier = models.ForeignKey(Supplier, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    material = models.ForeignKey(Material, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    quantity = models.DecimalField(max_digits=20, decimal_places=6, default=0)
+    qty_unit = models.CharField(max_length=255, choices=QTY_UNIT_CHOICES, null=True)
+    base_quantity = models.DecimalField(max_digits=20, decimal_places=6, null=True)
+    requested_at = models.DateTimeField(null=True)
+    requested_user = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    arrived_at = models.DateTimeField(null=True)
+    is_arrived = models.DateTimeField(null=True)
+    is_draft = models.BooleanField(default=False)
+
+    class Meta:
+        db_table = 'purchase_archive'
+        indexes = [
+            models.Index(fields=['created_at'], name='purchase_archive_created_idx'),
+            models.Index(fields=['material', 'arrived_at'], name='purchase_archive_mat_arr_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.material_id} - {self.supplier_id} (archived)'
+
+
+class ArchivedMaterialConsumption(ArchivedModel):
+    order_product = models.ForeignKey(OrderProduct, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    material = models.ForeignKey(Material, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    quantity = models.DecimalField(max_digits=20, decimal_places=6)
+    is_allocated = models.BooleanField(default=False)
+    comment = models.TextField()
+
+    class Meta:
+        db_table = 'materialconsumption_archive'
+        indexes = [
+            models.Index(fields=['created_at'], name='consumption_archive_crt_idx'),
+            models.Index(fields=['material'], name='consumption_archive_mat_idx'),
+            models.Index(fields=['order_product'], name='consumption_archive_op_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.material_id} - {self.order_product_id} (archived)'
+
+
+class StockMovement(BaseModel):
+    material = models.ForeignKey(Material, on_delete=models.PROTECT, related_name='movements')
+    movement_type = models.CharField(max_length=255, choices=MOVEMENT_TYPE_CHOICES)
+    on_hand_delta = models.DecimalField(max_digits=20, decimal_places=6, default=0)
+    reserved_delta = models.DecimalField(max_digits=20, decimal_places=6, default=0)
+    # Unconstrained so movements keep pointing at history moved to the
+    # archive tables by main.archive.
+    purchase = models.ForeignKey(Purchase, on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name='movements')
+    material_consumption = models.ForeignKey(MaterialConsumption, on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name='movements')
+    comment = models.TextField(blank=True, default='')
+
+    class Meta:
+        db_table = 'stockmovement'
+        constraints = [
+            # One receipt per purchase; later edits post any number of adjustments.
+            models.UniqueConstraint(
+                fields=['purchase'], condition=models.Q(movement_type='receipt'), name='stockmovement_purchase_receipt_uniq',
+            ),
+            # One reserve, allocate and release per consumption; edits post adjustments.
+            models.UniqueConstraint(
+                fields=['material_consumption', 'movement_type'], condition=~models.Q(movement_type='adjustment'),
+                name='stockmovement_consumption_type_uniq',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['created_at'], name='stockmovement_created_idx'),
+            models.Index(fields=['material', 'created_at'], name='stockmovement_mat_created_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.movement_type} {self.material_id} ({self.on_hand_delta:+}/{self.reserved_delta:+})'
+
+
+class StockBalance(models.Model):
+    """Running per-material balance maintained alongside ``StockMovement``.
+
+    Rows are only ever changed by ``main.ledger`` in the same transaction
+    that appends the movements, so reading one row answers how much of a
+    material is on hand, reserved and available. Quantities are in the
+    material's own unit, exact to a millionth like ``Purchase.base_quantity``.
+    Every change bumps ``version``, which ``main.reservations`` compares
+    and swaps on.
+    """
+    material = models.OneToOneField(Material, on_delete=models.PROTECT, primary_key=True, related_name='balance')
+    on_hand = models.DecimalField(max_digits=20, decimal_places=6, default=0)
+    reserved = models.DecimalField(max_digits=20, decimal_places=6, default=0)
+    version = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'stockbalance'
+
+    def __str__(self):
+        return f'{self.material_id} - {self.on_hand}/{self.reserved}'
+
+    @property
+    def available(self):
+        return self.on_hand - self.reserved
+
+
+class OrderSummary(models.Model):
+    """Order counts and values per status, client and day, kept by ``main.summary``."""
+    order_status = models.CharField(max_length=255, choices=ORDER_STATUS_CHOICES)
+    client = models.ForeignKey(Client, on_delete=models.PROTECT, related_name='order_summaries')
+    day = models.DateField()
+    order_count = models.IntegerField(default=0)
+    line_count = models.IntegerField(default=0)
+    units = models.IntegerField(default=0)
+    value = models.FloatField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'ordersummary'
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'order_status', 'client'], name='ordersummary_bucket_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.day} {self.order_status} {self.client_id}: {self.order_count}'
+
+
+class OrderSummaryEntry(models.Model):
+    """What one order currently contributes to ``OrderSummary``.
+
+    Keeping the last contribution per order lets a status change or edited
+    line move exactly that amount between buckets, and lets reconciliation
+    tell which orders drifted.
+    """
+    order = models.OneToOneField(Order, on_delete=models.CASCADE, primary_key=True, related_name='summary_entry')
+    order_status = models.CharField(max_length=255, choices=ORDER_STATUS_CHOICES)
+    client = models.ForeignKey(Client, on_delete=models.PROTECT, related_name='+')
+    day = models.DateField()
+    line_count = models.IntegerField(default=0)
+    units = models.IntegerField(default=0)
+    value = models.FloatField(default=0)
+
+    class Meta:
+        db_table = 'ordersummaryentry'
+
+    def __str__(self):
+        return f'{self.order_id} -> {self.day} {self.order_status}'
+
+
+class MaterialPlan(models.Model):
+    """Running demand and lead-time statistics per material, kept by ``main.planning``."""
+    material = models.OneToOneField(Material, on_delete=models.CASCADE, primary_key=True, related_name='plan')
+    demand_rate = models.FloatField(default=0)
+    demand_var = models.FloatField(default=0)
+    lead_time_days = models.FloatField(null=True)
+    reorder_point = models.FloatField(default=0)
+    through_date = models.DateField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'materialplan'
+
+    def __str__(self):
+        return f'{self.material_id}: {self.demand_rate:.2f}/day, reorder at {self.reorder_point:.0f}'
+
+
+
+class Job(models.Model):
+    """A unit of background work run by the ``run_jobs`` workers (see ``main.jobs``)."""
+    id = models.UUIDField(primary_key=True, default=new_id)
+    kind = models.CharField(max_length=255)
+    payload = models.JSONField(default=dict)
+    idempotency_key = models.CharField(max_length=255, null=True, unique=True)
+    status = models.CharField(max_length=255, choices=JOB_STATUS_CHOICES, default=JOB_STATUS_CHOICES[0][0])
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=255, null=True)
+    locked_at = models.DateTimeField(null=True)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True)
+
+    class Meta:
+        db_table = 'job'
+        indexes = [
+            models.Index(fields=['run_after'], condition=models.Q(status='queued'), name='job_queued_idx'),
+            models.Index(fields=['locked_at'], condition=models.Q(status='running'), name='job_running_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} {self.status} ({self.attempts}/{self.max_attempts})'
+
+
+class SearchEntry(models.Model):
+    """One searchable row of ``main.search.KINDS``, kept by ``main.search``.
+
+    ``vector`` is only filled on Postgres, where it and ``title`` have GIN
+    indexes (created by migration 0014, not declared here, so other
+    backends can create the table).
+    """
+    kind = models.CharField(max_length=16)
+    object_id = models.UUIDField()
+    title = models.CharField(max_length=255)
+    body = models.TextField(blank=True, default='')
+    vector = SearchVectorField(null=True)
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'searchentry'
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='searchentry_kind_object_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} {self.title}'
+
+
+class OutboxEvent(models.Model):
+    """One change to a row of a ``main.outbox.FIELDS`` model, appended in the transaction that made it.
+
+    ``seq`` is the sequence number consumers resume from. It is handed out
+    by ``main.feed`` once the event is committed, so it only ever grows in
+    the order events become visible; ``id`` is just insertion order.
+    """
+    id = models.BigAutoField(primary_key=True)
+    seq = models.BigIntegerField(null=True, unique=True)
+    kind = models.CharField(max_length=32)
+    object_id = models.UUIDField()
+    action = models.CharField(max_length=16, choices=OUTBOX_ACTION_CHOICES)
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'outboxevent'
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(seq__isnull=True), name='outboxevent_pending_idx'),
+            models.Index(fields=['kind', 'object_id', 'id'], name='outboxevent_object_idx'),
+            models.Index(fields=['created_at'], name='outboxevent_created_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.seq} {self.kind} {self.object_id} {self.action}'
+
+
+class StockSnapshot(models.Model):
+    """Every material's ledger balance as of ``taken_at``, kept by ``main.snapshots``.
+
+    ``balances`` is one zlib-compressed NumPy array of (material id, on
+    hand, reserved) sorted by material id, so a snapshot is a single row
+    however many materials there are.
+    """
+    taken_at = models.DateTimeField(unique=True)
+    material_count = models.PositiveIntegerField(default=0)
+    balances = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'stocksnapshot'
+
+    def __str__(self):
+        return f'{self.taken_at:%Y-%m-%d %H:%M}: {self.material_count} materials'
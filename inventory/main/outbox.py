@@ -0,0 +1,120 @@
+"""Change events for stock, orders, purchases and consumption, written with the change.
+
+Consumers used to poll those tables on ``updated_at``, which isn't indexed
+and doesn't order changes made in the same instant. Instead, every create,
+update or archive of a row of a ``FIELDS`` model appends an
+``OutboxEvent`` - its kind, id, action and a compact payload of the
+columns consumers care about - in the same transaction, so an event exists
+exactly when its change was committed. ``main.feed`` numbers them once
+committed, reads them back by sequence number and compacts them.
+
+``OutboxQuerySet`` is the manager of those models and records events for
+``bulk_create``, ``update`` and ``bulk_update`` (which goes through
+``update``) with one extra read and one insert per ``BATCH_SIZE`` rows; single
+``save`` calls are recorded by a ``post_save`` signal. Deletes aren't
+recorded: rows are archived, and only ``main.archive`` deletes them, after
+their archiving was recorded.
+"""
+from django.apps import apps
+from django.db import models, transaction
+
+from main.audit import AuditQuerySet
+
+# Payload columns per model, besides ``is_archived``.
+FIELDS = {
+    'stock': ('material_id', 'quantity'),
+    'order': ('client_id', 'order_status', 'requested_at', 'finished_at'),
+    'purchase': ('supplier_id', 'material_id', 'quantity', 'qty_unit', 'base_quantity', 'arrived_at', 'is_draft'),
+    'materialconsumption': ('order_product_id', 'material_id', 'quantity', 'is_allocated'),
+}
+BATCH_SIZE = 1000
+
+
+def kind_of(model):
+    return model._meta.model_name
+
+
+def tracked(model):
+    return kind_of(model) in FIELDS
+
+
+def _action(created, is_archived):
+    if is_archived:
+        return 'archived'
+    return 'created' if created else 'updated'
+
+
+def _write(using, events):
+    OutboxEvent = apps.get_model('main', 'OutboxEvent')
+    OutboxEvent.objects.using(using).bulk_create(
+        [OutboxEvent(kind=kind, object_id=pk, action=action, payload=payload)
+         for kind, pk, action, payload in events],
+        batch_size=BATCH_SIZE,
+    )
+    return len(events)
+
+
+def record(objs, created=False, using='default'):
+    """Append an event for each saved instance in ``objs`` (of one model) from its attributes."""
+    objs = list(objs)
+    if not objs:
+        return 0
+    kind = kind_of(type(objs[0]))
+    fields = FIELDS[kind]
+    return _write(using, [
+        (kind, obj.pk, _action(created, obj.is_archived),
+         {'is_archived': obj.is_archived, **{name: getattr(obj, name) for name in fields}})
+        for obj in objs
+    ])
+
+
+def record_ids(model, ids, created=False, using='default'):
+    """Append an event for each row of ``model`` in ``ids``, reading their current values."""
+    kind = kind_of(model)
+    fields = FIELDS[kind]
+    ids = list(ids)
+    count = 0
+    for start in range(0, len(ids), BATCH_SIZE):
+        rows = model._base_manager.using(using).filter(pk__in=ids[start:start + BATCH_SIZE]).values(
+            'pk', 'is_archived', *fields,
+        )
+        count += _write(using, [
+            (kind, row.pop('pk'), _action(created, row['is_archived']), row) for row in rows
+        ])
+    return count
+
+
+class OutboxQuerySet(AuditQuerySet):
+
+    def bulk_create(self, objs, *args, **kwargs):
+        with transaction.atomic(using=self.db, savepoint=False):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            record(objs, created=not kwargs.get('update_conflicts'), using=self.db)
+        return objs
+
+    def update(self, **kwargs):
+        """Update the rows in primary-key ranges of ``BATCH_SIZE``, recording each range's events.
+
+        Each range is read from the index with a keyset (``pk > last``), so
+        no statement carries more than ``BATCH_SIZE`` ids however many rows
+        match.
+        """
+        rows = 0
+        last = None
+        with transaction.atomic(using=self.db, savepoint=False):
+            while True:
+                matching = self.order_by('pk')
+                if last is not None:
+                    matching = matching.filter(pk__gt=last)
+                ids = list(matching.values_list('pk', flat=True)[:BATCH_SIZE])
+                if not ids:
+                    return rows
+                rows += super(OutboxQuerySet, self.filter(pk__in=ids)).update(**kwargs)
+                record_ids(self.model, ids, using=self.db)
+                last = ids[-1]
+
+    update.alters_data = True
+
+
+class OutboxManager(models.Manager.from_queryset(OutboxQuerySet)):
+    pass
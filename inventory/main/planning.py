@@ -0,0 +1,308 @@
+"""Reorder points and draft purchases from consumption history.
+
+For every live material ``MaterialPlan`` keeps an exponentially weighted
+daily demand rate and variance, an exponentially weighted supplier lead
+time and the last day folded into them (``through_date``, the watermark).
+A run only reads consumptions and arrivals after each material's watermark
+and up to yesterday, so the nightly job touches one day of history instead
+of rescanning everything; the first run for a material starts
+``history_days`` back, reading the history of the new materials only.
+
+Demand is aggregated per material and day in SQL and then folded in one
+day at a time as a NumPy vector across all materials, so a run over tens of
+thousands of materials is a few hundred vector updates. The reorder point
+is the expected demand over the lead time plus ``z`` standard deviations::
+
+    reorder_point = rate * lead_time + z * sqrt(var * lead_time)
+
+When stock on hand minus reservations plus open purchases (drafts included,
+so reruns don't double up) falls below it, a draft ``Purchase`` is raised
+for enough to cover the reorder point plus ``review_days`` of demand.
+"""
+import datetime
+import math
+from collections import defaultdict
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from main import units
+from main.models import Material, MaterialConsumption, MaterialPlan, Purchase, StockBalance
+
+DEMAND_HALF_LIFE_DAYS = 28
+LEAD_TIME_HALF_LIFE = 5
+DEFAULT_LEAD_TIME_DAYS = 7.0
+
+
+def smoothing(half_life):
+    """EWMA weight giving an observation ``half_life`` steps old half the weight of a new one."""
+    return 1 - 0.5 ** (1 / half_life)
+
+
+@dataclass
+class Plan:
+    material_ids: list
+    supplier_ids: list
+    qty_units: list
+    rate: np.ndarray
+    var: np.ndarray
+    lead_time: np.ndarray
+    reorder_point: np.ndarray
+    position: np.ndarray
+    suggested: np.ndarray
+    through_date: datetime.date
+    days_folded: int = 0
+    drafts: dict = field(default_factory=dict)
+
+    def suggestions(self):
+        """``{supplier_id: [(material_id, quantity, qty_unit), ...]}`` of the suggested orders."""
+        grouped = defaultdict(list)
+        for i in np.flatnonzero(self.suggested > 0).tolist():
+            grouped[self.supplier_ids[i]].append((self.material_ids[i], int(self.suggested[i]), self.qty_units[i]))
+        return dict(grouped)
+
+
+def daily_demand(start, through, material_index, material_ids=None):
+    """``{day: (material positions, quantities)}`` of live consumption after ``start``.
+
+    With ``material_ids`` only those materials are read.
+    """
+    rows = MaterialConsumption.objects.filter(
+        is_archived=False, created_at__date__gt=start, created_at__date__lte=through,
+    )
+    if material_ids is not None:
+        rows = rows.filter(material_id__in=material_ids)
+    rows = (
+        rows
+        .annotate(day=TruncDate('created_at'))
+        .values('day', 'material_id')
+        .annotate(quantity=Sum('quantity'))
+        .order_by()
+    )
+    days = defaultdict(lambda: ([], []))
+    for row in rows.iterator(chunk_size=10000):
+        i = material_index.get(row['material_id'])
+        if i is None:
+            continue
+        positions, quantities = days[row['day']]
+        positions.append(i)
+        quantities.append(row['quantity'])
+    return {day: (np.array(p, dtype=np.int64), np.array(q, dtype=float)) for day, (p, q) in days.items()}
+
+
+def fold_demand(rate, var, watermark, demand, start, through, half_life=DEMAND_HALF_LIFE_DAYS):
+    """Fold each day after ``start`` into the running rate and variance, in place.
+
+    Days with no consumption count as zero demand; a material only takes
+    days after its own ``watermark`` (an array of date ordinals).
+    Returns the number of days folded.
+    """
+    alpha = smoothing(half_life)
+    empty = (np.empty(0, dtype=np.int64), np.empty(0))
+    days = 0
+    for ordinal in range(start.toordinal() + 1, through.toordinal() + 1):
+        positions, quantities = demand.get(datetime.date.fromordinal(ordinal), empty)
+        x = np.zeros_like(rate)
+        x[positions] = quantities
+        live = watermark < ordinal
+        diff = x - rate
+        step = alpha * diff
+        rate += np.where(live, step, 0.0)
+        var[:] = np.where(live, (1 - alpha) * (var + diff * step), var)
+        days += 1
+    return days
+
+
+def fold_lead_times(lead_time, watermark, material_index, start, through, half_life=LEAD_TIME_HALF_LIFE,
+                    material_ids=None):
+    """Blend lead times of purchases that arrived after each watermark into ``lead_time``, in place.
+
+    A material's new arrivals are averaged and weighted as ``n`` EWMA steps,
+    ``1 - (1 - alpha) ** n``; materials without a lead time yet take the
+    average as is. With ``material_ids`` only those materials are read.
+    """
+    purchases = Purchase.objects.filter(
+        is_archived=False, is_draft=False, requested_at__isnull=False,
+        arrived_at__date__gt=start, arrived_at__date__lte=through,
+    )
+    if material_ids is not None:
+        purchases = purchases.filter(material_id__in=material_ids)
+    purchases = purchases.values_list('material_id', 'requested_at', 'arrived_at')
+    positions, samples = [], []
+    for material_id, requested_at, arrived_at in purchases.iterator(chunk_size=10000):
+        i = material_index.get(material_id)
+        if i is None or timezone.localtime(arrived_at).date().toordinal() <= watermark[i]:
+            continue
+        positions.append(i)
+        samples.append(max((arrived_at - requested_at).total_seconds(), 0) / 86400)
+    if not positions:
+        return
+    n = len(lead_time)
+    count = np.bincount(positions, minlength=n)
+    total = np.bincount(positions, weights=samples, minlength=n)
+    seen = count > 0
+    mean = np.divide(total, count, out=np.zeros(n), where=seen)
+    weight = 1 - (1 - smoothing(half_life)) ** count
+    known = ~np.isnan(lead_time)
+    lead_time[seen & known] += weight[seen & known] * (mean[seen & known] - lead_time[seen & known])
+    lead_time[seen & ~known] = mean[seen & ~known]
+
+
+def effective_lead_times(lead_time, supplier_positions, default=DEFAULT_LEAD_TIME_DAYS):
+    """Fill unknown lead times with the supplier's average, then ``default``."""
+    known = ~np.isnan(lead_time)
+    suppliers = supplier_positions.max() + 1 if len(supplier_positions) else 0
+    count = np.bincount(supplier_positions[known], minlength=suppliers)
+    total = np.bincount(supplier_positions[known], weights=lead_time[known], minlength=suppliers)
+    supplier_mean = np.divide(total, count, out=np.full(suppliers, default), where=count > 0)
+    return np.where(known, lead_time, supplier_mean[supplier_positions] if suppliers else default)
+
+
+def stock_positions(material_ids):
+    """Available stock plus open purchases per material, in its own unit, as an array.
+
+    Purchases count by ``base_quantity``; rows not stamped yet are
+    converted in the same query (``main.units``), and those that can't be
+    are left out rather than added in the wrong unit.
+    """
+    index = {material_id: i for i, material_id in enumerate(material_ids)}
+    position = np.zeros(len(material_ids))
+    for material_id, on_hand, reserved in StockBalance.objects.values_list('material_id', 'on_hand', 'reserved'):
+        if material_id in index:
+            position[index[material_id]] += float(on_hand - reserved)
+    open_purchases = (
+        Purchase.objects.filter(is_archived=False, arrived_at__isnull=True)
+        .values('material_id').annotate(quantity=Sum(Coalesce('base_quantity', units.base_quantity()))).order_by()
+    )
+    for row in open_purchases:
+        if row['material_id'] in index:
+            position[index[row['material_id']]] += float(row['quantity'] or 0)
+    return position
+
+
+def plan(z=1.65, review_days=7, history_days=365, today=None):
+    """Compute a ``Plan`` for every live material without writing anything."""
+    today = today or timezone.localdate()
+    through = today - datetime.timedelta(days=1)
+    materials = list(
+        Material.objects.filter(is_archived=False).order_by('pk').values_list('pk', 'supplier_id', 'qty_unit')
+    )
+    material_ids = [pk for pk, _, _ in materials]
+    supplier_ids = [supplier_id for _, supplier_id, _ in materials]
+    material_index = {pk: i for i, pk in enumerate(material_ids)}
+    supplier_index = {}
+    supplier_positions = np.array([supplier_index.setdefault(s, len(supplier_index)) for s in supplier_ids], dtype=np.int64)
+
+    n = len(material_ids)
+    rate, var = np.zeros(n), np.zeros(n)
+    lead_time = np.full(n, np.nan)
+    first_day = (through - datetime.timedelta(days=history_days)).toordinal()
+    watermark = np.full(n, first_day, dtype=np.int64)
+    planned = np.zeros(n, dtype=bool)
+    for p in MaterialPlan.objects.filter(material_id__in=material_ids).iterator(chunk_size=10000):
+        i = material_index[p.material_id]
+        rate[i], var[i] = p.demand_rate, p.demand_var
+        lead_time[i] = np.nan if p.lead_time_days is None else p.lead_time_days
+        watermark[i] = p.through_date.toordinal()
+        planned[i] = True
+
+    # Materials planned before only need the days since their watermark;
+    # new ones need the whole history, read for just them (when there are
+    # planned ones too) so one new material doesn't make every other one
+    # rescan it. Rows of materials outside a group are skipped.
+    days = 0
+    for group, filtered in ((np.flatnonzero(planned), False), (np.flatnonzero(~planned), planned.any())):
+        if not len(group):
+            continue
+        start = datetime.date.fromordinal(int(watermark[group].min()))
+        if start >= through:
+            continue
+        group_ids = [material_ids[i] for i in group.tolist()]
+        group_index = {material_id: j for j, material_id in enumerate(group_ids)}
+        only = group_ids if filtered else None
+        group_rate, group_var, group_lead_time = rate[group], var[group], lead_time[group]
+        demand = daily_demand(start, through, group_index, only)
+        days = max(days, fold_demand(group_rate, group_var, watermark[group], demand, start, through))
+        fold_lead_times(group_lead_time, watermark[group], group_index, start, through, material_ids=only)
+        rate[group], var[group], lead_time[group] = group_rate, group_var, group_lead_time
+
+    lead = effective_lead_times(lead_time, supplier_positions)
+    reorder_point = rate * lead + z * np.sqrt(np.maximum(var, 0) * lead)
+    position = stock_positions(material_ids)
+    suggested = np.where(
+        (position < reorder_point) & (rate > 0),
+        np.ceil(reorder_point + rate * review_days - position),
+        0,
+    ).astype(np.int64)
+    return Plan(
+        material_ids=material_ids,
+        supplier_ids=supplier_ids,
+        qty_units=[qty_unit for _, _, qty_unit in materials],
+        rate=rate,
+        var=var,
+        lead_time=lead_time,
+        reorder_point=reorder_point,
+        position=position,
+        suggested=suggested,
+        through_date=through,
+        days_folded=days,
+    )
+
+
+def save(result, user, batch_size=1000):
+    """Store the statistics and raise the suggested draft purchases, grouped by supplier."""
+    now = timezone.now()
+    existing = set(
+        MaterialPlan.objects.filter(material_id__in=result.material_ids).values_list('material_id', flat=True)
+    )
+    plans = [
+        MaterialPlan(
+            material_id=material_id,
+            demand_rate=rate,
+            demand_var=var,
+            lead_time_days=None if math.isnan(lead_time) else lead_time,
+            reorder_point=reorder_point,
+            through_date=result.through_date,
+            updated_at=now,
+        )
+        for material_id, rate, var, lead_time, reorder_point in zip(
+            result.material_ids, result.rate.tolist(), result.var.tolist(),
+            result.lead_time.tolist(), result.reorder_point.tolist(),
+        )
+    ]
+    drafts = {
+        supplier_id: [
+            Purchase(
+                supplier_id=supplier_id,
+                material_id=material_id,
+                quantity=quantity,
+                qty_unit=qty_unit,
+                requested_user=user,
+                is_draft=True,
+                created_by=user,
+                updated_by=user,
+            )
+            for material_id, quantity, qty_unit in lines
+        ]
+        for supplier_id, lines in result.suggestions().items()
+    }
+    # Suggestions are in each material's own unit: every factor is 1.
+    units.stamp(
+        (p for lines in drafts.values() for p in lines),
+        table={(m, qty_unit): Decimal(1) for m, qty_unit in zip(result.material_ids, result.qty_units)},
+    )
+    with transaction.atomic():
+        MaterialPlan.objects.bulk_update(
+            [p for p in plans if p.material_id in existing],
+            ['demand_rate', 'demand_var', 'lead_time_days', 'reorder_point', 'through_date', 'updated_at'],
+            batch_size=batch_size,
+        )
+        MaterialPlan.objects.bulk_create([p for p in plans if p.material_id not in existing], batch_size=batch_size)
+        Purchase.objects.bulk_create([p for lines in drafts.values() for p in lines], batch_size=batch_size)
+    result.drafts = drafts
+    return drafts
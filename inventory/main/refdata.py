@@ -0,0 +1,190 @@
+"""Read-through cache for reference data: suppliers, materials and clients.
+
+These tables change rarely but are read on nearly every operation, mostly
+to render a name or a unit next to a row that only holds the foreign key.
+``get_many`` answers by primary key from two tiers, like ``main.bom``:
+
+* a bounded in-process LRU holding each row's field values;
+* the shared Django cache (``settings.REFERENCE_CACHE['ALIAS']``) holding
+  the same values.
+
+Both tiers are keyed by a per-row version token stored in the shared
+cache. ``invalidate`` (wired to ``post_save``/``post_delete`` in
+``main.signals``, so saving a row with ``is_archived=True`` counts) replaces
+the token, so every process sees the change on its next lookup. Code that
+changes these tables with ``QuerySet.update`` bypasses the signals and must
+call ``invalidate`` itself.
+
+``attach`` fills the foreign-key caches of a list of instances from here,
+so ``stock.material`` or ``str(purchase)`` costs no query.
+"""
+import threading
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import router
+
+from main.models import Client, Material, Supplier
+
+MODELS = (Supplier, Material, Client)
+
+_lock = threading.Lock()
+_local = OrderedDict()
+_stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0, 'invalidations': 0}
+
+
+def _config():
+    config = {'ALIAS': 'default', 'LOCAL_MAX_ENTRIES': 50000, 'TIMEOUT': 24 * 60 * 60}
+    config.update(getattr(settings, 'REFERENCE_CACHE', {}))
+    return config
+
+
+def _cache():
+    return caches[_config()['ALIAS']]
+
+
+def _label(model):
+    if model not in MODELS:
+        raise ValueError(f'{model.__name__} is not cached reference data.')
+    return model._meta.model_name
+
+
+def _version_key(label, pk):
+    return f'ref:ver:{label}:{pk}'
+
+
+def _data_key(label, pk, version):
+    return f'ref:{label}:{pk}:{version}'
+
+
+def _attnames(model):
+    return [field.attname for field in model._meta.concrete_fields]
+
+
+def _count(name, n=1):
+    if n:
+        with _lock:
+            _stats[name] += n
+
+
+def stats():
+    """Return a snapshot of the hit/miss counters."""
+    with _lock:
+        return dict(_stats, local_entries=len(_local))
+
+
+def reset_stats():
+    with _lock:
+        for name in _stats:
+            _stats[name] = 0
+
+
+def clear_local():
+    with _lock:
+        _local.clear()
+
+
+def load(model, pks):
+    """``{pk: values}`` for ``pks`` straight from the database, archived rows included."""
+    attnames = _attnames(model)
+    rows = model.objects.filter(pk__in=pks).values_list(*attnames)
+    pk_index = attnames.index(model._meta.pk.attname)
+    return {row[pk_index]: row for row in rows}
+
+
+def get_many(model, pks):
+    """Return ``{pk: instance}`` for the rows of ``model`` in ``pks`` that exist."""
+    label = _label(model)
+    pks = list(dict.fromkeys(pk for pk in pks if pk is not None))
+    if not pks:
+        return {}
+    config = _config()
+    cache = _cache()
+    versions = cache.get_many([_version_key(label, pk) for pk in pks])
+    values = {}
+    wanted = {}
+    with _lock:
+        for pk in pks:
+            version = versions.get(_version_key(label, pk))
+            entry = _local.get((label, pk))
+            if version is not None and entry is not None and entry[0] == version:
+                _local.move_to_end((label, pk))
+                values[pk] = entry[1]
+            elif version is not None:
+                wanted[_data_key(label, pk, version)] = (pk, version)
+    _count('local_hits', len(values))
+
+    shared = cache.get_many(list(wanted)) if wanted else {}
+    fresh = {}
+    for key, row in shared.items():
+        pk, version = wanted[key]
+        fresh[pk] = (version, row)
+    _count('shared_hits', len(fresh))
+
+    missing = [pk for pk in pks if pk not in values and pk not in fresh]
+    _count('misses', len(missing))
+    if missing:
+        loaded = load(model, missing)
+        to_store = {}
+        for pk, row in loaded.items():
+            version = versions.get(_version_key(label, pk))
+            if version is None:
+                version = uuid.uuid4().hex
+                if not cache.add(_version_key(label, pk), version, timeout=None):
+                    # Invalidated since we looked: the row we read may
+                    # already be stale, so serve it without caching it.
+                    values[pk] = row
+                    continue
+            fresh[pk] = (version, row)
+            to_store[_data_key(label, pk, version)] = row
+        cache.set_many(to_store, timeout=config['TIMEOUT'])
+
+    with _lock:
+        for pk, entry in fresh.items():
+            _local[(label, pk)] = entry
+            _local.move_to_end((label, pk))
+            values[pk] = entry[1]
+        while len(_local) > config['LOCAL_MAX_ENTRIES']:
+            _local.popitem(last=False)
+
+    db = router.db_for_read(model)
+    attnames = _attnames(model)
+    return {pk: model.from_db(db, attnames, row) for pk, row in values.items()}
+
+
+def get(model, pk):
+    try:
+        return get_many(model, [pk])[pk]
+    except KeyError:
+        raise model.DoesNotExist(f'{model.__name__} {pk} does not exist.')
+
+
+def attach(instances, *fields):
+    """Set the cached related object of foreign keys ``fields`` on ``instances``."""
+    instances = list(instances)
+    if not instances:
+        return instances
+    for name in fields:
+        field = instances[0]._meta.get_field(name)
+        pending = [obj for obj in instances if not field.is_cached(obj)]
+        related = get_many(field.related_model, [getattr(obj, field.attname) for obj in pending])
+        for obj in pending:
+            target = related.get(getattr(obj, field.attname))
+            if target is not None:
+                field.set_cached_value(obj, target)
+    return instances
+
+
+def invalidate(model, pks):
+    """Drop the cached rows of ``model`` in ``pks`` in every process."""
+    label = _label(model)
+    pks = list(pks)
+    if not pks:
+        return
+    _cache().set_many({_version_key(label, pk): uuid.uuid4().hex for pk in pks}, timeout=None)
+    with _lock:
+        for pk in pks:
+            _local.pop((label, pk), None)
+    _count('invalidations', len(pks))
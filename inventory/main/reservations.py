@@ -0,0 +1,146 @@
+"""Optimistic stock reservations.
+
+``reserve`` reads the ``StockBalance`` rows it needs outside any
+transaction, checks availability in memory and then moves every material in
+a single compare-and-swap statement, the first of a short write
+transaction that only adds the ledger movements after it::
+
+    UPDATE stockbalance
+       SET reserved = reserved + CASE material_id WHEN ... END,
+           version = version + 1
+     WHERE (material_id = %s AND version = %s) OR ...
+
+If another writer got there first, fewer rows match than were asked for;
+the transaction is rolled back and the attempt is retried after a short,
+jittered, exponentially growing pause. Nothing is held between the read and
+the write, so operators reserving different materials never wait on each
+other, and all materials of one call are reserved or none are.
+
+``reserve_locking`` does the same through ``select_for_update`` and serves
+as the baseline for the ``stress_reservations`` command.
+"""
+import random
+import time
+from collections import Counter
+
+from django.db import OperationalError, transaction
+from django.db.models import Case, DecimalField, F, Q, Value, When
+
+from main import ledger
+from main.models import StockBalance, StockMovement
+
+
+class InsufficientStock(Exception):
+
+    def __init__(self, short):
+        self.short = short
+        super().__init__(f'insufficient stock: {short}')
+
+
+class ReservationConflict(Exception):
+    pass
+
+
+def _quantities(quantities):
+    totals = Counter()
+    for material_id, quantity in (quantities.items() if isinstance(quantities, dict) else quantities):
+        totals[material_id] += quantity
+    if any(q <= 0 for q in totals.values()):
+        raise ValueError('Quantities must be positive.')
+    return dict(totals)
+
+
+def _movements(quantities, movement_type, sign, user, comment):
+    return [
+        StockMovement(
+            material_id=material_id,
+            movement_type=movement_type,
+            reserved_delta=sign * quantity,
+            comment=comment,
+            created_by=user,
+            updated_by=user,
+        )
+        for material_id, quantity in sorted(quantities.items())
+    ]
+
+
+def compare_and_swap(balances, reserved_deltas):
+    """Add ``reserved_deltas`` to rows still at the version read in ``balances``.
+
+    Returns True when every row matched; the caller must roll back otherwise.
+    """
+    matches = Q()
+    for material_id in reserved_deltas:
+        matches |= Q(material_id=material_id, version=balances[material_id].version)
+    updated = StockBalance.objects.filter(matches).update(
+        reserved=F('reserved') + Case(
+            *[When(material_id=m, then=Value(d)) for m, d in reserved_deltas.items()],
+            default=Value(0), output_field=DecimalField(max_digits=20, decimal_places=6),
+        ),
+        version=F('version') + 1,
+    )
+    return updated == len(reserved_deltas)
+
+
+def _swap(quantities, sign, check, movement_type, user, comment, attempts, backoff, max_backoff):
+    quantities = _quantities(quantities)
+    if not quantities:
+        return []
+    StockBalance.objects.bulk_create(
+        [StockBalance(material_id=material_id) for material_id in quantities], ignore_conflicts=True,
+    )
+    delay = backoff
+    for attempt in range(attempts):
+        balances = {b.material_id: b for b in StockBalance.objects.filter(material_id__in=quantities)}
+        short = check(balances, quantities)
+        if short:
+            raise InsufficientStock(short)
+        try:
+            with transaction.atomic():
+                if compare_and_swap(balances, {m: sign * q for m, q in quantities.items()}):
+                    return StockMovement.objects.bulk_create(_movements(quantities, movement_type, sign, user, comment))
+                transaction.set_rollback(True)
+        except OperationalError:
+            # Deadlock, serialization failure or a locked SQLite file: the
+            # statement lost the race like a version mismatch would.
+            if attempt == attempts - 1:
+                raise
+        if attempt == attempts - 1:
+            break
+        time.sleep(random.uniform(0, delay))
+        delay = min(delay * 2, max_backoff)
+    raise ReservationConflict(f'gave up after {attempts} attempts on {sorted(quantities)}')
+
+
+def _short_available(balances, quantities):
+    return {m: q - balances[m].available for m, q in quantities.items() if q > balances[m].available}
+
+
+def _short_reserved(balances, quantities):
+    return {m: q - balances[m].reserved for m, q in quantities.items() if q > balances[m].reserved}
+
+
+def reserve(quantities, user, comment='', attempts=10, backoff=0.002, max_backoff=0.1):
+    """Atomically reserve ``{material_id: quantity}``; returns the ledger movements.
+
+    Raises ``InsufficientStock`` (with the missing quantity per material)
+    without reserving anything, or ``ReservationConflict`` when every attempt
+    lost the race to other writers.
+    """
+    return _swap(quantities, 1, _short_available, 'reserve', user, comment, attempts, backoff, max_backoff)
+
+
+def release(quantities, user, comment='', attempts=10, backoff=0.002, max_backoff=0.1):
+    """Give back reservations made with ``reserve``."""
+    return _swap(quantities, -1, _short_reserved, 'release', user, comment, attempts, backoff, max_backoff)
+
+
+def reserve_locking(quantities, user, comment=''):
+    """``reserve`` with pessimistic row locks instead of versions."""
+    quantities = _quantities(quantities)
+    with transaction.atomic():
+        balances = ledger.lock_balances(quantities)
+        short = _short_available(balances, quantities)
+        if short:
+            raise InsufficientStock(short)
+        return ledger.post_movements(_movements(quantities, 'reserve', 1, user, comment))
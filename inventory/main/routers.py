@@ -0,0 +1,119 @@
+"""Send reporting reads to a read replica, and everything else to the primary.
+
+Reads go to the replica only inside ``replica_reads()`` - the reports,
+exports, search and dashboards, which are read-only and can stand a
+replica's lag - and only while ``settings.REPLICA_DATABASE`` names a
+configured alias. Everything else reads from the primary, as before.
+
+Once anything has been written in the current request (or ``pinned()``
+scope), reads stick to the primary for the rest of it, so a request never
+reads a replica that hasn't caught up with its own write. Reads inside a
+transaction on the primary stay there too.
+
+``PinningMiddleware`` opens a scope per request; management commands can
+open their own with ``pinned()``. Both work with threads and async views
+since the state is held in a context variable.
+
+Locally, point ``DB_REPLICA_NAME`` at a second SQLite file (or a second
+Postgres database) that is a copy of the first.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from main.middleware import ScopedMiddleware
+
+_state = ContextVar('replica_routing', default=None)
+
+
+def replica_alias():
+    alias = getattr(settings, 'REPLICA_DATABASE', None)
+    return alias if alias in settings.DATABASES else None
+
+
+class _Scope:
+
+    def __init__(self):
+        self.reads = 0
+        self.wrote = False
+
+
+@contextmanager
+def pinned():
+    """A fresh scope: reads stick to the primary after the first write in it."""
+    token = _state.set(_Scope())
+    try:
+        yield
+    finally:
+        _state.reset(token)
+
+
+@contextmanager
+def replica_reads():
+    """Let reads in this block go to the replica (until something is written)."""
+    scope = _state.get()
+    if scope is None:
+        with pinned():
+            with replica_reads():
+                yield
+        return
+    scope.reads += 1
+    try:
+        yield
+    finally:
+        scope.reads -= 1
+
+
+def reading_replica(func):
+    """Decorator running ``func`` (a view or method) inside ``replica_reads()``."""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with replica_reads():
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def from_replica(iterable):
+    """Iterate ``iterable`` inside ``replica_reads()``, for streamed responses consumed after the view returns."""
+    with replica_reads():
+        yield from iterable
+
+
+def wrote():
+    """Whether the current scope has written (and so reads from the primary)."""
+    scope = _state.get()
+    return scope is not None and scope.wrote
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        alias = replica_alias()
+        scope = _state.get()
+        if alias is None or scope is None or not scope.reads or scope.wrote:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        scope = _state.get()
+        if scope is not None:
+            scope.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, replica_alias()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+
+class PinningMiddleware(ScopedMiddleware):
+    """Give every request its own routing scope."""
+
+    def scope(self, request):
+        return pinned()
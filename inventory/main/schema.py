@@ -0,0 +1,45 @@
+"""Migration operations shared by ``main.migrations``."""
+from django.db import migrations
+
+
+class AddIndexConcurrently(migrations.AddIndex):
+    """``AddIndex`` that builds with ``CREATE INDEX CONCURRENTLY`` on Postgres.
+
+    The live tables are too large to hold a write lock while an index is
+    built. Other backends fall back to a plain ``CREATE INDEX`` so the
+    migration still runs against SQLite. Migrations using it must set
+    ``atomic = False``.
+    """
+
+    def _concurrently(self, schema_editor):
+        return schema_editor.connection.vendor == 'postgresql'
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
+        if self._concurrently(schema_editor):
+            schema_editor.add_index(model, self.index, concurrently=True)
+        else:
+            schema_editor.add_index(model, self.index)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
+        if self._concurrently(schema_editor):
+            schema_editor.remove_index(model, self.index, concurrently=True)
+        else:
+            schema_editor.remove_index(model, self.index)
+
+
+class PostgresSQL(migrations.RunSQL):
+    """``RunSQL`` for Postgres-only schema (extensions, GIN indexes); a no-op elsewhere."""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
@@ -0,0 +1,266 @@
+"""Ranked search over materials, products, suppliers and clients.
+
+Every live row of the searchable models has a ``SearchEntry``: its kind,
+id, a title (the name) and a body (description or e-mail). ``search``
+queries that one table, so results of every kind are ranked against each
+other by one query, and ``icontains`` scans over four tables never happen.
+
+On Postgres the entry carries a ``tsvector`` of the title (weight A) and
+body (weight B) with a GIN index, and the title has a ``pg_trgm`` GIN
+index. A query matches an entry when every word is a prefix of one of its
+words (``word:*`` against the vector), or when it is word-similar to the
+title (``<%``), which catches typos. Both predicates are answered from the
+indexes and OR-ed in one bitmap scan; the rank is ``ts_rank`` plus the
+trigram word similarity and only the top ``limit`` are sorted out, which
+is what keeps type-ahead in the low milliseconds on millions of rows.
+
+Other backends (the SQLite test setup) get the same behaviour from
+``InvertedIndex``, a pure-Python index built from the table and rebuilt
+whenever the table's fingerprint (row count, last update) changes.
+
+Entries are kept up to date by signals on save and delete; ``index`` and
+``rebuild`` do it in bulk for ``bulk_create`` paths and the
+``search_index`` command.
+"""
+import bisect
+import re
+import threading
+from collections import defaultdict
+from dataclasses import dataclass
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity
+from django.db import connection
+from django.db.models import BooleanField, Count, F, Func, Max, Q, Value
+from django.utils import timezone
+
+from main.models import Client, Material, Product, SearchEntry, Supplier
+
+KINDS = {'material': Material, 'product': Product, 'supplier': Supplier, 'client': Client}
+# (title, body) fields per model.
+FIELDS = {
+    Material: ('name', None),
+    Product: ('name', 'description'),
+    Supplier: ('name', 'email'),
+    Client: ('name', 'email'),
+}
+CONFIG = 'simple'
+MIN_SIMILARITY = 0.3
+TITLE_WEIGHT, BODY_WEIGHT = 1.0, 0.4
+PREFIX_SCORE, FUZZY_SCORE = 0.8, 0.6
+
+_word = re.compile(r'\w+')
+
+
+def words(text):
+    return _word.findall((text or '').lower())
+
+
+def trigrams(word):
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def kind_of(model):
+    return next(kind for kind, m in KINDS.items() if m is model)
+
+
+@dataclass
+class Hit:
+    kind: str
+    id: object
+    title: str
+    rank: float
+
+    def as_dict(self):
+        return {'type': self.kind, 'id': self.id, 'title': self.title, 'rank': round(self.rank, 4)}
+
+
+# Writing.
+
+def _postgres():
+    return connection.vendor == 'postgresql'
+
+
+def _vector():
+    return SearchVector('title', weight='A', config=CONFIG) + SearchVector('body', weight='B', config=CONFIG)
+
+
+def index(model, pks=None, batch_size=1000):
+    """Bring the entries of ``model``'s rows ``pks`` (default all) up to date; returns how many are live."""
+    kind = kind_of(model)
+    title_field, body_field = FIELDS[model]
+    rows = model.objects.all() if pks is None else model.objects.filter(pk__in=list(pks))
+    if pks is not None:
+        gone = set(pks) - set(rows.filter(is_archived=False).values_list('pk', flat=True))
+        if gone:
+            remove(model, gone)
+    else:
+        SearchEntry.objects.filter(kind=kind).exclude(
+            object_id__in=model.objects.filter(is_archived=False).values('pk'),
+        ).delete()
+    columns = ['pk', title_field] + ([body_field] if body_field else [])
+    live = rows.filter(is_archived=False).order_by().values_list(*columns)
+    now = timezone.now()
+    batch, count = [], 0
+    for row in live.iterator(chunk_size=batch_size):
+        batch.append(SearchEntry(
+            kind=kind, object_id=row[0], title=(row[1] or '')[:255], body=(row[2] or '') if body_field else '',
+            updated_at=now,
+        ))
+        if len(batch) == batch_size:
+            count += _upsert(kind, batch)
+            batch = []
+    if batch:
+        count += _upsert(kind, batch)
+    return count
+
+
+def index_objects(objs):
+    """Bring the entries of saved instances ``objs`` (of one model) up to date from their attributes."""
+    objs = list(objs)
+    if not objs:
+        return 0
+    model = type(objs[0])
+    kind = kind_of(model)
+    title_field, body_field = FIELDS[model]
+    archived = [obj.pk for obj in objs if obj.is_archived]
+    if archived:
+        remove(model, archived)
+    now = timezone.now()
+    entries = [
+        SearchEntry(
+            kind=kind, object_id=obj.pk, title=(getattr(obj, title_field) or '')[:255],
+            body=(getattr(obj, body_field) or '') if body_field else '', updated_at=now,
+        )
+        for obj in objs if not obj.is_archived
+    ]
+    return _upsert(kind, entries) if entries else 0
+
+
+def _upsert(kind, entries):
+    SearchEntry.objects.bulk_create(
+        entries, update_conflicts=True,
+        unique_fields=['kind', 'object_id'], update_fields=['title', 'body', 'updated_at'],
+    )
+    if _postgres():
+        SearchEntry.objects.filter(kind=kind, object_id__in=[e.object_id for e in entries]).update(vector=_vector())
+    return len(entries)
+
+
+def remove(model, pks):
+    SearchEntry.objects.filter(kind=kind_of(model), object_id__in=list(pks)).delete()
+
+
+def rebuild(batch_size=1000):
+    """Reindex every searchable model; returns ``{kind: live entries}``."""
+    return {kind: index(model, batch_size=batch_size) for kind, model in KINDS.items()}
+
+
+# Reading.
+
+class WordSimilar(Func):
+    """``text <% column``: ``text`` is word-similar to ``column`` (pg_trgm, answered by its GIN index)."""
+    arg_joiner = ' <%% '
+    template = '(%(expressions)s)'
+    output_field = BooleanField()
+
+
+def search(text, kinds=None, limit=20):
+    """The ``limit`` best ``Hit``\\ s for ``text`` among live rows of ``kinds`` (default all)."""
+    if not words(text):
+        return []
+    kinds = list(kinds or KINDS)
+    if _postgres():
+        return _search_postgres(text, kinds, limit)
+    return _fallback().search(text, kinds, limit)
+
+
+def _search_postgres(text, kinds, limit):
+    query = SearchQuery(' & '.join(f'{word}:*' for word in words(text)), search_type='raw', config=CONFIG)
+    rows = (
+        SearchEntry.objects.filter(Q(vector=query) | WordSimilar(Value(text), F('title')), kind__in=kinds)
+        .annotate(rank=SearchRank(F('vector'), query) + TrigramWordSimilarity(Value(text), F('title')))
+        .order_by('-rank', 'title')
+        .values_list('kind', 'object_id', 'title', 'rank')[:limit]
+    )
+    return [Hit(*row) for row in rows]
+
+
+class InvertedIndex:
+    """Word -> entries postings with prefix and trigram lookups, for backends without full-text search."""
+
+    def __init__(self, entries=()):
+        self.postings = defaultdict(dict)
+        self.titles = {}
+        self.by_trigram = defaultdict(set)
+        self.vocabulary = []
+        for kind, object_id, title, body in entries:
+            self.add(kind, object_id, title, body)
+        self.vocabulary = sorted(self.postings)
+
+    def add(self, kind, object_id, title, body):
+        key = (kind, object_id)
+        self.titles[key] = title
+        for weight, text in ((BODY_WEIGHT, body), (TITLE_WEIGHT, title)):
+            for word in words(text):
+                if word not in self.postings:
+                    for trigram in trigrams(word):
+                        self.by_trigram[trigram].add(word)
+                postings = self.postings[word]
+                postings[key] = max(postings.get(key, 0), weight)
+
+    def candidates(self, word):
+        """``{indexed word: score}`` for the indexed words ``word`` matches."""
+        found = {}
+        for i in range(bisect.bisect_left(self.vocabulary, word), len(self.vocabulary)):
+            indexed = self.vocabulary[i]
+            if not indexed.startswith(word):
+                break
+            found[indexed] = 1.0 if indexed == word else PREFIX_SCORE
+        if len(word) >= 3:
+            counts = defaultdict(int)
+            for trigram in trigrams(word):
+                for indexed in self.by_trigram.get(trigram, ()):
+                    counts[indexed] += 1
+            size = len(trigrams(word))
+            for indexed, shared in counts.items():
+                score = shared / (size + len(trigrams(indexed)) - shared)
+                if score >= MIN_SIMILARITY and indexed not in found:
+                    found[indexed] = FUZZY_SCORE * score
+        return found
+
+    def search(self, text, kinds, limit):
+        scores = None
+        for word in words(text):
+            matched = defaultdict(float)
+            for indexed, score in self.candidates(word).items():
+                for key, weight in self.postings[indexed].items():
+                    matched[key] = max(matched[key], score * weight)
+            if scores is None:
+                scores = dict(matched)
+            else:
+                scores = {key: scores[key] + score for key, score in matched.items() if key in scores}
+            if not scores:
+                return []
+        kinds = set(kinds)
+        hits = [
+            Hit(kind, object_id, self.titles[kind, object_id], rank)
+            for (kind, object_id), rank in scores.items() if kind in kinds
+        ]
+        hits.sort(key=lambda hit: (-hit.rank, hit.title))
+        return hits[:limit]
+
+
+_lock = threading.Lock()
+_loaded = {'fingerprint': None, 'index': None}
+
+
+def _fallback():
+    fingerprint = tuple(SearchEntry.objects.aggregate(n=Count('pk'), last=Max('updated_at')).values())
+    with _lock:
+        if _loaded['fingerprint'] != fingerprint:
+            _loaded['index'] = InvertedIndex(
+                SearchEntry.objects.values_list('kind', 'object_id', 'title', 'body').iterator(chunk_size=10000)
+            )
+            _loaded['fingerprint'] = fingerprint
+        return _loaded['index']
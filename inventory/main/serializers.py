@@ -0,0 +1,119 @@
+from rest_framework import serializers
+
+from main.constants import ORDER_STATUS_CHOICES
+from main.models import Client, Job, Material, Order, OrderProduct, Product, ProductMaterial, Purchase, Stock, Supplier
+
+AUDIT_FIELDS = ['id', 'created_by', 'updated_by', 'created_at', 'updated_at', 'is_archived']
+
+
+class SupplierSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = Supplier
+        fields = AUDIT_FIELDS + ['name', 'email', 'contact_no']
+
+
+class SupplierSummarySerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = Supplier
+        fields = ['id', 'name']
+
+
+class ClientSummarySerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = Client
+        fields = ['id', 'name']
+
+
+class MaterialSummarySerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = Material
+        fields = ['id', 'name', 'qty_unit']
+
+
+class MaterialSerializer(serializers.ModelSerializer):
+    supplier = SupplierSummarySerializer(read_only=True)
+
+    class Meta:
+        model = Material
+        fields = AUDIT_FIELDS + ['name', 'price', 'tax', 'qty_unit', 'supplier']
+
+
+class StockSerializer(serializers.ModelSerializer):
+    material = MaterialSummarySerializer(read_only=True)
+
+    class Meta:
+        model = Stock
+        fields = AUDIT_FIELDS + ['material', 'quantity']
+
+
+class ProductMaterialSerializer(serializers.ModelSerializer):
+    material = MaterialSummarySerializer(read_only=True)
+
+    class Meta:
+        model = ProductMaterial
+        fields = ['id', 'material', 'quantity', 'comment']
+
+
+class ProductSerializer(serializers.ModelSerializer):
+    materials = ProductMaterialSerializer(source='bom_lines', many=True, read_only=True)
+
+    class Meta:
+        model = Product
+        fields = AUDIT_FIELDS + [
+            'name', 'description', 'price', 'tax', 'qty_unit',
+            'material_cost', 'material_tax', 'costed_at', 'materials',
+        ]
+
+
+class ProductSummarySerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = Product
+        fields = ['id', 'name', 'qty_unit']
+
+
+class OrderProductSerializer(serializers.ModelSerializer):
+    product = ProductSummarySerializer(read_only=True)
+
+    class Meta:
+        model = OrderProduct
+        fields = ['id', 'product', 'quantity']
+
+
+class OrderSerializer(serializers.ModelSerializer):
+    client = ClientSummarySerializer(read_only=True)
+    products = OrderProductSerializer(source='live_order_products', many=True, read_only=True)
+
+    class Meta:
+        model = Order
+        fields = AUDIT_FIELDS + [
+            'client', 'order_status', 'requested_at', 'finished_at', 'comment', 'products',
+        ]
+
+
+class PurchaseSerializer(serializers.ModelSerializer):
+    supplier = SupplierSummarySerializer(read_only=True)
+    material = MaterialSummarySerializer(read_only=True)
+
+    class Meta:
+        model = Purchase
+        fields = AUDIT_FIELDS + [
+            'supplier', 'material', 'quantity', 'qty_unit', 'base_quantity', 'requested_at', 'requested_user',
+            'arrived_at',
+        ]
+        read_only_fields = ['base_quantity']
+
+
+class JobSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = Job
+        fields = ['id', 'kind', 'status', 'attempts', 'max_attempts', 'run_after', 'last_error', 'created_at', 'finished_at']
+
+
+class OrderStatusSerializer(serializers.Serializer):
+    status = serializers.ChoiceField(choices=ORDER_STATUS_CHOICES)
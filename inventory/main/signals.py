@@ -0,0 +1,120 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from main import bom, ledger, outbox, refdata, search, summary, units
+from main.models import (
+    Client, Material, MaterialConsumption, MaterialUnit, Order, OrderProduct, Product, ProductMaterial, Purchase,
+    Stock, Supplier,
+)
+
+
+@receiver(pre_save, sender=Purchase)
+def stamp_purchase_base_quantity(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    scaled = units.convert([instance.material_id], [instance.quantity], [instance.qty_unit], strict=False)[0]
+    instance.base_quantity = None if scaled < 0 else units.to_decimal(scaled)
+
+
+@receiver(pre_save, sender=OrderProduct)
+def price_order_product(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    summary.price_lines([instance])
+
+
+@receiver(post_save, sender=MaterialUnit)
+@receiver(post_delete, sender=MaterialUnit)
+def restamp_material_unit_purchases(sender, instance, **kwargs):
+    units.restamp(Purchase.objects.filter(material_id=instance.material_id, qty_unit=instance.qty_unit))
+
+
+@receiver(post_save, sender=Stock)
+@receiver(post_save, sender=Order)
+@receiver(post_save, sender=Purchase)
+@receiver(post_save, sender=MaterialConsumption)
+def record_outbox_event(sender, instance, created, raw=False, using='default', **kwargs):
+    if raw:
+        return
+    outbox.record([instance], created=created, using=using)
+
+
+@receiver(post_save, sender=Purchase)
+def post_purchase_movements(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    ledger.record_purchase(instance)
+
+
+@receiver(post_save, sender=MaterialConsumption)
+def post_consumption_movements(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    ledger.record_consumption(instance)
+
+
+@receiver(post_save, sender=ProductMaterial)
+@receiver(post_delete, sender=ProductMaterial)
+def invalidate_productmaterial_bom(sender, instance, **kwargs):
+    product_id = instance.product_id
+    transaction.on_commit(lambda: bom.invalidate([product_id]))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_bom(sender, instance, **kwargs):
+    product_id = instance.pk
+    transaction.on_commit(lambda: bom.invalidate([product_id]))
+
+
+@receiver(post_save, sender=Material)
+def invalidate_material_bom(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    material_id = instance.pk
+    transaction.on_commit(lambda: bom.invalidate_material(material_id))
+
+
+@receiver(post_save, sender=Supplier)
+@receiver(post_delete, sender=Supplier)
+@receiver(post_save, sender=Material)
+@receiver(post_delete, sender=Material)
+@receiver(post_save, sender=Client)
+@receiver(post_delete, sender=Client)
+def invalidate_reference_data(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: refdata.invalidate(sender, [pk]))
+
+
+@receiver(post_save, sender=Order)
+def refresh_order_summary(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    summary.refresh([instance.pk])
+
+
+@receiver(post_save, sender=OrderProduct)
+@receiver(post_delete, sender=OrderProduct)
+def refresh_orderproduct_summary(sender, instance, raw=False, **kwargs):
+    if raw or instance.order_id is None:
+        return
+    summary.refresh([instance.order_id])
+
+
+@receiver(post_save, sender=Supplier)
+@receiver(post_save, sender=Material)
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Client)
+def index_search_entry(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    search.index_objects([instance])
+
+
+@receiver(post_delete, sender=Supplier)
+@receiver(post_delete, sender=Material)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Client)
+def remove_search_entry(sender, instance, **kwargs):
+    search.remove(sender, [instance.pk])
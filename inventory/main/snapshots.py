@@ -0,0 +1,133 @@
+"""Point-in-time stock balances without replaying the whole ledger.
+
+The stock of a material at any moment is the sum of its ``StockMovement``
+deltas up to then. Summing from the first movement gets slower as the
+ledger grows, so ``take`` periodically stores every material's balance as
+of a cutoff in a ``StockSnapshot``: one row holding a compressed NumPy
+array, sorted by material id. ``as_of`` then loads the nearest snapshot at
+or before the requested time and adds only the movements after it, found
+through the ``(material, created_at)`` and ``created_at`` indexes of the
+ledger, so a lookup costs at most one snapshot interval of movements
+however long the history is. Quantities are stored as whole millionths
+(``main.units.SCALE``), the precision of the ledger's decimals.
+
+A snapshot is taken up to ``SETTLE`` in the past, so movements from
+transactions still open when it's taken - whose ``created_at`` is already
+set but which aren't visible yet - fall before the cutoff only if they
+committed by then. Each snapshot is built from the previous one plus the
+movements in between, so taking them is incremental too. The
+``stock.snapshot`` job takes one and schedules the next ``EVERY`` later;
+``backfill`` fills in history, e.g. after ``main.synthetic``, which first
+drops the snapshots its backdated movements make stale with ``invalidate``.
+"""
+import uuid
+import zlib
+from datetime import timedelta
+
+import numpy as np
+from django.utils import timezone
+
+from main import jobs, ledger, units
+from main.models import StockSnapshot
+
+DTYPE = np.dtype([('material', 'S16'), ('on_hand', '<i8'), ('reserved', '<i8')])
+SETTLE = timedelta(minutes=5)
+EVERY = timedelta(days=1)
+
+
+def pack(balances):
+    """``{material_id: (on_hand, reserved)}`` as a snapshot blob."""
+    array = np.array(
+        sorted(
+            (material_id.bytes, units.to_scaled(on_hand), units.to_scaled(reserved))
+            for material_id, (on_hand, reserved) in balances.items()
+        ),
+        dtype=DTYPE,
+    )
+    return zlib.compress(array.tobytes())
+
+
+def unpack(blob):
+    """A snapshot blob as an array of ``DTYPE``."""
+    return np.frombuffer(zlib.decompress(bytes(blob)), dtype=DTYPE)
+
+
+def _material_id(raw):
+    # ``S16`` drops trailing NUL bytes.
+    return uuid.UUID(bytes=raw.ljust(16, b'\0'))
+
+
+def read(snapshot, material_ids=None):
+    """``{material_id: (on_hand, reserved)}`` stored in ``snapshot`` for ``material_ids`` (default all)."""
+    array = unpack(snapshot.balances)
+    if material_ids is not None:
+        keys = np.array([material_id.bytes for material_id in material_ids], dtype=DTYPE['material'])
+        positions = np.searchsorted(array['material'], keys)
+        inside = positions < len(array)
+        positions, keys = positions[inside], keys[inside]
+        array = array[positions[array['material'][positions] == keys]]
+    return {
+        _material_id(raw): (units.to_decimal(on_hand), units.to_decimal(reserved))
+        for raw, on_hand, reserved in zip(array['material'].tolist(), array['on_hand'].tolist(), array['reserved'].tolist())
+    }
+
+
+def nearest(at):
+    """The latest snapshot taken at or before ``at``, or ``None``."""
+    return StockSnapshot.objects.filter(taken_at__lte=at).order_by('-taken_at').first()
+
+
+def as_of(at, material_ids=None):
+    """``{material_id: (on_hand, reserved)}`` at ``at`` for ``material_ids`` (default every material with stock history)."""
+    if material_ids is not None:
+        material_ids = [uuid.UUID(str(material_id)) for material_id in material_ids]
+    snapshot = nearest(at)
+    balances = {} if snapshot is None else read(snapshot, material_ids)
+    since = None if snapshot is None else snapshot.taken_at
+    for material_id, (on_hand, reserved) in ledger.replay(material_ids, after=since, until=at).items():
+        base_on_hand, base_reserved = balances.get(material_id, (0, 0))
+        balances[material_id] = (base_on_hand + on_hand, base_reserved + reserved)
+    return balances
+
+
+def take(at=None):
+    """Store the balances as of ``at`` (default ``SETTLE`` ago); returns the snapshot."""
+    at = at or timezone.now() - SETTLE
+    snapshot = StockSnapshot.objects.filter(taken_at=at).first()
+    if snapshot is not None:
+        return snapshot
+    balances = as_of(at)
+    return StockSnapshot.objects.get_or_create(
+        taken_at=at, defaults={'balances': pack(balances), 'material_count': len(balances)},
+    )[0]
+
+
+def backfill(since, until=None, every=EVERY):
+    """Take a snapshot every ``every`` from ``since`` to ``until`` (default ``SETTLE`` ago); returns how many."""
+    if every <= timedelta(0):
+        raise ValueError(f'Snapshot interval must be positive, got {every}.')
+    until = until or timezone.now() - SETTLE
+    count = 0
+    at = since
+    while at <= until:
+        take(at)
+        count += 1
+        at += every
+    return count
+
+
+def invalidate(after):
+    """Drop snapshots taken at or after ``after``, for when movements are written in the past."""
+    return StockSnapshot.objects.filter(taken_at__gte=after).delete()[0]
+
+
+def schedule(at=None):
+    """Queue the ``stock.snapshot`` job due at ``at`` (default now); a no-op if that run is queued already."""
+    at = at or timezone.now()
+    return jobs.enqueue('stock.snapshot', key=f'stock.snapshot:{at:%Y%m%d%H%M}', run_after=at)
+
+
+@jobs.handler('stock.snapshot')
+def snapshot_job(batch):
+    take()
+    schedule(timezone.now() + EVERY)
@@ -0,0 +1,213 @@
+"""Incrementally maintained order summary for dashboards.
+
+``OrderSummary`` holds one row per (day, status, client) bucket with the
+number of orders, order lines, units and value in it, so a dashboard reads
+a date range with one indexed query instead of joining orders, lines and
+products on every page load.
+
+``refresh`` is the only writer. It recomputes the contribution of the given
+orders (a handful of queries whatever their number), compares it with the
+``OrderSummaryEntry`` recorded last time and moves the difference between
+buckets. Value is ``quantity * OrderProduct.unit_price``, the product's
+price when the line was created (``price_lines``), so repricing a product
+doesn't change past orders. ``reconcile`` recomputes everything from the
+source tables to detect (and optionally repair) drift.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from main.models import Order, OrderProduct, OrderSummary, OrderSummaryEntry, Product
+
+METRICS = ('line_count', 'units', 'value')
+
+
+def order_day(requested_at, created_at):
+    return timezone.localtime(requested_at or created_at).date()
+
+
+def price_lines(lines):
+    """Set ``unit_price`` on ``OrderProduct`` rows that have none from the current product price, in one query."""
+    unpriced = [line for line in lines if line.unit_price is None]
+    if unpriced:
+        prices = dict(Product.objects.filter(pk__in={line.product_id for line in unpriced}).values_list('pk', 'price'))
+        for line in unpriced:
+            line.unit_price = prices.get(line.product_id)
+    return lines
+
+
+def contributions(order_ids):
+    """Current ``{order_id: OrderSummaryEntry}`` of live orders, computed from source."""
+    orders = Order.objects.filter(pk__in=order_ids, is_archived=False).values_list(
+        'pk', 'order_status', 'client_id', 'requested_at', 'created_at',
+    )
+    totals = {
+        row['order_id']: row
+        for row in OrderProduct.objects.filter(order_id__in=order_ids, is_archived=False)
+        .values('order_id')
+        .annotate(line_count=Count('pk'), units=Sum('quantity'), value=Sum(F('quantity') * Coalesce('unit_price', 'product__price')))
+        .order_by()
+    }
+    entries = {}
+    for pk, status, client_id, requested_at, created_at in orders:
+        total = totals.get(pk, {})
+        entries[pk] = OrderSummaryEntry(
+            order_id=pk,
+            order_status=status,
+            client_id=client_id,
+            day=order_day(requested_at, created_at),
+            line_count=total.get('line_count') or 0,
+            units=total.get('units') or 0,
+            value=float(total.get('value') or 0),
+        )
+    return entries
+
+
+def _key(entry):
+    return (entry.day, entry.order_status, entry.client_id)
+
+
+def _same(a, b):
+    return _key(a) == _key(b) and all(getattr(a, m) == getattr(b, m) for m in METRICS)
+
+
+def refresh(order_ids):
+    """Bring the summary in line with the current state of ``order_ids``."""
+    order_ids = list(set(order_ids))
+    if not order_ids:
+        return
+    with transaction.atomic():
+        old = {
+            e.order_id: e
+            for e in OrderSummaryEntry.objects.select_for_update().filter(order_id__in=order_ids).order_by('order_id')
+        }
+        new = contributions(order_ids)
+        changed = [pk for pk in order_ids if not (pk in old and pk in new and _same(old[pk], new[pk]))]
+        changed = [pk for pk in changed if pk in old or pk in new]
+        if not changed:
+            return
+
+        deltas = defaultdict(lambda: defaultdict(float))
+        for pk in changed:
+            for entry, sign in ((old.get(pk), -1), (new.get(pk), 1)):
+                if entry is None:
+                    continue
+                delta = deltas[_key(entry)]
+                delta['order_count'] += sign
+                for metric in METRICS:
+                    delta[metric] += sign * getattr(entry, metric)
+
+        OrderSummaryEntry.objects.filter(order_id__in=changed).delete()
+        OrderSummaryEntry.objects.bulk_create([new[pk] for pk in changed if pk in new])
+        apply_deltas(deltas)
+
+
+def apply_deltas(deltas):
+    """Add ``{(day, status, client_id): {metric: delta}}`` to the bucket rows."""
+    if not deltas:
+        return
+    OrderSummary.objects.bulk_create(
+        [OrderSummary(day=day, order_status=status, client_id=client_id) for day, status, client_id in deltas],
+        ignore_conflicts=True,
+    )
+    days = {day for day, _, _ in deltas}
+    buckets = [
+        bucket
+        for bucket in OrderSummary.objects.select_for_update()
+        .filter(day__in=days, client_id__in={client_id for _, _, client_id in deltas})
+        .order_by('pk')
+        if (bucket.day, bucket.order_status, bucket.client_id) in deltas
+    ]
+    now = timezone.now()
+    for bucket in buckets:
+        delta = deltas[(bucket.day, bucket.order_status, bucket.client_id)]
+        bucket.order_count += int(delta['order_count'])
+        bucket.line_count += int(delta['line_count'])
+        bucket.units += int(delta['units'])
+        bucket.value += delta['value']
+        bucket.updated_at = now
+    OrderSummary.objects.bulk_update(buckets, ['order_count', *METRICS, 'updated_at'])
+
+
+def set_status(order_ids, status, user, **fields):
+    """Move orders to ``status`` with one ``UPDATE`` and shift their summary buckets."""
+    order_ids = list(order_ids)
+    with transaction.atomic():
+        updated = Order.objects.filter(pk__in=order_ids).update(
+            order_status=status, updated_by=user, updated_at=timezone.now(), **fields,
+        )
+        refresh(order_ids)
+    return updated
+
+
+def dashboard(since=None, until=None, client_id=None, by_client=False):
+    """Rows of ``{day, order_status[, client_id], order_count, ...}`` from one query."""
+    queryset = OrderSummary.objects.filter(order_count__gt=0)
+    if since is not None:
+        queryset = queryset.filter(day__gte=since)
+    if until is not None:
+        queryset = queryset.filter(day__lte=until)
+    if client_id is not None:
+        queryset = queryset.filter(client_id=client_id)
+    group = ['day', 'order_status'] + (['client_id'] if by_client else [])
+    return queryset.values(*group).annotate(
+        orders=Sum('order_count'), lines=Sum('line_count'), total_units=Sum('units'), total_value=Sum('value'),
+    ).order_by(*group)
+
+
+def reconcile(batch_size=1000, fix=False):
+    """Compare the summary with the source tables; returns the drifted order ids.
+
+    Orders are recomputed in batches of ``batch_size``. With ``fix`` the
+    drifted orders are refreshed, after which the bucket totals are checked
+    against the sum of the entries and rewritten if they still differ.
+    """
+    drifted = []
+    order_ids = Order.objects.order_by('pk').values_list('pk', flat=True).iterator(chunk_size=batch_size)
+
+    def batches(ids):
+        batch = []
+        for pk in ids:
+            batch.append(pk)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    for batch in batches(order_ids):
+        new = contributions(batch)
+        old = {e.order_id: e for e in OrderSummaryEntry.objects.filter(order_id__in=batch)}
+        stale = [pk for pk in batch if (pk in old) != (pk in new) or (pk in old and not _same(old[pk], new[pk]))]
+        drifted.extend(stale)
+        if fix and stale:
+            refresh(stale)
+
+    expected = {
+        (row['day'], row['order_status'], row['client_id']): row
+        for row in OrderSummaryEntry.objects.values('day', 'order_status', 'client_id')
+        .annotate(order_count=Count('pk'), line_count=Sum('line_count'), units=Sum('units'), value=Sum('value'))
+        .order_by()
+    }
+    wrong_buckets = []
+    for bucket in OrderSummary.objects.iterator(chunk_size=batch_size):
+        want = expected.pop((bucket.day, bucket.order_status, bucket.client_id), None)
+        want = want or {'order_count': 0, 'line_count': 0, 'units': 0, 'value': 0}
+        have = (bucket.order_count, bucket.line_count, bucket.units)
+        if have != (want['order_count'], want['line_count'], want['units']) or abs(bucket.value - (want['value'] or 0)) > 1e-6:
+            bucket.order_count, bucket.line_count = want['order_count'], want['line_count']
+            bucket.units, bucket.value = want['units'] or 0, want['value'] or 0
+            wrong_buckets.append(bucket)
+    missing = [
+        OrderSummary(day=day, order_status=status, client_id=client_id, order_count=row['order_count'],
+                     line_count=row['line_count'] or 0, units=row['units'] or 0, value=row['value'] or 0)
+        for (day, status, client_id), row in expected.items()
+    ]
+    if fix and (wrong_buckets or missing):
+        with transaction.atomic():
+            OrderSummary.objects.bulk_update(wrong_buckets, ['order_count', *METRICS], batch_size=batch_size)
+            OrderSummary.objects.bulk_create(missing, batch_size=batch_size)
+    return drifted, len(wrong_buckets) + len(missing)
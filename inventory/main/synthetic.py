@@ -0,0 +1,420 @@
+"""Deterministic synthetic data for benchmarks.
+
+``generate(rows, seed)`` fills every table of ``main.models`` with about
+``rows`` rows in total, through ``bulk_create`` in batches, so 10k rows
+take seconds and 50M rows need nothing but time. The shape follows what
+the real data looks like:
+
+* products and clients are picked with Zipf-distributed popularity, and
+  bills of materials draw materials with the same skew, so a few materials
+  appear in most orders and the long tail almost never;
+* bills of materials have a geometric number of lines ("depth" - the
+  schema has no sub-assemblies), order lines a Poisson number of products;
+* order status depends on age (``STATUS_MIX``): recent orders are mostly
+  pending or approved, old ones completed, and a small share is cancelled
+  (archived) after approval;
+* purchases follow weekly demand per material, with per-supplier lead
+  times, and the ledger, balances, order summary, material plans, job
+  history and archive tables are derived from the generated rows with the
+  same code that maintains them in production, as are weekly stock
+  snapshots over the whole history.
+
+The same ``rows``, ``seed`` and ``now`` give the same rows, ids included
+(ids are ``uuid7`` built from each row's ``created_at`` and the seeded
+random stream); only the draft purchases raised by ``main.planning`` get
+fresh ids. ``now`` defaults to the start of the current day (UTC).
+"""
+import math
+import uuid
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, fields
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.db import transaction
+
+from main import archive, ledger, planning, search, snapshots, summary, units
+from main.constants import QTY_UNIT_CHOICES
+from main.models import (
+    Client, Job, Material, MaterialConsumption, Order, OrderProduct, Product, ProductMaterial, Purchase, Stock,
+    StockBalance, StockMovement, Supplier, User,
+)
+
+ROWS_PER_ORDER = 20
+ORDERS_PER_CHUNK = 1000
+POPULARITY_EXPONENT = 1.1
+CANCELLED_SHARE = 0.02
+ARCHIVE_AFTER_DAYS = 90
+JOB_HISTORY_DAYS = 7
+SNAPSHOT_EVERY = timedelta(days=7)
+STATUSES = ('pending', 'approved', 'in progress', 'completed')
+STATUS_MIX = (
+    # (orders younger than this many days, share of each of STATUSES)
+    (2, (0.6, 0.3, 0.1, 0.0)),
+    (14, (0.1, 0.2, 0.4, 0.3)),
+    (None, (0.01, 0.01, 0.03, 0.95)),
+)
+TRANSITION_KINDS = {'approved': 'order.approve', 'in progress': 'order.start', 'completed': 'order.complete'}
+UNITS = [unit for unit, _ in QTY_UNIT_CHOICES]
+
+
+def _clamp(value, low, high):
+    return max(low, min(high, value))
+
+
+@dataclass
+class Sizes:
+    orders: int
+    users: int
+    suppliers: int
+    clients: int
+    materials: int
+    products: int
+
+    @classmethod
+    def for_rows(cls, rows):
+        orders = max(rows // ROWS_PER_ORDER, 1)
+        return cls(
+            orders=orders,
+            users=_clamp(orders // 10000, 3, 50),
+            suppliers=_clamp(orders // 800, 5, 5000),
+            clients=_clamp(orders // 100, 10, 500_000),
+            materials=_clamp(orders // 20, 50, 200_000),
+            products=_clamp(orders // 50, 20, 100_000),
+        )
+
+    def as_dict(self):
+        return {f.name: getattr(self, f.name) for f in fields(self)}
+
+
+@contextmanager
+def historical_timestamps():
+    """Let ``bulk_create`` keep the ``created_at``/``updated_at`` set on the rows.
+
+    ``auto_now``/``auto_now_add`` are switched off on every model of the app
+    for the duration, so only use this in a process that does nothing else.
+    """
+    switched = []
+    for model in (User, Supplier, Client, Material, Product, ProductMaterial, Stock, Purchase, Order,
+                  OrderProduct, MaterialConsumption, StockMovement, Job):
+        for field in model._meta.concrete_fields:
+            if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+                switched.append((field, field.auto_now, field.auto_now_add))
+                field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in switched:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Generator:
+
+    def __init__(self, rows, seed=0, days=365, now=None, batch_size=5000, log=None):
+        self.rng = np.random.default_rng(seed)
+        self.seed = seed
+        self.sizes = Sizes.for_rows(rows)
+        self.days = days
+        self.now = now or datetime.now(dt_timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        self.start = self.now - timedelta(days=days)
+        self.batch_size = batch_size
+        self.log = log or (lambda message: None)
+        self.counts = Counter()
+
+    # Random building blocks.
+
+    def popularity(self, n):
+        """Zipf weights over ``n`` items in a random order."""
+        weights = 1.0 / np.arange(1, n + 1) ** POPULARITY_EXPONENT
+        return self.rng.permutation(weights / weights.sum())
+
+    def at(self, seconds):
+        return datetime.fromtimestamp(float(seconds), tz=dt_timezone.utc)
+
+    def ids(self, times):
+        """``uuid7`` for each of ``times`` with the random bits drawn from the seeded stream."""
+        n = len(times)
+        seq = self.rng.integers(0, 1 << 12, size=n).tolist()
+        rand = self.rng.integers(0, 1 << 62, size=n, dtype=np.int64).tolist()
+        return [
+            uuid.UUID(int=(int(t.timestamp() * 1000) << 80) | (0x7 << 76) | (s << 64) | (0b10 << 62) | r)
+            for t, s, r in zip(times, seq, rand)
+        ]
+
+    def times_between(self, start, end, n):
+        """``n`` sorted datetimes spread uniformly between ``start`` and ``end``."""
+        seconds = np.sort(self.rng.uniform(start.timestamp(), end.timestamp(), size=n))
+        return [self.at(s) for s in seconds]
+
+    def insert(self, model, objs):
+        model.objects.bulk_create(objs, batch_size=self.batch_size)
+        self.counts[model.__name__] += len(objs)
+
+    # Tables.
+
+    def users(self):
+        names = [f'synthetic-{self.seed}-{i}' for i in range(self.sizes.users)]
+        if User.objects.filter(username__in=names).exists():
+            raise ValueError(f'Seed {self.seed} was already generated into this database.')
+        times = self.times_between(self.start - timedelta(days=30), self.start, len(names))
+        ids = self.ids(times)
+        self.user_ids = ids
+        self.insert(User, [
+            User(
+                id=pk, username=name, password='!synthetic', is_staff=i == 0,
+                created_by_id=ids[0], updated_by_id=ids[0], created_at=t, updated_at=t, date_joined=t.date(),
+            )
+            for i, (pk, name, t) in enumerate(zip(ids, names, times))
+        ])
+
+    def audit(self, t, user_id=None):
+        user_id = user_id or self.user_ids[0]
+        return {'created_by_id': user_id, 'updated_by_id': user_id, 'created_at': t, 'updated_at': t}
+
+    def reference_data(self):
+        sizes = self.sizes
+        before = self.start - timedelta(days=1)
+
+        times = self.times_between(self.start - timedelta(days=30), before, sizes.suppliers)
+        self.supplier_ids = self.ids(times)
+        # Mean lead time per supplier, in days.
+        self.supplier_lead = self.rng.gamma(4.0, 2.0, size=sizes.suppliers) + 1
+        self.insert(Supplier, [
+            Supplier(id=pk, name=f'Supplier {i}', email=f'supplier{i}@example.com', **self.audit(t))
+            for i, (pk, t) in enumerate(zip(self.supplier_ids, times))
+        ])
+
+        times = self.times_between(self.start - timedelta(days=30), before, sizes.clients)
+        self.client_ids = self.ids(times)
+        self.client_weights = self.popularity(sizes.clients)
+        self.insert(Client, [
+            Client(id=pk, name=f'Client {i}', email=f'client{i}@example.com', **self.audit(t))
+            for i, (pk, t) in enumerate(zip(self.client_ids, times))
+        ])
+
+        times = self.times_between(self.start - timedelta(days=30), before, sizes.materials)
+        self.material_ids = self.ids(times)
+        self.material_supplier = self.rng.choice(sizes.suppliers, size=sizes.materials, p=self.popularity(sizes.suppliers))
+        self.material_price = np.round(self.rng.lognormal(2.0, 1.0, size=sizes.materials), 2)
+        material_tax = self.rng.choice([0.05, 0.12, 0.18, 0.28], size=sizes.materials)
+        material_unit = self.rng.choice(len(UNITS), size=sizes.materials, p=[0.35, 0.15, 0.1, 0.4])
+        self.insert(Material, [
+            Material(
+                id=pk, name=f'Material {i}', price=float(self.material_price[i]), tax=float(material_tax[i]),
+                qty_unit=UNITS[material_unit[i]], supplier_id=self.supplier_ids[self.material_supplier[i]],
+                **self.audit(t),
+            )
+            for i, (pk, t) in enumerate(zip(self.material_ids, times))
+        ])
+
+        times = self.times_between(self.start - timedelta(days=30), before, sizes.products)
+        self.product_ids = self.ids(times)
+        self.product_weights = self.popularity(sizes.products)
+        material_weights = self.popularity(sizes.materials)
+        depth = np.minimum(self.rng.geometric(0.3, size=sizes.products), sizes.materials)
+        self.boms = []
+        self.product_prices = []
+        lines = []
+        products = []
+        for i, (pk, t) in enumerate(zip(self.product_ids, times)):
+            materials = self.rng.choice(sizes.materials, size=depth[i], replace=False, p=material_weights)
+            quantities = self.rng.geometric(0.5, size=depth[i])
+            self.boms.append(list(zip(materials.tolist(), quantities.tolist())))
+            cost = float(np.dot(self.material_price[materials], quantities))
+            tax = float(np.dot(self.material_price[materials] * material_tax[materials], quantities))
+            self.product_prices.append(round(cost * self.rng.uniform(1.3, 2.5), 2))
+            products.append(Product(
+                id=pk, name=f'Product {i}', description='', price=self.product_prices[-1],
+                tax=0.18, qty_unit='pieces', material_cost=cost, material_tax=tax, costed_at=t, **self.audit(t),
+            ))
+            line_ids = self.ids([t] * len(materials))
+            lines += [
+                ProductMaterial(id=line_id, product_id=pk, material_id=self.material_ids[m], quantity=q, **self.audit(t))
+                for line_id, (m, q) in zip(line_ids, self.boms[-1])
+            ]
+        self.insert(Product, products)
+        self.insert(ProductMaterial, lines)
+
+    def opening_stock(self):
+        """A legacy ``Stock`` row and the matching opening adjustment per material."""
+        t = self.start
+        quantities = self.rng.integers(0, 200, size=self.sizes.materials).tolist()
+        self.on_hand = defaultdict(int)
+        self.reserved = defaultdict(int)
+        stock_ids = self.ids([t] * len(quantities))
+        movement_ids = self.ids([t] * len(quantities))
+        self.insert(Stock, [
+            Stock(id=pk, material_id=material_id, quantity=q, **self.audit(t))
+            for pk, material_id, q in zip(stock_ids, self.material_ids, quantities)
+        ])
+        self.insert(StockMovement, [
+            StockMovement(
+                id=pk, material_id=material_id, movement_type='adjustment', on_hand_delta=q,
+                comment='opening balance', **self.audit(t),
+            )
+            for pk, material_id, q in zip(movement_ids, self.material_ids, quantities) if q
+        ])
+        for material_id, q in zip(self.material_ids, quantities):
+            self.on_hand[material_id] += q
+
+    def status(self, created_at):
+        age = (self.now - created_at).days
+        for max_age, shares in STATUS_MIX:
+            if max_age is None or age < max_age:
+                return STATUSES[self.rng.choice(len(STATUSES), p=shares)]
+
+    def orders(self):
+        total = self.sizes.orders
+        times = self.times_between(self.start, self.now, total)
+        for offset in range(0, total, ORDERS_PER_CHUNK):
+            with transaction.atomic():
+                self.chunk(times[offset:offset + ORDERS_PER_CHUNK])
+            self.log(f'{min(offset + ORDERS_PER_CHUNK, total)}/{total} orders')
+
+    def chunk(self, times):
+        rng = self.rng
+        n = len(times)
+        order_ids = self.ids(times)
+        clients = rng.choice(len(self.client_ids), size=n, p=self.client_weights)
+        users = rng.integers(0, len(self.user_ids), size=n)
+        cancelled = rng.random(size=n) < CANCELLED_SHARE
+
+        orders, order_products, consumptions, movements, jobs = [], [], [], [], []
+        demand = defaultdict(int)
+        for i, (pk, t) in enumerate(zip(order_ids, times)):
+            user_id = self.user_ids[users[i]]
+            status = 'approved' if cancelled[i] else self.status(t)
+            approved_at = t + timedelta(hours=float(rng.uniform(0.5, 24)))
+            finished_at = None
+            if status == 'completed':
+                finished_at = min(t + timedelta(days=float(rng.uniform(2, 14))), self.now)
+            orders.append(Order(
+                id=pk, client_id=self.client_ids[clients[i]], order_status=status, requested_at=t,
+                finished_at=finished_at, is_archived=bool(cancelled[i]), **self.audit(t, user_id),
+            ))
+            n_lines = 1 + rng.poisson(1.5)
+            products = rng.choice(len(self.product_ids), size=n_lines, p=self.product_weights)
+            quantities = rng.geometric(0.4, size=n_lines).tolist()
+            line_ids = self.ids([t] * n_lines)
+            for line_id, p, q in zip(line_ids, products.tolist(), quantities):
+                order_products.append(OrderProduct(
+                    id=line_id, order_id=pk, product_id=self.product_ids[p], quantity=q,
+                    unit_price=self.product_prices[p], is_archived=bool(cancelled[i]), **self.audit(t, user_id),
+                ))
+                if status == 'pending':
+                    continue
+                bom = self.boms[p]
+                for consumption_id, (m, per_unit) in zip(self.ids([approved_at] * len(bom)), bom):
+                    consumption = MaterialConsumption(
+                        id=consumption_id, order_product_id=line_id, material_id=self.material_ids[m],
+                        quantity=per_unit * q, is_allocated=status in ('in progress', 'completed'),
+                        is_archived=bool(cancelled[i]), comment='', **self.audit(approved_at, user_id),
+                    )
+                    consumptions.append(consumption)
+                    demand[m, (approved_at - self.start).days // 7] += consumption.quantity
+            if self.now - t < timedelta(days=JOB_HISTORY_DAYS):
+                for step in STATUSES[1:STATUSES.index(status) + 1]:
+                    jobs.append((pk, step, approved_at))
+
+        purchases = self.purchases(demand)
+        for consumption in consumptions:
+            movements += ledger.consumption_movements(consumption)
+        for purchase in purchases:
+            movements += ledger.purchase_movements(purchase)
+        self.stamp(movements)
+        for movement in movements:
+            self.on_hand[movement.material_id] += movement.on_hand_delta
+            self.reserved[movement.material_id] += movement.reserved_delta
+
+        self.insert(Order, orders)
+        self.insert(OrderProduct, order_products)
+        self.insert(Purchase, purchases)
+        self.insert(MaterialConsumption, consumptions)
+        self.insert(StockMovement, movements)
+        self.insert(Job, self.jobs(jobs))
+        summary.refresh(order_ids)
+
+    def purchases(self, demand):
+        """Weekly purchases covering ``demand`` (``{(material position, week): quantity}``)."""
+        rng = self.rng
+        purchases = []
+        for m, week in sorted(demand):
+            t = self.start + timedelta(weeks=week)
+            supplier = self.material_supplier[m]
+            lead = float(self.supplier_lead[supplier] * rng.lognormal(0, 0.3))
+            requested_at = t - timedelta(days=lead)
+            arrived_at = t + timedelta(hours=float(rng.uniform(-12, 12)))
+            cancelled = rng.random() < CANCELLED_SHARE
+            if arrived_at > self.now or cancelled:
+                arrived_at = None
+            purchases.append(Purchase(
+                supplier_id=self.supplier_ids[supplier], material_id=self.material_ids[m],
+                quantity=math.ceil(demand[m, week] * rng.uniform(1.1, 1.6)), qty_unit=None,
+                requested_at=requested_at, requested_user_id=self.user_ids[0], arrived_at=arrived_at,
+                is_archived=cancelled, **self.audit(requested_at),
+            ))
+        for purchase, pk in zip(purchases, self.ids([p.created_at for p in purchases])):
+            purchase.id = pk
+        return units.stamp(purchases)
+
+    def stamp(self, movements):
+        """Give ledger movements the time and a seeded id of the row they record."""
+        times = []
+        for movement in movements:
+            source = movement.purchase if movement.purchase_id else movement.material_consumption
+            t = source.arrived_at if movement.purchase_id else source.created_at
+            movement.created_by_id = movement.updated_by_id = source.updated_by_id
+            movement.created_at = movement.updated_at = t
+            times.append(t)
+        for movement, pk in zip(movements, self.ids(times)):
+            movement.id = pk
+
+    def jobs(self, transitions):
+        job_ids = self.ids([t for _, _, t in transitions])
+        return [
+            Job(
+                id=pk, kind=TRANSITION_KINDS[step], status='done', attempts=1,
+                payload={'order_id': str(order_id), 'user_id': str(self.user_ids[0])},
+                idempotency_key=f'order:{order_id}:{step}', run_after=t, created_at=t, finished_at=t,
+            )
+            for pk, (order_id, step, t) in zip(job_ids, transitions)
+        ]
+
+    def balances(self):
+        self.insert(StockBalance, [
+            StockBalance(material_id=m, on_hand=self.on_hand[m], reserved=self.reserved[m])
+            for m in self.material_ids
+        ])
+
+    def run(self):
+        self.log(f'Generating {self.sizes.as_dict()} from seed {self.seed}')
+        with historical_timestamps():
+            with transaction.atomic():
+                self.users()
+                self.reference_data()
+                self.opening_stock()
+                search.rebuild(batch_size=self.batch_size)
+            self.log('reference data done')
+            self.orders()
+            self.balances()
+        # Snapshots taken before this run predate the movements just written into the past.
+        snapshots.invalidate(self.start)
+        self.counts['StockSnapshot'] += snapshots.backfill(self.start, self.now, every=SNAPSHOT_EVERY)
+        user = User.objects.get(pk=self.user_ids[0])
+        result = planning.plan(history_days=self.days, today=self.now.date())
+        planning.save(result, user, batch_size=self.batch_size)
+        self.counts['MaterialPlan'] += len(result.material_ids)
+        self.counts['Purchase'] += sum(len(lines) for lines in result.drafts.values())
+        before = self.now - timedelta(days=ARCHIVE_AFTER_DAYS)
+        for model, cold in archive.ARCHIVES.items():
+            moved = archive.move(model, before, batch_size=self.batch_size)
+            self.counts[cold.__name__] += moved
+            self.counts[model.__name__] -= moved
+        self.log('derived tables done')
+        return dict(self.counts)
+
+
+def generate(rows, seed=0, **kwargs):
+    """Fill the database with about ``rows`` synthetic rows; returns the row count per model."""
+    return Generator(rows, seed=seed, **kwargs).run()
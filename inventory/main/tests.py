@@ -1,3 +1,1352 @@
-from django.test import TestCase
+import asyncio
+import csv
+import importlib.util
+import io
+import json
+import os
+import tempfile
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import AsyncClient, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from main import (
+    archive, audit, availability, benchmarks, bom, costing, exporters, feed, fulfilment, ids, importers,
+    instrumentation, jobs, ledger, outbox, planning, refdata, reservations, search, snapshots, summary, synthetic,
+    units,
+)
+from main.models import (
+    ArchivedPurchase, Client, Job, Material, MaterialConsumption, MaterialPlan, MaterialUnit, Order, OrderProduct,
+    OrderSummary, OutboxEvent, Product, ProductMaterial, Purchase, SearchEntry, Stock, StockBalance, StockMovement,
+    StockSnapshot, Supplier, User,
+)
+from main.routers import ReplicaRouter, pinned, replica_reads
+
+
+def make_user(username='admin', **kwargs):
+    user = User(username=username, **kwargs)
+    user.created_by_id = user.id
+    user.updated_by_id = user.id
+    user.save()
+    return user
+
+
+class InventoryFactory:
+
+    def __init__(self, user):
+        self.user = user
+        self.audit = {'created_by': user, 'updated_by': user}
+        self.n = 0
+
+    def supplier(self):
+        self.n += 1
+        return Supplier.objects.create(name=f'supplier {self.n}', **self.audit)
+
+    def client(self):
+        self.n += 1
+        return Client.objects.create(name=f'client {self.n}', **self.audit)
+
+    def material(self, supplier=None, **kwargs):
+        self.n += 1
+        kwargs.setdefault('price', 10)
+        kwargs.setdefault('tax', 18)
+        kwargs.setdefault('qty_unit', 'kg')
+        kwargs.setdefault('name', f'material {self.n}')
+        return Material.objects.create(supplier=supplier or self.supplier(), **kwargs, **self.audit)
+
+    def product(self, materials=(), quantity=1, **kwargs):
+        self.n += 1
+        kwargs.setdefault('price', 100)
+        kwargs.setdefault('tax', 18)
+        kwargs.setdefault('qty_unit', 'pieces')
+        kwargs.setdefault('name', f'product {self.n}')
+        kwargs.setdefault('description', '')
+        product = Product.objects.create(**kwargs, **self.audit)
+        for material in materials:
+            ProductMaterial.objects.create(
+                product=product, material=material, quantity=quantity, comment='', **self.audit,
+            )
+        return product
+
+    def stock(self, material=None, quantity=10):
+        return Stock.objects.create(material=material or self.material(), quantity=quantity, **self.audit)
+
+    def order(self, client=None, products=(), quantity=1, **kwargs):
+        kwargs.setdefault('requested_at', timezone.now())
+        order = Order.objects.create(client=client or self.client(), **kwargs, **self.audit)
+        for product in products:
+            OrderProduct.objects.create(order=order, product=product, quantity=quantity, **self.audit)
+        return order
+
+    def purchase(self, material=None, quantity=10, **kwargs):
+        material = material or self.material()
+        return Purchase.objects.create(
+            supplier=material.supplier, material=material, quantity=quantity,
+            requested_user=self.user, **kwargs, **self.audit,
+        )
+
+
+@override_settings(QUERY_BUDGET_ENFORCE=True)
+class APIQueryCountTests(TestCase):
+    """Listing an endpoint costs the same number of queries for 1 or many rows.
+
+    The counts include one query per reference model read through a cold
+    ``main.refdata`` cache.
+    """
+
+    endpoints = {
+        'supplier': ('/api/suppliers/', 1),
+        'material': ('/api/materials/', 2),
+        'stock': ('/api/stock/', 2),
+        'product': ('/api/products/', 2),
+        'order': ('/api/orders/', 3),
+        'purchase': ('/api/purchases/', 3),
+    }
+
+    def setUp(self):
+        caches['default'].clear()
+        refdata.clear_local()
+        self.user = make_user()
+        self.factory = InventoryFactory(self.user)
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def create(self, name):
+        if name == 'product':
+            return self.factory.product(materials=[self.factory.material(), self.factory.material()])
+        if name == 'order':
+            products = [self.factory.product(), self.factory.product()]
+            return self.factory.order(products=products)
+        return getattr(self.factory, name)()
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.api.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_list_query_count_is_constant(self):
+        for name, (url, expected) in self.endpoints.items():
+            with self.subTest(endpoint=name):
+                self.create(name)
+                single, _ = self.count_queries(url)
+                for _ in range(5):
+                    self.create(name)
+                many, response = self.count_queries(url)
+                self.assertEqual(single, expected)
+                self.assertEqual(many, expected)
+                self.assertGreaterEqual(len(response.json()['results']), 6)
+
+    def test_detail_query_count(self):
+        for name, (url, expected) in self.endpoints.items():
+            with self.subTest(endpoint=name):
+                obj = self.create(name)
+                queries, response = self.count_queries(f'{url}{obj.pk}/')
+                self.assertEqual(queries, expected)
+                self.assertEqual(response.json()['id'], str(obj.pk))
+
+    def test_cursor_pagination_walks_every_row_once(self):
+        created = {str(self.factory.supplier().pk) for _ in range(7)}
+        # Rows created in the same instant are told apart by id.
+        Supplier.objects.filter(pk__in=sorted(created)[:4]).update(created_at=timezone.now())
+        pages = []
+        url = '/api/suppliers/?page_size=3'
+        while url:
+            response = self.api.get(url).json()
+            pages.append([row['id'] for row in response['results']])
+            url = response['next']
+        seen = [pk for page in pages for pk in page]
+        self.assertEqual(len(seen), len(created))
+        self.assertEqual(set(seen), created)
+
+        previous = self.api.get(response['previous']).json()
+        self.assertEqual([row['id'] for row in previous['results']], pages[-2])
+        self.assertEqual(self.api.get('/api/suppliers/?cursor=cD1nYXJiYWdl').status_code, 404)
+
+    def test_archived_rows_are_hidden(self):
+        supplier = self.factory.supplier()
+        Supplier.objects.filter(pk=supplier.pk).update(is_archived=True)
+        self.assertEqual(self.api.get('/api/suppliers/').json()['results'], [])
+        self.assertEqual(self.api.get(f'/api/suppliers/{supplier.pk}/').status_code, 404)
+
+
+class LedgerTests(TestCase):
+
+    def setUp(self):
+        self.user = make_user()
+        self.factory = InventoryFactory(self.user)
+        self.material = self.factory.material()
+
+    def assertBalancesMatchLedger(self):
+        balances = {b.material_id: (b.on_hand, b.reserved) for b in StockBalance.objects.all()}
+        self.assertEqual(balances, ledger.replay())
+
+    def test_reserve_allocate_and_release(self):
+        ledger.record_adjustment(self.material.pk, 10, self.user)
+        order = self.factory.order(products=[self.factory.product()])
+        line = order.order_products.get()
+        consume = lambda quantity: MaterialConsumption.objects.create(
+            order_product=line, material=self.material, quantity=quantity, comment='', **self.factory.audit,
+        )
+        allocated, cancelled = consume(6), consume(3)
+        self.assertEqual(ledger.replay()[self.material.pk], (10, 9))
+        ledger.allocate([allocated.pk], self.user)
+        self.assertEqual(ledger.allocate([allocated.pk], self.user), [])
+        cancelled.is_archived = True
+        cancelled.save()
+        cancelled.save()
+        self.assertEqual((ledger.on_hand(self.material.pk), ledger.reserved(self.material.pk)), (4, 0))
+        self.assertEqual(StockMovement.objects.filter(material_consumption=cancelled, movement_type='release').count(), 1)
+        self.assertBalancesMatchLedger()
+
+    def test_purchase_edits_and_archiving_adjust_the_receipt(self):
+        purchase = self.factory.purchase(self.material, quantity=10)
+        self.assertEqual(ledger.on_hand(self.material.pk), 0)
+        for change, on_hand in (
+            ({'arrived_at': timezone.now()}, 10), ({'quantity': 12}, 12), ({'is_archived': True}, 0),
+            ({'is_archived': False}, 12),
+        ):
+            for name, value in change.items():
+                setattr(purchase, name, value)
+            purchase.save()
+            self.assertEqual(ledger.on_hand(self.material.pk), on_hand)
+        self.assertCountEqual(
+            StockMovement.objects.filter(purchase=purchase).values_list('movement_type', 'on_hand_delta'),
+            [('receipt', 10), ('adjustment', 2), ('adjustment', -12), ('adjustment', 12)],
+        )
+        self.assertBalancesMatchLedger()
+
+    def test_consumption_edits_archiving_and_restoring_net_out(self):
+        ledger.record_adjustment(self.material.pk, 10, self.user)
+        line = self.factory.order(products=[self.factory.product()]).order_products.get()
+        consumption = MaterialConsumption.objects.create(
+            order_product=line, material=self.material, quantity=5, comment='', **self.factory.audit,
+        )
+        balance = lambda: (ledger.on_hand(self.material.pk), ledger.reserved(self.material.pk))
+        for change, expected in (
+            ({'quantity': 8}, (10, 8)), ({'is_archived': True}, (10, 0)), ({'is_archived': False}, (10, 8)),
+        ):
+            for name, value in change.items():
+                setattr(consumption, name, value)
+            consumption.save()
+            self.assertEqual(balance(), expected)
+        ledger.allocate([consumption.pk], self.user)
+        self.assertEqual(balance(), (2, 0))
+        consumption.refresh_from_db()
+        consumption.quantity = 6
+        consumption.save()
+        self.assertEqual(balance(), (4, 0))
+        other = self.factory.material()
+        consumption.material = other
+        consumption.save()
+        self.assertEqual(balance(), (10, 0))
+        self.assertEqual((ledger.on_hand(other.pk), ledger.reserved(other.pk)), (-6, 0))
+        self.assertBalancesMatchLedger()
+
+    def test_moving_a_received_purchase_moves_its_stock(self):
+        purchase = self.factory.purchase(self.material, quantity=10, arrived_at=timezone.now())
+        other = self.factory.material()
+        purchase.material = other
+        purchase.save()
+        self.assertEqual((ledger.on_hand(self.material.pk), ledger.on_hand(other.pk)), (0, 10))
+        self.assertCountEqual(
+            purchase.movements.values_list('material_id', 'movement_type', 'on_hand_delta'),
+            [(self.material.pk, 'receipt', 10), (self.material.pk, 'adjustment', -10), (other.pk, 'adjustment', 10)],
+        )
+        purchase.material = self.material
+        purchase.save()
+        self.assertEqual((ledger.on_hand(self.material.pk), ledger.on_hand(other.pk)), (10, 0))
+        self.assertBalancesMatchLedger()
+
+    def test_rebuild_restores_drifted_balances(self):
+        ledger.record_adjustment(self.material.pk, 10, self.user)
+        StockBalance.objects.update(on_hand=3)
+        with self.assertRaises(CommandError):
+            call_command('stock_balances', 'verify', stdout=io.StringIO())
+        call_command('stock_balances', 'rebuild', stdout=io.StringIO())
+        self.assertEqual(ledger.on_hand(self.material.pk), 10)
+        self.assertBalancesMatchLedger()
+
+
+class ReservationTests(TestCase):
+
+    def setUp(self):
+        self.user = make_user()
+        self.factory = InventoryFactory(self.user)
+        self.a, self.b = self.factory.material(), self.factory.material()
+        ledger.record_adjustment(self.a.pk, 10, self.user)
+        ledger.record_adjustment(self.b.pk, 5, self.user)
+
+    def test_reserve_moves_every_material(self):
+        reservations.reserve({self.a.pk: 4, self.b.pk: 5}, self.user)
+        self.assertEqual(ledger.available(self.a.pk), 6)
+        self.assertEqual(ledger.available(self.b.pk), 0)
+        self.assertEqual(ledger.replay([self.a.pk, self.b.pk]), {self.a.pk: (10, 4), self.b.pk: (5, 5)})
+
+    def test_short_material_reserves_nothing(self):
+        with self.assertRaises(reservations.InsufficientStock) as ctx:
+            reservations.reserve({self.a.pk: 4, self.b.pk: 6}, self.user)
+        self.assertEqual(ctx.exception.short, {self.b.pk: 1})
+        self.assertEqual(ledger.reserved(self.a.pk), 0)
+
+    def test_stale_version_does_not_swap(self):
+        balances = ledger.get_balances([self.a.pk, self.b.pk])
+        reservations.reserve({self.b.pk: 1}, self.user)
+        self.assertFalse(reservations.compare_and_swap(balances, {self.a.pk: 1, self.b.pk: 1}))
+        self.assertEqual(StockBalance.objects.get(pk=self.b.pk).reserved, 1)
+
+    def test_release(self):
+        reservations.reserve({self.a.pk: 4}, self.user)
+        reservations.release({self.a.pk: 3}, self.user)
+        self.assertEqual(ledger.reserved(self.a.pk), 1)
+        with self.assertRaises(reservations.InsufficientStock):
+            reservations.release({self.a.pk: 2}, self.user)
+
+
+class FulfilmentTests(TestCase):
+
+    def setUp(self):
+        self.user = make_user()
+        self.factory = InventoryFactory(self.user)
+        self.a, self.b = self.factory.material(), self.factory.material()
+        ledger.record_adjustment(self.a.pk, 10, self.user)
+        ledger.record_adjustment(self.b.pk, 5, self.user)
+        self.uses_a = self.factory.product([self.a], quantity=2)
+        self.uses_b = self.factory.product([self.b])
+
+    def test_orders_are_served_oldest_first_and_short_ones_stay_pending(self):
+        now = timezone.now()
+        first = self.factory.order(products=[self.uses_a], quantity=3, requested_at=now - timedelta(hours=2))
+        second = self.factory.order(products=[self.uses_a], quantity=3, requested_at=now - timedelta(hours=1))
+        third = self.factory.order(products=[self.uses_b], quantity=5, requested_at=now)
+        result = fulfilment.fulfil_orders([third.pk, second.pk, first.pk], self.user)
+        self.assertEqual(result.fulfilled, [first.pk, third.pk])
+        self.assertEqual(result.short, {second.pk: {self.a.pk: 2}})
+        self.assertEqual(len(result.consumptions), 2)
+        self.assertEqual(
+            dict(Order.objects.values_list('pk', 'order_status')),
+            {first.pk: 'approved', second.pk: 'pending', third.pk: 'approved'},
+        )
+        self.assertEqual(ledger.replay([self.a.pk, self.b.pk]), {self.a.pk: (10, 6), self.b.pk: (5, 5)})
+        self.assertEqual(fulfilment.fulfil_orders([first.pk], self.user).fulfilled, [])
+
+    def test_query_count_does_not_grow_with_the_orders(self):
+        bom.get_boms([self.uses_a.pk, self.uses_b.pk])
+
+        def fulfil(count):
+            orders = [self.factory.order(products=[self.uses_a, self.uses_b]) for _ in range(count)]
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(len(fulfilment.fulfil_orders([o.pk for o in orders], self.user).fulfilled), count)
+            return len(queries)
+
+        self.assertEqual(fulfil(1), fulfil(4))
+
+
+class CostingTests(TestCase):
+
+    def setUp(self):
+        self.user = make_user()
+        self.factory = InventoryFactory(self.user)
+        self.taxed = self.factory.material(price=10, tax=18)
+        self.untaxed = self.factory.material(price=4, tax=0)
+        self.both = self.factory.product([self.taxed, self.untaxed], quantity=2)
+        self.one = self.factory.product([self.untaxed])
+        self.none = self.factory.product()
+        self.factory.product([self.taxed], is_archived=True)
+
+    def costs(self, rollup):
+        return {pk: tuple(round(value, 6) for value in line.values()) for pk, line in rollup.as_dict().items()}
+
+    def test_rollup_and_what_if(self):
+        with self.assertNumQueries(3):
+            catalogue = costing.Catalogue.load()
+        self.assertEqual(self.costs(catalogue.rollup()), {
+            self.both.pk: (28, 3.6, 68.4), self.one.pk: (4, 0, 96), self.none.pk: (0, 0, 100),
+        })
+        rise = catalogue.what_if(suppliers={self.taxed.supplier_id: 10})
+        self.assertEqual(self.costs(rise)[self.both.pk], (30, 3.96, 66.04))
+        self.assertEqual(self.costs(rise)[self.one.pk], (4, 0, 96))
+        cut = catalogue.what_if(materials={self.untaxed.pk: -50})
+        self.assertEqual(self.costs(cut)[self.both.pk], (24, 3.6, 72.4))
+        self.assertEqual(round(float(cut.margin_ratio[catalogue.product_ids.index(self.one.pk)]), 6), 0.98)
+
+    def test_save_writes_costs_and_marked_up_prices(self):
+        rollup = costing.Catalogue.load().rollup()
+        self.assertEqual(costing.save(rollup, markup=25), 3)
+        both = Product.objects.get(pk=self.both.pk)
+        self.assertEqual((both.material_cost, round(both.material_tax, 6), round(both.price, 6)), (28, 3.6, 39.5))
+        self.assertIsNotNone(both.costed_at)
+        self.assertEqual(Product.objects.get(pk=self.none.pk).price, 0)
+
+
+@override_settings(QUERY_BUDGET_ENFORCE=True)
+class AvailabilityTests(TestCase):
+
+    def setUp(self):
+        self.user = make_user()
+        self.factory = InventoryFactory(self.user)
+        self.a, self.b = self.factory.material(), self.factory.material()
+        ledger.record_adjustment(self.a.pk, 10, self.user)
+        ledger.record_adjustment(self.b.pk, 3, self.user)
+        self.product = self.factory.product(materials=[self.a, self.b], quantity=2)
+
+    def test_sync_view(self):
+        self.client.force_login(self.user)
+        response = self.client.get(f'/availability/?items={self.product.pk}:2').json()['products']
+        self.assertEqual(response[str(self.product.pk)], {
+            'quantity': 2, 'available': False, 'buildable': 1, 'short': {str(self.b.pk): '1.000000'},
+        })
+        self.assertEqual(self.client.get('/availability/?items=nope').status_code, 400)
+
+    def test_async_view_coalesces_to_the_sync_answer(self):
+        client = AsyncClient()
+        client.force_login(self.user)
+        url = f'/availability/async/?items={self.product.pk}:1'
+
+        async def burst():
+            responses = await asyncio.gather(*(client.get(url) for _ in range(5)))
+            _, available_loader = availability.loaders()
+            return responses, available_loader.stats
+
+        responses, stats = async_to_sync(burst)()
+        expected = availability.check({self.product.pk: 1})
+        for response in responses:
+            self.assertEqual(response.json()['products'], expected)
+        self.assertEqual(stats['requested'], 10)
+        self.assertLess(stats['batches'], 5)
+
+
+@override_settings(QUERY_BUDGET_ENFORCE=True)
+class JobQueueTests(TestCase):
+
+    def setUp(self):
+        self.user = make_user()
+        self.factory = InventoryFactory(self.user)
+        self.calls = []
+
+        def flaky(batch):
+            self.calls.append(sorted(job.payload['n'] for job in batch))
+            return {job.pk: 'odd' for job in batch if job.payload['n'] % 2}
+
+        jobs.HANDLERS['test.flaky'] = flaky
+        self.addCleanup(jobs.HANDLERS.pop, 'test.flaky')
+
+    def test_idempotency_key(self):
+        first = jobs.enqueue('test.flaky', {'n': 0}, key='same')
+        second = jobs.enqueue('test.flaky', {'n': 0}, key='same')
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_batches_and_retries(self):
+        jobs.enqueue_many('test.flaky', [({'n': n}, None) for n in range(4)], max_attempts=2)
+        self.assertEqual(jobs.work(batch_size=10, burst=True), 4)
+        self.assertEqual(self.calls, [[0, 1, 2, 3]])
+        statuses = dict(Job.objects.values_list('payload__n', 'status'))
+        self.assertEqual(statuses, {0: 'done', 1: 'queued', 2: 'done', 3: 'queued'})
+
+        Job.objects.filter(status='queued').update(run_after=timezone.now())
+        jobs.work(batch_size=10, burst=True)
+        failed = Job.objects.filter(status='failed')
+        self.assertEqual(sorted(failed.values_list('payload__n', flat=True)), [1, 3])
+        self.assertEqual({job.last_error for job in failed}, {'odd'})
+
+    def test_a_reclaimed_job_is_finished_only_by_its_new_owner(self):
+        jobs.enqueue('test.flaky', {'n': 2})
+        first = jobs.claim(10)
+        Job.objects.update(locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(jobs.requeue_stale(timedelta(minutes=10)), 1)
+        second = jobs.claim(10)
+        jobs.run(first)
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.locked_by), ('running', second[0].locked_by))
+        jobs.run(second)
+        self.assertEqual(Job.objects.get().status, 'done')
+
+    def test_transitions_of_orders_that_moved_on_fail_with_the_reason(self):
+        order = self.factory.order()
+        job = jobs.enqueue('order.start', {'order_id': str(order.pk), 'user_id': str(self.user.pk)})
+        jobs.work(burst=True)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 1))
+        self.assertEqual(job.last_error, f"Order {order.pk} is 'pending', not 'approved'.")
+        self.assertEqual(Order.objects.get(pk=order.pk).order_status, 'pending')
+
+    def test_status_endpoint_queues_the_transition(self):
+        material = self.factory.material()
+        ledger.record_adjustment(material.pk, 5, self.user)
+        order = self.factory.order(products=[self.factory.product(materials=[material])], quantity=2)
+        api = APIClient()
+        api.force_authenticate(self.user)
+        url = f'/api/orders/{order.pk}/status/'
+        self.assertEqual(api.post(url, {'status': 'completed'}, format='json').status_code, 409)
+        response = api.post(url, {'status': 'approved'}, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(Order.objects.get(pk=order.pk).order_status, 'pending')
+
+        jobs.work(burst=True)
+        self.assertEqual(api.get(f'/api/jobs/{response.json()["id"]}/').json()['status'], 'done')
+        self.assertEqual(Order.objects.get(pk=order.pk).order_status, 'approved')
+        self.assertEqual(ledger.reserved(material.pk), 2)
+
+
+@override_settings(QUERY_BUDGET_ENFORCE=True)
+class InstrumentationTests(TestCase):
+
+    def setUp(self):
+        self.user = make_user()
+        self.factory = InventoryFactory(self.user)
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+        instrumentation.metrics.reset()
+
+    def test_duplicate_fingerprints(self):
+        suppliers = [self.factory.supplier() for _ in range(3)]
+        with instrumentation.record() as recording:
+            for supplier in suppliers:
+                Supplier.objects.get(pk=supplier.pk).created_by
+            list(Supplier.objects.filter(pk__in=[s.pk for s in suppliers]))
+        self.assertEqual(recording.count, 7)
+        self.assertEqual(recording.duplicate_count, 4)
+        self.assertEqual(sorted(recording.duplicates.values()), [3, 3])
+
+    def test_budget_failure(self):
+        with self.settings(QUERY_BUDGETS={'supplier-list': {'queries': 0}}):
+            with self.assertRaises(instrumentation.QueryBudgetExceeded):
+                self.api.get('/api/suppliers/')
+
+    def test_prometheus_exposition(self):
+        response = self.api.get('/api/suppliers/')
+        self.assertIn('db;dur=', response['Server-Timing'])
+        with self.settings(METRICS_TOKEN='s3cret'):
+            text = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret').content.decode()
+        self.assertIn('inventory_http_requests_total{view="supplier-list",method="GET",status="200"} 1', text)
+        self.assertIn('inventory_db_queries_per_request_bucket{view="supplier-list",method="GET",le="1"} 1', text)
+
+    def test_metrics_access(self):
+        # Loopback alone is no longer enough: behind a proxy every client is.
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        with self.settings(METRICS_TOKEN='s3cret'):
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer nope').status_code, 403)
+        with self.settings(METRICS_ALLOWED_NETWORKS=['10.1.0.0/16']):
+            self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.1.2.3').status_code, 200)
+            self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.2.0.1').status_code, 403)
+        self.client.force_login(make_user('staff', is_staff=True))
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+
+class AdminChangelistTests(TestCase):
+
+    def setUp(self):
+        self.user = make_user(is_staff=True, is_superuser=True)
+        self.factory = InventoryFactory(self.user)
+        self.client.force_login(self.user)
+
+    def add_rows(self, n):
+        product = self.factory.product()
+        order = self.factory.order(products=[product])
+        order_product = order.order_products.get()
+        for _ in range(n):
+            material = self.factory.material()
+            self.factory.stock(material)
+            self.factory.purchase(material)
+            MaterialConsumption.objects.create(
+                order_product=order_product, material=material, quantity=1, comment='', **self.factory.audit,
+            )
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelist_query_count_is_constant(self):
+        urls = ['/admin/main/stock/', '/admin/main/purchase/', '/admin/main/materialconsumption/']
+        self.add_rows(2)
+        before = [self.count_queries(url) for url in urls]
+        self.add_rows(10)
+        for url, n in zip(urls, before):
+            with self.subTest(url=url):
+                self.assertEqual(self.count_queries(url), n)
+
+    def test_archived_rows_are_hidden_by_default(self):
+        live = self.factory.stock()
+        archived = self.factory.stock()
+        Stock.objects.filter(pk=archived.pk).update(is_archived=True)
+        response = self.client.get('/admin/main/stock/')
+        self.assertEqual([row.pk for row in response.context['cl'].result_list], [live.pk])
+        response = self.client.get('/admin/main/stock/?archived=all')
+        self.assertEqual(len(response.context['cl'].result_list), 2)
+
+
+class AuditTests(TestCase):
+
+    def setUp(self):
+        self.user = make_user(is_staff=True, is_superuser=True)
+        self.clerk = make_user('clerk')
+
+    def test_acting_user_stamps_bulk_writes_without_queries(self):
+        with audit.acting_as(self.clerk):
+            with self.assertNumQueries(1):
+                Supplier.objects.bulk_create([Supplier(name=f'supplier {i}') for i in range(3)])
+            suppliers = list(Supplier.objects.all())
+            self.assertEqual({(s.created_by_id, s.updated_by_id) for s in suppliers}, {(self.clerk.pk, self.clerk.pk)})
+
+        with audit.acting_as(self.user.pk):
+            Supplier.objects.filter(pk=suppliers[0].pk).update(name='renamed')
+            suppliers[1].name = 'renamed too'
+            with self.assertNumQueries(1):
+                Supplier.objects.bulk_update(suppliers[1:2], ['name'])
+            client = Client.objects.create(name='client')
+        updated = dict(Supplier.objects.values_list('pk', 'updated_by_id'))
+        self.assertEqual(
+            [updated[s.pk] for s in suppliers], [self.user.pk, self.user.pk, self.clerk.pk],
+        )
+        self.assertEqual((client.created_by_id, client.updated_by_id), (self.user.pk, self.user.pk))
+
+    def test_users_in_use_are_found_in_one_query_and_can_be_deactivated(self):
+        fresh = make_user('fresh')
+        InventoryFactory(self.clerk).supplier()
+        with self.assertNumQueries(1):
+            self.assertEqual(audit.in_use([self.clerk.pk, fresh.pk]), {self.clerk.pk})
+        self.assertEqual(audit.deactivate([self.clerk.pk]), 1)
+        self.clerk.refresh_from_db()
+        self.assertEqual((self.clerk.is_active, self.clerk.is_archived), (False, True))
+
+        self.client.force_login(self.user)
+        response = self.client.get(f'/admin/main/user/{self.clerk.pk}/delete/')
+        self.assertContains(response, 'deactivate instead')
+
+
+class OrderSummaryTests(TestCase):
+
+    def setUp(self):
+        self.user = make_user(is_staff=True)
+        self.factory = InventoryFactory(self.user)
+        self.client_row = self.factory.client()
+        self.product = self.factory.product(price=50)
+        self.order = self.factory.order(self.client_row, [self.product], quantity=3)
+
+    def rows(self, **params):
+        response = self.client.get('/api/dashboard/orders/', params)
+        self.assertEqual(response.status_code, 200)
+        return [(row['order_status'], row['orders'], row['total_units'], row['total_value']) for row in response.json()]
+
+    def test_summary_follows_orders_and_keeps_the_price_they_were_placed_at(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.rows(), [('pending', 1, 3, 150.0)])
+        self.product.price = 80
+        self.product.save()
+        self.factory.order(self.factory.client(), [self.product], quantity=1)
+        self.assertEqual(summary.reconcile(), ([], 0))
+        self.assertEqual(self.rows(client=str(self.client_row.pk)), [('pending', 1, 3, 150.0)])
+
+        summary.set_status([self.order.pk], 'approved', self.user)
+        self.assertEqual(self.rows(), [('approved', 1, 3, 150.0), ('pending', 1, 1, 80.0)])
+        self.assertEqual(summary.reconcile(), ([], 0))
+        OrderSummary.objects.update(units=0)
+        self.assertEqual(summary.reconcile(fix=True)[1], 2)
+        self.assertEqual(summary.reconcile(), ([], 0))
+
+    def test_dashboard_rejects_bad_parameters(self):
+        self.client.force_login(self.user)
+        for params in ({'client': 'nope'}, {'since': '2024-02-30'}, {'until': 'tomorrow'}):
+            self.assertEqual(self.client.get('/api/dashboard/orders/', params).status_code, 400, params)
+
+
+class SearchTests(TestCase):
+
+    def setUp(self):
+        self.user = make_user()
+        self.factory = InventoryFactory(self.user)
+        self.bolts = self.factory.material(name='Steel bolts M8')
+        self.product = self.factory.product(name='Bolted shelf', description='Steel shelving unit')
+        self.supplier = Supplier.objects.create(name='Acme Steelworks', email='sales@acme.test', **self.factory.audit)
+        self.client.force_login(self.user)
+
+    def test_ranks_prefix_and_typo_matches_across_types(self):
+        hits = search.search('steel')
+        self.assertEqual(
+            [(hit.kind, hit.id) for hit in hits],
+            [('material', self.bolts.pk), ('supplier', self.supplier.pk), ('product', self.product.pk)],
+        )
+        self.assertEqual({hit.id for hit in search.search('bol')}, {self.bolts.pk, self.product.pk})
+        self.assertEqual(search.search('stel bolts')[0].id, self.bolts.pk)
+        self.assertEqual([hit.id for hit in search.search('steel', kinds=['supplier'])], [self.supplier.pk])
+
+    def test_entries_follow_saves_archiving_and_rebuilds(self):
+        self.bolts.name = 'Brass bolts'
+        self.bolts.save()
+        self.assertEqual([hit.id for hit in search.search('brass')], [self.bolts.pk])
+        Material.objects.filter(pk=self.bolts.pk).update(is_archived=True)
+        self.assertEqual(search.rebuild(), {'material': 0, 'product': 1, 'supplier': 2, 'client': 0})
+        self.assertEqual(search.search('brass'), [])
+        self.assertFalse(SearchEntry.objects.filter(object_id=self.bolts.pk).exists())
+
+    @override_settings(QUERY_BUDGET_ENFORCE=True)
+    def test_endpoint(self):
+        response = self.client.get('/api/search/', {'q': 'acme', 'types': 'supplier,client'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['id'] for row in response.json()], [str(self.supplier.pk)])
+        self.assertEqual(self.client.get('/api/search/', {'q': 'acme', 'types': 'order'}).status_code, 400)
+        for limit in ('x', 0, -1):
+            self.assertEqual(self.client.get('/api/search/', {'q': 'acme', 'limit': limit}).status_code, 400)
+
+
+class OutboxTests(TestCase):
+
+    def setUp(self):
+        self.user = make_user(is_staff=True)
+        self.factory = InventoryFactory(self.user)
+        self.material = self.factory.material()
+        self.stock = self.factory.stock(self.material)
+        self.order = self.factory.order()
+
+    def events(self, after=0):
+        events, cursor = feed.pull(after)
+        return [(e.kind, e.object_id, e.action) for e in events], cursor
+
+    def test_saves_bulk_writes_and_updates_append_events_in_order(self):
+        purchases = Purchase.objects.bulk_create([
+            Purchase(supplier=self.material.supplier, material=self.material, quantity=5, requested_user=self.user,
+                     **self.factory.audit),
+        ])
+        Order.objects.filter(pk=self.order.pk).update(order_status='approved')
+        self.stock.quantity = 7
+        Stock.objects.bulk_update([self.stock], ['quantity'])
+        Purchase.objects.filter(pk=purchases[0].pk).update(is_archived=True)
+        Stock.objects.filter(pk__in=[]).update(quantity=0)
+
+        events, cursor = self.events()
+        self.assertEqual(events, [
+            ('stock', self.stock.pk, 'created'), ('order', self.order.pk, 'created'),
+            ('purchase', purchases[0].pk, 'created'), ('order', self.order.pk, 'updated'),
+            ('stock', self.stock.pk, 'updated'), ('purchase', purchases[0].pk, 'archived'),
+        ])
+        self.assertEqual(cursor, 6)
+        latest = OutboxEvent.objects.get(seq=5)
+        self.assertEqual(
+            latest.payload, {'is_archived': False, 'material_id': str(self.material.pk), 'quantity': '7.000000'},
+        )
+        self.assertEqual(self.events(cursor), ([], cursor))
+
+    def test_large_updates_go_in_primary_key_ranges(self):
+        stocks = [self.factory.stock(self.material) for _ in range(4)]
+        _, cursor = self.events()
+        with mock.patch.object(outbox, 'BATCH_SIZE', 2), CaptureQueriesContext(connection) as queries:
+            self.assertEqual(Stock.objects.filter(material=self.material).update(quantity=1), 5)
+        updates = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 3)
+        events, _ = self.events(cursor)
+        self.assertEqual(sorted(pk for _, pk, _ in events), sorted([self.stock.pk] + [s.pk for s in stocks]))
+
+    def test_cursor_only_moves_over_numbered_events_and_skips_other_kinds(self):
+        _, cursor = self.events()
+        pending = OutboxEvent.objects.create(kind='stock', object_id=self.stock.pk, action='updated', payload={})
+        self.assertIsNone(pending.seq)
+        self.factory.stock(self.material)
+        events, cursor = feed.pull(cursor, kinds=['order'])
+        self.assertEqual((events, cursor), ([], 4))
+        pending.refresh_from_db()
+        self.assertEqual(pending.seq, 3)
+
+    def test_compaction_keeps_the_latest_event_of_each_row(self):
+        for quantity in (1, 2, 3):
+            Stock.objects.filter(pk=self.stock.pk).update(quantity=quantity)
+        feed.sequence()
+        OutboxEvent.objects.update(created_at=timezone.now() - timedelta(days=30))
+        self.assertEqual(feed.compact(batch_size=2), 3)
+        events, _ = feed.pull()
+        self.assertEqual([(e.kind, e.payload['quantity'] if e.kind == 'stock' else None) for e in events],
+                         [('order', None), ('stock', '3.000000')])
+
+        job = feed.schedule()
+        jobs.run(jobs.claim(10, ['outbox.compact']))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done')
+        self.assertTrue(Job.objects.filter(kind='outbox.compact', status='queued').exists())
+
+    @override_settings(QUERY_BUDGET_ENFORCE=True)
+    def test_endpoint(self):
+        self.client.force_login(self.user)
+        response = self.client.get('/api/outbox/', {'after': 1, 'kinds': 'order'})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual([(e['seq'], e['id']) for e in body['events']], [(2, str(self.order.pk))])
+        self.assertEqual(body['next'], 2)
+        self.assertEqual(self.client.get('/api/outbox/', {'kinds': 'user'}).status_code, 400)
+        for limit in (0, -1):
+            self.assertEqual(self.client.get('/api/outbox/', {'limit': limit}).status_code, 400)
+        with self.assertRaises(CommandError):
+            call_command('stream_outbox', batch_size=0, stdout=io.StringIO())
+
+
+class IdTests(SimpleTestCase):
+
+    def test_uuid7_is_monotonic_and_carries_its_time(self):
+        before = timezone.now()
+        generated = [ids.uuid7() for _ in range(10000)]
+        self.assertEqual(generated, sorted(generated))
+        self.assertEqual(len(set(generated)), len(generated))
+        self.assertEqual({(u.version, u.variant) for u in generated}, {(7, uuid.RFC_4122)})
+        self.assertLess(abs(ids.uuid7_datetime(generated[0]) - before), timedelta(seconds=1))
+
+    def test_time_ordered_ids_are_opt_in(self):
+        self.assertFalse(settings.TIME_ORDERED_IDS)
+        self.assertEqual(ids.new_id().version, 4)
+        with self.settings(TIME_ORDERED_IDS=True):
+            self.assertEqual(ids.new_id().version, 7)
+
+
+class LiveIndexTests(TestCase):
+
+    def setUp(self):
+        self.user = make_user()
+        self.factory = InventoryFactory(self.user)
+        self.material = self.factory.material()
+        self.client_ = self.factory.client()
+
+    def test_hot_access_paths_use_the_partial_live_indexes(self):
+        paths = {
+            'stock_material_live_idx': Stock.objects.filter(material=self.material, is_archived=False),
+            'purchase_supplier_arr_live_idx': Purchase.objects.filter(
+                supplier=self.material.supplier, is_archived=False,
+            ).order_by('-arrived_at'),
+            'order_status_req_live_idx': Order.objects.filter(
+                order_status='pending', is_archived=False,
+            ).order_by('requested_at'),
+            'order_client_req_live_idx': Order.objects.filter(
+                client=self.client_, is_archived=False,
+            ).order_by('-requested_at'),
+            'material_supplier_live_idx': Material.objects.filter(supplier=self.material.supplier, is_archived=False),
+        }
+        for index, queryset in paths.items():
+            with self.subTest(index):
+                self.assertIn(index, queryset.explain())
+        # Archived rows aren't in the partial indexes, so they can't serve queries that include them.
+        self.assertNotIn('stock_material_live_idx', Stock.objects.filter(material=self.material).explain())
+
+    def test_benchmark_command(self):
+        out = io.StringIO()
+        call_command('bench_indexes', seed=30, chunk_size=7, repeat=2, stdout=out)
+        self.assertEqual(out.getvalue().count('p50 '), 5)
+        self.assertEqual(Order.objects.count(), 10)
+
+
+@override_settings(DATABASES={**settings.DATABASES, 'replica': {}}, REPLICA_DATABASE='replica')
+class ReplicaRoutingTests(SimpleTestCase):
+
+    def test_reporting_reads_use_the_replica_until_a_write(self):
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_read(Order), 'default')
+        with pinned():
+            self.assertEqual(router.db_for_read(Order), 'default')
+            with replica_reads():
+                self.assertEqual(router.db_for_read(Order), 'replica')
+                self.assertEqual(router.db_for_write(Order), 'default')
+                self.assertEqual(router.db_for_read(Order), 'default')
+        with replica_reads():
+            self.assertEqual(router.db_for_read(Order), 'replica')
+
+    @override_settings(REPLICA_DATABASE=None)
+    def test_without_a_replica_everything_uses_the_primary(self):
+        with replica_reads():
+            self.assertEqual(ReplicaRouter().db_for_read(Order), 'default')
+
+
+class BomCacheTests(TestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+        bom.clear_local()
+        bom.reset_stats()
+        self.user = make_user()
+        self.factory = InventoryFactory(self.user)
+        self.materials = [self.factory.material(), self.factory.material(qty_unit='ltr')]
+        self.product = self.factory.product(self.materials, quantity=2)
+
+    def test_lookups_come_from_the_local_then_the_shared_tier(self):
+        expected = tuple(sorted(
+            (bom.BomLine(m.pk, 2, m.qty_unit) for m in self.materials), key=lambda line: line.material_id,
+        ))
+        self.assertEqual(bom.get_bom(self.product.pk), expected)
+        with self.assertNumQueries(0):
+            self.assertEqual(bom.get_bom(self.product.pk), expected)
+            bom.clear_local()
+            self.assertEqual(bom.get_bom(self.product.pk), expected)
+        self.assertEqual(
+            {k: v for k, v in bom.stats().items() if k != 'invalidations'},
+            {'misses': 1, 'local_hits': 1, 'shared_hits': 1, 'local_entries': 1},
+        )
+
+    def test_edits_invalidate_and_racing_loads_are_not_cached(self):
+        bom.get_bom(self.product.pk)
+        line = ProductMaterial.objects.get(product=self.product, material=self.materials[0])
+        with self.captureOnCommitCallbacks(execute=True):
+            line.quantity = 5
+            line.save()
+        self.assertEqual({l.quantity for l in bom.get_bom(self.product.pk)}, {2, 5})
+
+        # An invalidation landing while a miss is loading: the loaded BOM is
+        # served, but not cached under the newer version.
+        other = self.factory.product(self.materials[:1], quantity=3)
+        load = bom.load
+
+        def racing_load(product_ids):
+            loaded = load(product_ids)
+            bom.invalidate(product_ids)
+            return loaded
+
+        with mock.patch.object(bom, 'load', side_effect=racing_load):
+            self.assertEqual(bom.get_bom(other.pk)[0].quantity, 3)
+        misses = bom.stats()['misses']
+        bom.get_bom(other.pk)
+        self.assertEqual(bom.stats()['misses'], misses + 1)
+
+
+class ReferenceCacheTests(TestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+        refdata.clear_local()
+        refdata.reset_stats()
+        self.user = make_user()
+        self.factory = InventoryFactory(self.user)
+
+    def test_warm_lookups_skip_the_database(self):
+        material = self.factory.material()
+        refdata.get(Material, material.pk)
+        with self.assertNumQueries(0):
+            cached = refdata.get(Material, material.pk)
+        self.assertEqual((cached.name, cached.supplier_id), (material.name, material.supplier_id))
+        self.assertEqual(refdata.stats()['local_hits'], 1)
+        with self.assertRaises(Material.DoesNotExist):
+            refdata.get(Material, Material().pk)
+
+    def test_save_and_archive_invalidate(self):
+        supplier = self.factory.supplier()
+        refdata.get(Supplier, supplier.pk)
+        supplier.name = 'renamed'
+        with self.captureOnCommitCallbacks(execute=True):
+            supplier.save()
+        self.assertEqual(refdata.get(Supplier, supplier.pk).name, 'renamed')
+        supplier.is_archived = True
+        with self.captureOnCommitCallbacks(execute=True):
+            supplier.save()
+        self.assertTrue(refdata.get(Supplier, supplier.pk).is_archived)
+
+    def test_attach_fills_foreign_keys(self):
+        stocks = [self.factory.stock() for _ in range(3)]
+        refdata.get_many(Material, [s.material_id for s in stocks])
+        fetched = list(Stock.objects.filter(pk__in=[s.pk for s in stocks]))
+        with self.assertNumQueries(0):
+            refdata.attach(fetched, 'material')
+            names = sorted(str(stock.material) for stock in fetched)
+        self.assertEqual(names, sorted(str(stock.material) for stock in stocks))
+
+    def test_local_tier_is_bounded(self):
+        clients = [self.factory.client() for _ in range(3)]
+        with self.settings(REFERENCE_CACHE={'LOCAL_MAX_ENTRIES': 2}):
+            refdata.get_many(Client, [c.pk for c in clients])
+            self.assertEqual(refdata.stats()['local_entries'], 2)
+            refdata.clear_local()
+            with self.assertNumQueries(0):
+                refdata.get_many(Client, [c.pk for c in clients])
+        self.assertEqual(refdata.stats()['shared_hits'], 3)
+
+
+class ArchiveTests(TestCase):
+
+    def setUp(self):
+        self.user = make_user()
+        self.factory = InventoryFactory(self.user)
+        self.material = self.factory.material()
+        self.live = self.factory.purchase(self.material, arrived_at=timezone.now())
+        self.old = [self.factory.purchase(self.material, arrived_at=timezone.now()) for _ in range(3)]
+        Purchase.objects.filter(pk__in=[p.pk for p in self.old]).update(
+            is_archived=True, created_at=timezone.now() - timedelta(days=365),
+        )
+        self.recent = self.factory.purchase(self.material)
+        Purchase.objects.filter(pk=self.recent.pk).update(is_archived=True)
+
+    def test_moves_old_archived_rows_in_batches(self):
+        moved = archive.move(Purchase, timezone.now() - timedelta(days=90), batch_size=2)
+        self.assertEqual(moved, 3)
+        self.assertEqual(set(Purchase.objects.values_list('pk', flat=True)), {self.live.pk, self.recent.pk})
+        self.assertEqual(set(ArchivedPurchase.objects.values_list('pk', flat=True)), {p.pk for p in self.old})
+        moved_row = ArchivedPurchase.objects.get(pk=self.old[0].pk)
+        self.assertEqual((moved_row.material_id, moved_row.quantity), (self.material.pk, self.old[0].quantity))
+        # The ledger keeps pointing at the moved rows.
+        self.assertEqual(StockMovement.objects.filter(purchase_id__in=[p.pk for p in self.old]).count(), 3)
+        self.assertEqual(ledger.replay([self.material.pk])[self.material.pk], (40, 0))
+        self.assertEqual(ledger.on_hand(self.material.pk), 40)
+
+    def test_history_reads_both_tables(self):
+        archive.move(Purchase, timezone.now() - timedelta(days=90))
+        ids = {row['id'] for row in archive.history(Purchase, 'id', material=self.material)}
+        self.assertEqual(ids, {self.live.pk, self.recent.pk} | {p.pk for p in self.old})
+        self.assertEqual(len(archive.history(Purchase, 'id', include_history=False, material=self.material)), 2)
+        exported = list(exporters.dataset('purchases', include_archived=True))
+        self.assertEqual(len(exported), 5)
+        self.assertEqual({row['material_name'] for row in exported}, {self.material.name})
+        self.assertEqual(len(exporters.dataset('purchases')), 1)
+
+
+class ExporterTests(TestCase):
+
+    def setUp(self):
+        self.user = make_user(is_staff=True)
+        self.factory = InventoryFactory(self.user)
+        self.stocks = [self.factory.stock(quantity=q) for q in (1, 2, 3)]
+        self.client.force_login(self.user)
+
+    def export(self, fmt):
+        return b''.join(exporters.export('stock', fmt, chunk_size=2))
+
+    def test_row_formats_agree(self):
+        expected = {str(s.pk): Decimal(s.quantity) for s in self.stocks}
+        rows = list(csv.DictReader(io.StringIO(self.export('csv').decode())))
+        self.assertEqual({row['id']: Decimal(row['quantity']) for row in rows}, expected)
+        rows = [json.loads(line) for line in self.export('jsonl').splitlines()]
+        self.assertEqual({row['id']: Decimal(row['quantity']) for row in rows}, expected)
+        # One row group per chunk.
+        groups = [json.loads(line) for line in self.export('columnar').splitlines()]
+        self.assertEqual([len(group['id']) for group in groups], [2, 1])
+        self.assertEqual(
+            {pk: Decimal(q) for group in groups for pk, q in zip(group['id'], group['quantity'])}, expected,
+        )
+
+    @skipUnless(importlib.util.find_spec('pyarrow'), 'needs pyarrow')
+    def test_parquet_has_a_row_group_per_chunk(self):
+        import pyarrow.parquet as pq
+        table = pq.ParquetFile(io.BytesIO(self.export('parquet')))
+        self.assertEqual(table.num_row_groups, 2)
+        self.assertEqual(sorted(table.read().column('id').to_pylist()), sorted(str(s.pk) for s in self.stocks))
+
+    def test_view_rejects_bad_timestamps_and_missing_dependencies(self):
+        response = self.client.get('/exports/purchases.csv?since=2024-02-30T00:00')
+        self.assertEqual(response.status_code, 400)
+        with mock.patch.dict(exporters.REQUIRES, {'csv': 'no_such_module'}):
+            self.assertEqual(self.client.get('/exports/stock.csv').status_code, 501)
+            with self.assertRaises(CommandError):
+                call_command('export_inventory', 'stock', stdout=io.StringIO())
+        response = self.client.get('/exports/stock.csv')
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 4)
+
+
+class ImporterTests(TestCase):
+
+    def setUp(self):
+        self.user = make_user()
+        self.factory = InventoryFactory(self.user)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write(self, name, text):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        return path
+
+    def test_csv_purchases_resolve_names_post_receipts_and_report_bad_rows(self):
+        material = self.factory.material(name='bolts', qty_unit='pieces')
+        MaterialUnit.objects.create(material=material, qty_unit='kg', factor=Decimal(1000))
+        path = self.write('purchases.csv', (
+            'supplier,material,quantity,qty_unit,requested_at,arrived_at\n'
+            f'{material.supplier.name},bolts,2,kg,2024-01-01T00:00,2024-01-02T00:00\n'
+            f'{material.supplier.name},nuts,1,kg,2024-01-01T00:00,\n'
+            f'{material.supplier.name},bolts,1,meter,2024-01-01T00:00,\n'
+            f'{material.supplier.name},bolts,many,kg,2024-01-01T00:00,\n'
+        ))
+        errors = []
+        importer = importers.Importer(path, 'purchases', self.user, report_error=errors.append).run()
+        self.assertEqual((importer.imported, importer.error_count), (1, 3))
+        self.assertEqual([(e.line, sorted(e.errors)) for e in errors], [
+            (3, ['material']), (4, ['qty_unit']), (5, ['quantity']),
+        ])
+        purchase = Purchase.objects.get()
+        self.assertEqual(purchase.base_quantity, Decimal(2000))
+        self.assertEqual(ledger.on_hand(material.pk), Decimal(2000))
+
+    def test_ids_must_exist_and_belong_together(self):
+        material, other = self.factory.material(), self.factory.supplier()
+        path = self.write('purchases.jsonl', '\n'.join(json.dumps(row) for row in [
+            {'supplier': str(material.supplier_id), 'material': str(material.pk), 'quantity': 1},
+            {'supplier': str(uuid.uuid4()), 'material': str(material.pk), 'quantity': 1},
+            {'supplier': str(material.supplier_id), 'material': str(uuid.uuid4()), 'quantity': 1},
+            {'supplier': str(other.pk), 'material': str(material.pk), 'quantity': 1},
+        ]) + '\n')
+        errors = []
+        importer = importers.Importer(path, 'purchases', self.user, report_error=errors.append).run()
+        self.assertEqual(importer.imported, 1)
+        self.assertEqual([(e.line, sorted(e.errors)) for e in errors], [
+            (2, ['supplier']), (3, ['material']), (4, ['material']),
+        ])
+        self.assertIn('Unknown material', errors[1].errors['material'])
+        self.assertIn('not supplied by this supplier', errors[2].errors['material'])
+        self.assertEqual(Purchase.objects.get().material_id, material.pk)
+
+    def test_malformed_jsonl_lines_are_reported_and_resume_skips_them(self):
+        path = self.write('suppliers.jsonl', '\n'.join([
+            '{"name": "one"}', '{"name": "two"}', '{"name": "thr', '[3]', '{"name": "four"}',
+        ]) + '\n')
+        checkpoint = os.path.join(self.directory, 'suppliers.checkpoint')
+        options = {'chunk_size': 1, 'transaction_size': 1, 'checkpoint': checkpoint}
+        with self.assertRaises(importers.ImportFailed):
+            importers.Importer(path, 'suppliers', self.user, max_errors=0, **options).run()
+        self.assertEqual(sorted(Supplier.objects.values_list('name', flat=True)), ['one', 'two'])
+
+        errors = []
+        importer = importers.Importer(path, 'suppliers', self.user, report_error=errors.append, **options).run()
+        self.assertEqual([e.line for e in errors], [3, 4])
+        self.assertIn('Invalid JSON', errors[0].errors['line'])
+        self.assertEqual(importer.imported, 1)
+        self.assertEqual(sorted(Supplier.objects.values_list('name', flat=True)), ['four', 'one', 'two'])
+        self.assertFalse(os.path.exists(checkpoint))
+
+
+class UnitConversionTests(TestCase):
+
+    def setUp(self):
+        self.user = make_user()
+        self.factory = InventoryFactory(self.user)
+        self.bolts = self.factory.material(qty_unit='pieces')
+        self.paint = self.factory.material(qty_unit='ltr')
+        MaterialUnit.objects.create(material=self.bolts, qty_unit='kg', factor=Decimal('412.5'))
+        MaterialUnit.objects.create(material=self.paint, qty_unit='kg', factor=Decimal('0.833333'))
+
+    def test_convert_is_exact_and_vectorized(self):
+        with self.assertNumQueries(2):
+            scaled = units.convert(
+                [self.bolts.pk, self.paint.pk, self.bolts.pk, self.paint.pk], [3, 3, 7, 5], ['kg', 'kg', None, 'ltr'],
+            )
+        self.assertEqual(
+            [units.to_decimal(value) for value in scaled],
+            [Decimal('1237.5'), Decimal('2.499999'), Decimal(7), Decimal(5)],
+        )
+        with self.assertRaises(units.UnitConversionError) as raised:
+            units.convert([self.bolts.pk], [1], ['meter'])
+        self.assertEqual(raised.exception.missing, [(self.bolts.pk, 'meter')])
+        self.assertEqual(units.convert([self.bolts.pk], [1], ['meter'], strict=False).tolist(), [-1])
+
+        # 412.5 pieces a kg: the product of 10**14 kg would wrap around an int64.
+        with self.assertRaises(units.QuantityOutOfRange) as raised:
+            units.convert([self.bolts.pk, self.bolts.pk], [2, 10 ** 14], ['kg', 'kg'])
+        self.assertEqual(raised.exception.positions, [1])
+        self.assertEqual(
+            units.convert([self.bolts.pk, self.bolts.pk], [2, 10 ** 14], ['kg', 'kg'], strict=False).tolist(),
+            [825 * units.SCALE, -1],
+        )
+
+    def test_sql_conversion_matches_and_purchases_are_stamped(self):
+        by_kg = self.factory.purchase(self.bolts, quantity=2, qty_unit='kg')
+        by_piece = self.factory.purchase(self.bolts, quantity=30, qty_unit='pieces')
+        unknown = self.factory.purchase(self.bolts, quantity=1, qty_unit='meter')
+        self.assertEqual(Purchase.objects.get(pk=by_kg.pk).base_quantity, Decimal(825))
+        self.assertIsNone(Purchase.objects.get(pk=unknown.pk).base_quantity)
+        converted = dict(units.annotate_base(Purchase.objects.all()).values_list('pk', 'base'))
+        self.assertEqual(converted, {by_kg.pk: Decimal(825), by_piece.pk: Decimal(30), unknown.pk: None})
+
+        # A new factor restamps that unit's purchases in one UPDATE.
+        MaterialUnit.objects.create(material=self.bolts, qty_unit='meter', factor=Decimal('2.5'))
+        self.assertEqual(Purchase.objects.get(pk=unknown.pk).base_quantity, Decimal('2.5'))
+        Purchase.objects.update(base_quantity=None)
+        self.assertEqual(units.restamp(), 3)
+        self.assertEqual(Purchase.objects.get(pk=by_kg.pk).base_quantity, Decimal(825))
+
+    def test_stock_sums_in_base_units(self):
+        self.factory.purchase(self.bolts, quantity=2, qty_unit='kg', arrived_at=timezone.now())
+        self.factory.purchase(self.bolts, quantity=4, qty_unit='kg')
+        self.assertEqual(ledger.on_hand(self.bolts.pk), 825)
+        self.assertEqual(planning.stock_positions([self.bolts.pk]).tolist(), [2475.0])
+
+    def test_fractional_receipts_are_posted_exactly(self):
+        MaterialUnit.objects.create(material=self.paint, qty_unit='ml', factor=Decimal('0.001'))
+        purchase = self.factory.purchase(self.paint, quantity=400, qty_unit='ml', arrived_at=timezone.now())
+        self.factory.purchase(self.paint, quantity=3, qty_unit='kg', arrived_at=timezone.now())
+        self.assertEqual(purchase.movements.get().on_hand_delta, Decimal('0.4'))
+        self.assertEqual(ledger.on_hand(self.paint.pk), Decimal('2.899999'))
+        self.assertEqual(ledger.replay([self.paint.pk]), {self.paint.pk: (Decimal('2.899999'), 0)})
+        at = timezone.now()
+        snapshots.take(at)
+        self.assertEqual(snapshots.as_of(at, [self.paint.pk]), {self.paint.pk: (Decimal('2.899999'), 0)})
+
+    def test_purchases_and_bills_of_materials_take_fractions(self):
+        scaled = units.convert([self.bolts.pk] * 2, [Decimal('2.5'), Decimal('0.000001')], ['kg'] * 2)
+        self.assertEqual([units.to_decimal(value) for value in scaled], [Decimal('1031.25'), Decimal('0.000413')])
+        purchase = self.factory.purchase(self.paint, quantity=Decimal('2.5'), qty_unit='ltr', arrived_at=timezone.now())
+        self.assertEqual(Purchase.objects.get(pk=purchase.pk).quantity, Decimal('2.5'))
+        self.assertEqual(ledger.on_hand(self.paint.pk), Decimal('2.5'))
+
+        product = self.factory.product([self.paint], quantity=Decimal('0.25'))
+        caches['default'].clear()
+        bom.clear_local()
+        bom.get_bom(product.pk)
+        bom.clear_local()
+        self.assertEqual(bom.get_bom(product.pk), (bom.BomLine(self.paint.pk, Decimal('0.25'), 'ltr'),))
+        self.assertEqual(availability.check({product.pk: 11})[str(product.pk)]['buildable'], 10)
+
+    def test_receipt_waits_for_a_conversion_factor(self):
+        purchase = self.factory.purchase(self.bolts, quantity=2, qty_unit='meter', arrived_at=timezone.now())
+        self.assertFalse(purchase.movements.exists())
+        self.assertEqual(ledger.on_hand(self.bolts.pk), 0)
+
+        unit = MaterialUnit.objects.create(material=self.bolts, qty_unit='meter', factor=Decimal(3))
+        self.assertEqual(list(purchase.movements.values_list('movement_type', 'on_hand_delta')), [('receipt', 6)])
+        unit.factor = Decimal(4)
+        unit.save()
+        self.assertEqual(ledger.on_hand(self.bolts.pk), 8)
+        self.assertEqual(purchase.movements.filter(movement_type='adjustment').count(), 1)
+
+
+class PlanningTests(TestCase):
+
+    def setUp(self):
+        self.user = make_user()
+        self.factory = InventoryFactory(self.user)
+        self.used, self.idle = self.factory.material(), self.factory.material()
+        self.today = timezone.localdate()
+        noon = timezone.localtime().replace(hour=12, minute=0, second=0, microsecond=0)
+        self.days_ago = lambda days: noon - timedelta(days=days)
+        line = self.factory.order(products=[self.factory.product()]).order_products.get()
+        for days in range(1, 6):
+            consumption = MaterialConsumption.objects.create(
+                order_product=line, material=self.used, quantity=10, comment='', **self.factory.audit,
+            )
+            MaterialConsumption.objects.filter(pk=consumption.pk).update(created_at=self.days_ago(days))
+        self.factory.purchase(self.used, quantity=5, requested_at=self.days_ago(7), arrived_at=self.days_ago(3))
+
+    def test_smoothing_and_folding(self):
+        self.assertEqual(planning.smoothing(1), 0.5)
+        rate, var = np.zeros(2), np.zeros(2)
+        start = self.today - timedelta(days=2)
+        watermark = np.array([start.toordinal(), self.today.toordinal()])
+        demand = {start + timedelta(days=1): (np.array([0, 1]), np.array([4.0, 4.0]))}
+        self.assertEqual(planning.fold_demand(rate, var, watermark, demand, start, self.today, half_life=1), 2)
+        # Only the first material folds: 4 then 0, and the second is already past the watermark.
+        self.assertEqual(rate.tolist(), [1.0, 0.0])
+        self.assertEqual(var.tolist(), [3.0, 0.0])
+        lead = planning.effective_lead_times(np.array([2.0, np.nan, np.nan]), np.array([0, 0, 1]))
+        self.assertEqual(lead.tolist(), [2.0, 2.0, planning.DEFAULT_LEAD_TIME_DAYS])
+
+    def test_plan_raises_drafts_once_and_later_runs_start_at_the_watermark(self):
+        result = planning.plan(history_days=10, today=self.today)
+        used = result.material_ids.index(self.used.pk)
+        self.assertEqual(result.days_folded, 10)
+        self.assertEqual(result.lead_time[used], 4)
+        self.assertEqual(result.position[used], -45)
+        self.assertTrue(0 < result.rate[used] < 10)
+        self.assertEqual(list(result.suggestions()), [self.used.supplier_id])
+
+        drafts = planning.save(result, self.user)
+        draft = Purchase.objects.get(is_draft=True)
+        self.assertEqual([p.pk for p in drafts[self.used.supplier_id]], [draft.pk])
+        self.assertEqual((draft.material_id, draft.base_quantity), (self.used.pk, Decimal(draft.quantity)))
+        self.assertEqual(MaterialPlan.objects.get(pk=self.used.pk).through_date, result.through_date)
+        self.assertEqual(MaterialPlan.objects.get(pk=self.idle.pk).demand_rate, 0)
+
+        again = planning.plan(history_days=10, today=self.today)
+        self.assertEqual(again.days_folded, 0)
+        self.assertEqual(again.rate[used], result.rate[used])
+        self.assertEqual(again.suggestions(), {})
+
+        # A new material reads its own history only; the planned ones stay at their watermark.
+        new = self.factory.material()
+        with mock.patch.object(planning, 'daily_demand', wraps=planning.daily_demand) as daily_demand:
+            later = planning.plan(history_days=10, today=self.today)
+        daily_demand.assert_called_once()
+        start, _, _, only = daily_demand.call_args.args
+        self.assertEqual((start, only), (result.through_date - timedelta(days=10), [new.pk]))
+        self.assertEqual(later.days_folded, 10)
+        self.assertEqual(later.rate[later.material_ids.index(self.used.pk)], result.rate[used])
+
+
+class StockSnapshotTests(TestCase):
+
+    def setUp(self):
+        self.user = make_user(is_staff=True)
+        self.factory = InventoryFactory(self.user)
+        self.now = timezone.now()
+        self.materials = [self.factory.material() for _ in range(3)]
+        for days_ago, material, quantity in ((30, 0, 10), (20, 1, 5), (10, 0, -4), (5, 2, 7), (1, 1, 3)):
+            self.adjust(self.materials[material], quantity, self.now - timedelta(days=days_ago))
+
+    def adjust(self, material, quantity, at):
+        movements = ledger.record_adjustment(material.pk, quantity, self.user)
+        StockMovement.objects.filter(pk=movements[0].pk).update(created_at=at)
+
+    def test_as_of_starts_from_the_nearest_snapshot(self):
+        self.assertEqual(snapshots.backfill(self.now - timedelta(days=25), self.now, every=timedelta(days=7)), 4)
+        snapshot = snapshots.nearest(self.now - timedelta(days=6))
+        self.assertEqual(snapshot.taken_at, self.now - timedelta(days=11))
+        self.assertEqual(snapshots.read(snapshot), {self.materials[0].pk: (10, 0), self.materials[1].pk: (5, 0)})
+
+        for days_ago in (40, 25, 15, 6, 3, 0):
+            at = self.now - timedelta(days=days_ago)
+            self.assertEqual(snapshots.as_of(at), ledger.replay(until=at))
+        ids = [self.materials[1].pk, self.materials[2].pk]
+        with self.assertNumQueries(2):
+            balances = snapshots.as_of(self.now - timedelta(days=2), ids)
+        self.assertEqual(balances, {self.materials[1].pk: (5, 0), self.materials[2].pk: (7, 0)})
+        self.assertEqual(snapshots.take(snapshot.taken_at), snapshot)
+        with self.assertRaises(ValueError):
+            snapshots.backfill(self.now - timedelta(days=1), self.now, every=timedelta(0))
+        with self.assertRaises(CommandError):
+            call_command('stock_snapshots', backfill_days=1, every_hours=0, stdout=io.StringIO())
+
+    def test_endpoint_and_job(self):
+        job = snapshots.schedule()
+        jobs.run(jobs.claim(10, ['stock.snapshot']))
+        job.refresh_from_db()
+        self.assertEqual((job.status, StockSnapshot.objects.count()), ('done', 1))
+        self.assertTrue(Job.objects.filter(kind='stock.snapshot', status='queued').exists())
+
+        self.client.force_login(self.user)
+        with override_settings(QUERY_BUDGET_ENFORCE=True):
+            response = self.client.get('/api/stock/as-of/', {
+                'at': (self.now - timedelta(days=15)).isoformat(), 'materials': str(self.materials[0].pk),
+            })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [{'material': str(self.materials[0].pk), 'on_hand': 10, 'reserved': 0}])
+        self.assertEqual(self.client.get('/api/stock/as-of/', {'at': 'yesterday'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/stock/as-of/', {'at': '2024-13-45T00:00'}).status_code, 400)
+
+
+class SyntheticDataTests(TestCase):
+
+    def test_generated_data_is_consistent_and_benchmarks_run(self):
+        now = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        snapshots.take(now)
+        counts = synthetic.generate(2000, seed=7, now=now)
+        self.assertEqual(counts['Order'], Order.objects.count())
+        self.assertEqual(snapshots.as_of(now), ledger.replay(until=now))
+        replayed = ledger.replay()
+        balances = ledger.get_balances(list(replayed))
+        self.assertEqual({m: (b.on_hand, b.reserved) for m, b in balances.items()}, replayed)
+        self.assertEqual(summary.reconcile(), ([], 0))
+        statuses = set(Order.objects.values_list('order_status', flat=True))
+        self.assertLessEqual(statuses, {'pending', 'approved', 'in progress', 'completed'})
+        with self.assertRaises(ValueError):
+            synthetic.generate(2000, seed=7, now=now)
+
+        results = benchmarks.run(repeat=1, warmup=0)
+        self.assertEqual(set(results['results']), set(benchmarks.BENCHMARKS))
+        json.dumps(results)
+        self.assertEqual(Order.objects.count(), counts['Order'])
+
+    def test_command_rejects_impossible_dates(self):
+        for now in ('2025-02-30', 'yesterday'):
+            with self.subTest(now), self.assertRaises(CommandError):
+                call_command('generate_data', rows=10_000, now=now, stdout=io.StringIO(), stderr=io.StringIO())
+        self.assertFalse(Order.objects.exists())
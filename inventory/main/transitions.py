@@ -0,0 +1,104 @@
+"""Order status workflow, run in the background by ``main.jobs``.
+
+``request_transition`` only checks that the move is the next step of
+``pending -> approved -> in progress -> completed`` and queues a job, so
+the status endpoint answers without touching stock. The handlers then do
+the work for every queued order of a kind at once:
+
+* ``approved``    - reserve the materials (``fulfilment.fulfil_orders``);
+  orders that are short of stock are retried with backoff until stock
+  arrives or the job runs out of attempts.
+* ``in progress`` - allocate the order's reservations in the ledger.
+* ``completed``   - stamp ``finished_at``.
+
+Each step moves the order's status and its summary buckets itself. A job
+whose order is no longer in the previous status (it was moved or archived
+after the job was queued) fails at once with the reason.
+"""
+from collections import defaultdict
+from uuid import UUID
+
+from django.utils import timezone
+
+from main import fulfilment, jobs, ledger, summary
+from main.constants import ORDER_STATUS_CHOICES
+from main.models import MaterialConsumption, Order, User
+
+STATUSES = [status for status, _ in ORDER_STATUS_CHOICES]
+KINDS = {'approved': 'order.approve', 'in progress': 'order.start', 'completed': 'order.complete'}
+
+
+class InvalidTransition(Exception):
+    pass
+
+
+def previous(status):
+    return STATUSES[STATUSES.index(status) - 1]
+
+
+def request_transition(order, status, user):
+    """Queue the move of ``order`` to ``status``; returns the ``Job``."""
+    if status not in KINDS:
+        raise InvalidTransition(f'Unknown status {status!r}.')
+    if order.order_status != previous(status):
+        raise InvalidTransition(f'Cannot move a {order.order_status!r} order to {status!r}.')
+    return jobs.enqueue(
+        KINDS[status],
+        {'order_id': str(order.pk), 'user_id': str(user.pk)},
+        key=f'order:{order.pk}:{status}',
+    )
+
+
+def _by_user(batch, status):
+    """``({user: {order_id: job}}, failed)`` for the jobs whose order is still in the previous status.
+
+    ``failed`` is the handler's ``{job_id: message}`` for the others.
+    """
+    expected = previous(status)
+    wanted = {UUID(job.payload['order_id']): job for job in batch}
+    rows = Order.objects.filter(pk__in=list(wanted)).values_list('pk', 'order_status', 'is_archived')
+    orders = {pk: (order_status, is_archived) for pk, order_status, is_archived in rows}
+    users = User.objects.in_bulk({UUID(job.payload['user_id']) for job in batch})
+    grouped = defaultdict(dict)
+    failed = {}
+    for order_id, job in wanted.items():
+        order_status, is_archived = orders.get(order_id, (None, False))
+        if order_status is None:
+            failed[job.pk] = jobs.Permanent(f'Order {order_id} no longer exists.')
+        elif is_archived:
+            failed[job.pk] = jobs.Permanent(f'Order {order_id} was archived.')
+        elif order_status != expected:
+            failed[job.pk] = jobs.Permanent(f'Order {order_id} is {order_status!r}, not {expected!r}.')
+        else:
+            grouped[users[UUID(job.payload['user_id'])]][order_id] = job
+    return grouped, failed
+
+
+@jobs.handler('order.approve')
+def approve(batch):
+    grouped, failed = _by_user(batch, 'approved')
+    for user, orders in grouped.items():
+        result = fulfilment.fulfil_orders(list(orders), user)
+        for order_id, missing in result.short.items():
+            failed[orders[order_id].pk] = 'Short of stock: ' + ', '.join(f'{m}: {q}' for m, q in missing.items())
+    return failed
+
+
+@jobs.handler('order.start')
+def start(batch):
+    grouped, failed = _by_user(batch, 'in progress')
+    for user, orders in grouped.items():
+        consumption_ids = MaterialConsumption.objects.filter(
+            order_product__order_id__in=list(orders), is_allocated=False, is_archived=False,
+        ).values_list('pk', flat=True)
+        ledger.allocate(list(consumption_ids), user)
+        summary.set_status(orders, 'in progress', user)
+    return failed
+
+
+@jobs.handler('order.complete')
+def complete(batch):
+    grouped, failed = _by_user(batch, 'completed')
+    for user, orders in grouped.items():
+        summary.set_status(orders, 'completed', user, finished_at=timezone.now())
+    return failed
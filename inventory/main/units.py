@@ -0,0 +1,203 @@
+"""Conversion of quantities into each material's own unit.
+
+Every material is counted in its ``qty_unit`` (the base unit); stock,
+consumption and the ledger are kept in it. A purchase may be made in any
+unit, so ``Purchase.base_quantity`` stores its quantity converted to the
+base unit, exactly, as a decimal. How many base units one unit of a
+material makes is a ``MaterialUnit`` row; a quantity already in the base
+unit (or with no unit) converts as is, and anything else without a factor
+can't be converted.
+
+Conversions are done a batch at a time, never a row at a time:
+
+* ``convert`` takes arrays of material ids, quantities and units and
+  returns the base quantities in one NumPy pass. Factors are integers in
+  millionths (``SCALE``) and quantities whole units plus millionths, so
+  the arithmetic is exact up to rounding the result to a millionth.
+* ``base_quantity`` is the same conversion as a SQL expression, for
+  ``annotate``, ``aggregate`` and ``update``; ``annotate_base`` and
+  ``restamp`` use it so a queryset converts in one statement.
+* ``stamp`` fills ``base_quantity`` on unsaved purchases before a
+  ``bulk_create``, with one query for the factors.
+
+An arrived purchase adds its base quantity to stock, so one that can't be
+converted posts no receipt until a factor exists; ``restamp`` then posts
+it, or the difference when a factor changes.
+"""
+from decimal import Decimal
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Case, DecimalField, ExpressionWrapper, OuterRef, Q, Subquery, When
+from django.db.models.functions import Cast
+
+from main import ledger
+from main.models import Material, MaterialUnit, Purchase
+
+SCALE = 10 ** 6
+EXPONENT = Decimal(1) / SCALE
+# Largest base quantity, in millionths, ``convert`` can return.
+MAX_SCALED = np.iinfo(np.int64).max
+# Arrived purchases posted to the ledger per batch by ``restamp``.
+BATCH_SIZE = 1000
+
+
+class UnitConversionError(ValueError):
+
+    def __init__(self, missing):
+        self.missing = sorted(missing, key=str)
+        pairs = ', '.join(f'{material_id} in {qty_unit}' for material_id, qty_unit in self.missing[:5])
+        more = f' and {len(self.missing) - 5} more' if len(self.missing) > 5 else ''
+        super().__init__(f'No conversion factor for {pairs}{more}.')
+
+
+class QuantityOutOfRange(ValueError):
+
+    def __init__(self, positions):
+        self.positions = list(positions)
+        super().__init__(
+            f'{len(self.positions)} quantities are too large to convert to base units '
+            f'(at most {MAX_SCALED // SCALE}).'
+        )
+
+
+def factors(material_ids=None):
+    """``{(material_id, qty_unit): Decimal}`` for ``material_ids`` (default all), base units included."""
+    materials, material_units = Material.objects.all(), MaterialUnit.objects.all()
+    if material_ids is not None:
+        material_ids = set(material_ids)
+        materials = materials.filter(pk__in=material_ids)
+        material_units = material_units.filter(material_id__in=material_ids)
+    table = {(pk, qty_unit): Decimal(1) for pk, qty_unit in materials.values_list('pk', 'qty_unit').iterator()}
+    table.update(
+        ((material_id, qty_unit), factor)
+        for material_id, qty_unit, factor in material_units.values_list('material_id', 'qty_unit', 'factor').iterator()
+    )
+    return table
+
+
+def to_decimal(scaled):
+    """A quantity in millionths (as ``convert`` returns) as an exact ``Decimal``."""
+    return (Decimal(int(scaled)) / SCALE).quantize(EXPONENT)
+
+
+def to_scaled(quantity):
+    """``quantity`` in whole millionths, the inverse of ``to_decimal``."""
+    return int((Decimal(str(quantity)) * SCALE).to_integral_value())
+
+
+def _split(quantities):
+    """Whole units and the millionths left over of ``quantities``, as two ``int64`` arrays."""
+    array = np.asarray(quantities)
+    if array.dtype.kind in 'iub':
+        whole = array.astype(np.int64)
+        return whole, np.zeros_like(whole)
+    parts = [divmod(to_scaled(quantity), SCALE) for quantity in quantities]
+    return (
+        np.array([whole for whole, _ in parts], dtype=np.int64).reshape(-1),
+        np.array([fraction for _, fraction in parts], dtype=np.int64).reshape(-1),
+    )
+
+
+def convert(material_ids, quantities, qty_units, table=None, strict=True):
+    """Base quantities, in millionths, of ``quantities`` of ``material_ids`` in ``qty_units``.
+
+    The three are parallel sequences; a ``None`` unit means the base unit.
+    Returns an ``int64`` array. Pairs without a factor raise
+    ``UnitConversionError``, and quantities whose result wouldn't fit in it
+    raise ``QuantityOutOfRange``; unless ``strict``, both come back as
+    ``-1``. ``table`` is a ``factors()`` result to reuse across calls.
+    """
+    material_ids = list(material_ids)
+    qty_units = list(qty_units)
+    whole, fraction = _split(quantities)
+    positions = {}
+    material_index = np.array([positions.setdefault(m, len(positions)) for m in material_ids], dtype=np.int64)
+    unit_names = sorted({unit for unit in qty_units if unit is not None})
+    columns = {unit: j for j, unit in enumerate(unit_names, 1)}
+    unit_index = np.array([0 if unit is None else columns[unit] for unit in qty_units], dtype=np.int64)
+    if table is None:
+        table = factors(material_ids) if columns else {}
+
+    # One row per distinct material, one column per unit; column 0 is "no
+    # unit", i.e. the base unit, and -1 marks a missing factor.
+    matrix = np.full((len(positions), len(columns) + 1), -1, dtype=np.int64)
+    matrix[:, 0] = SCALE
+    for material_id, i in positions.items():
+        for qty_unit, j in columns.items():
+            factor = table.get((material_id, qty_unit))
+            if factor is not None:
+                matrix[i, j] = int(factor.scaleb(6).to_integral_value())
+
+    scaled = matrix[material_index, unit_index]
+    missing = scaled < 0
+    if missing.any() and strict:
+        raise UnitConversionError({
+            (material_ids[i], qty_units[i]) for i in np.flatnonzero(missing).tolist()
+        })
+    # NumPy wraps around on overflow instead of raising, so check first.
+    overflow = ~missing & (np.abs(whole) + (fraction > 0) > MAX_SCALED // np.maximum(scaled, 1))
+    if overflow.any() and strict:
+        raise QuantityOutOfRange(np.flatnonzero(overflow).tolist())
+    invalid = missing | overflow
+    factor = np.where(invalid, 0, scaled)
+    # fraction * factor / SCALE, rounded, without a product that could overflow.
+    part = fraction * (factor // SCALE) + (fraction * (factor % SCALE) + SCALE // 2) // SCALE
+    result = whole * factor + part
+    if invalid.any():
+        return np.where(invalid, -1, result)
+    return result
+
+
+def base_quantity(quantity='quantity', qty_unit='qty_unit', material='material_id'):
+    """SQL for ``quantity`` in the material's own unit; NULL where there is no factor.
+
+    The arguments name the columns of the queryset it's used on. Only
+    subqueries are used, no joins, so it also works in ``update()``.
+    """
+    output = DecimalField(max_digits=20, decimal_places=6)
+    material_unit = Subquery(Material.objects.filter(pk=OuterRef(material)).values('qty_unit')[:1])
+    factor = Subquery(
+        MaterialUnit.objects.filter(material_id=OuterRef(material), qty_unit=OuterRef(qty_unit)).values('factor')[:1]
+    )
+    quantity = Cast(quantity, output)
+    return Case(
+        When(Q(**{f'{qty_unit}__isnull': True}) | Q(**{qty_unit: material_unit}), then=quantity),
+        default=ExpressionWrapper(quantity * factor, output_field=output),
+        output_field=output,
+    )
+
+
+def annotate_base(queryset, name='base'):
+    """``queryset`` with its quantities converted to base units as ``name``."""
+    return queryset.annotate(**{name: base_quantity()})
+
+
+def stamp(purchases, table=None):
+    """Set ``base_quantity`` on ``purchases``; raises ``UnitConversionError`` or ``QuantityOutOfRange`` if any can't convert."""
+    purchases = list(purchases)
+    if not purchases:
+        return purchases
+    scaled = convert(
+        [p.material_id for p in purchases], [p.quantity for p in purchases], [p.qty_unit for p in purchases],
+        table=table,
+    )
+    for purchase, value in zip(purchases, scaled.tolist()):
+        purchase.base_quantity = to_decimal(value)
+    return purchases
+
+
+def restamp(queryset=None):
+    """Recompute ``base_quantity`` of ``queryset`` (default all purchases) in one ``UPDATE``.
+
+    Arrived purchases among them then post what the new base quantity
+    changes to the ledger, ``BATCH_SIZE`` at a time.
+    """
+    if queryset is None:
+        queryset = Purchase.objects.all()
+    with transaction.atomic():
+        arrived = list(queryset.filter(arrived_at__isnull=False).order_by('pk').values_list('pk', flat=True))
+        updated = queryset.update(base_quantity=base_quantity())
+        for start in range(0, len(arrived), BATCH_SIZE):
+            ledger.record_purchases(Purchase.objects.filter(pk__in=arrived[start:start + BATCH_SIZE]))
+    return updated
@@ -0,0 +1,25 @@
+from django.urls import include, path
+from rest_framework.routers import DefaultRouter
+
+from main import views
+
+router = DefaultRouter()
+router.register('suppliers', views.SupplierViewSet, basename='supplier')
+router.register('materials', views.MaterialViewSet, basename='material')
+router.register('stock', views.StockViewSet, basename='stock')
+router.register('products', views.ProductViewSet, basename='product')
+router.register('orders', views.OrderViewSet, basename='order')
+router.register('purchases', views.PurchaseViewSet, basename='purchase')
+router.register('jobs', views.JobViewSet, basename='job')
+
+urlpatterns = [
+    path('api/dashboard/orders/', views.OrderDashboardView.as_view(), name='order-dashboard'),
+    path('api/search/', views.SearchView.as_view(), name='search'),
+    path('api/outbox/', views.OutboxView.as_view(), name='outbox'),
+    path('api/', include(router.urls)),
+    path('availability/', views.availability_check, name='availability'),
+    path('availability/async/', views.availability_check_async, name='availability-async'),
+    path('metrics', views.metrics, name='metrics'),
+    path('bom-cache/stats/', views.bom_cache_stats, name='bom-cache-stats'),
+    path('exports/<str:dataset>.<str:fmt>', views.export, name='export'),
+]
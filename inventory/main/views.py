@@ -1,3 +1,296 @@
-from django.shortcuts import render
+import hmac
+import ipaddress
+import uuid
 
-# Create your views here.
+from asgiref.sync import sync_to_async
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db.models import Prefetch
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.utils.dateparse import parse_date
+from rest_framework import mixins, viewsets
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from main import (
+    availability, bom, exporters, feed, instrumentation, outbox, refdata, search, snapshots, summary, transitions,
+)
+from main.routers import from_replica, reading_replica
+from main import serializers
+from main.models import Job, Material, Order, OrderProduct, Product, ProductMaterial, Purchase, Stock, Supplier
+
+
+@staff_member_required
+def bom_cache_stats(request):
+    return JsonResponse(bom.stats())
+
+
+def _may_scrape(request):
+    """Staff, a ``METRICS_TOKEN`` bearer, or a client in ``METRICS_ALLOWED_NETWORKS``."""
+    if request.user.is_authenticated and request.user.is_staff:
+        return True
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token and hmac.compare_digest(request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}'):
+        return True
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(
+        address in ipaddress.ip_network(network, strict=False)
+        for network in getattr(settings, 'METRICS_ALLOWED_NETWORKS', ())
+    )
+
+
+def metrics(request):
+    """Prometheus scrape endpoint; see ``_may_scrape`` for who may read it."""
+    if not _may_scrape(request):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        instrumentation.metrics.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
+
+
+@staff_member_required
+@reading_replica
+def export(request, dataset, fmt):
+    if dataset not in exporters.DATASETS or fmt not in exporters.FORMATS:
+        raise Http404
+    filters = {'include_archived': request.GET.get('include_archived') == '1'}
+    for name in ('since', 'until'):
+        if request.GET.get(name):
+            filters[name] = exporters.parse_timestamp(request.GET[name])
+            if filters[name] is None:
+                return JsonResponse({name: 'Expected an ISO timestamp.'}, status=400)
+    reason = exporters.unavailable(fmt)
+    if reason:
+        return JsonResponse({'format': reason}, status=501)
+    _, content_type = exporters.FORMATS[fmt]
+    stream = from_replica(exporters.export(dataset, fmt, **filters))
+    response = StreamingHttpResponse(stream, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{dataset}.{fmt}"'
+    return response
+
+
+def _availability_items(request):
+    try:
+        quantities = availability.parse_items(request.GET.get('items', ''))
+    except ValueError:
+        return None
+    return quantities or None
+
+
+_BAD_ITEMS = {'items': 'Expected <product_id>:<quantity>[,...].'}
+
+
+def availability_check(request):
+    """``GET ?items=<product_id>:<quantity>,...`` answered synchronously."""
+    if not request.user.is_authenticated:
+        return JsonResponse({'detail': 'Authentication required.'}, status=401)
+    quantities = _availability_items(request)
+    if quantities is None:
+        return JsonResponse(_BAD_ITEMS, status=400)
+    return JsonResponse({'products': availability.check(quantities)})
+
+
+async def availability_check_async(request):
+    """``availability_check`` for ASGI, with lookups coalesced across concurrent requests."""
+    if not await sync_to_async(lambda: request.user.is_authenticated)():
+        return JsonResponse({'detail': 'Authentication required.'}, status=401)
+    quantities = _availability_items(request)
+    if quantities is None:
+        return JsonResponse(_BAD_ITEMS, status=400)
+    return JsonResponse({'products': await availability.acheck(quantities)})
+
+
+class LiveModelViewSet(viewsets.ReadOnlyModelViewSet):
+    """Read-only viewset over non-archived rows.
+
+    Subclasses declare the relations their serializer walks in
+    ``select_related``/``prefetch_related`` so a page costs a fixed number
+    of queries whatever its size. Foreign keys to reference data go in
+    ``cached_related`` instead and are filled from ``main.refdata``, which
+    usually costs no query at all.
+    """
+    model = None
+    select_related = ()
+    prefetch_related = ()
+    cached_related = ()
+
+    def get_queryset(self):
+        queryset = self.model.objects.filter(is_archived=False)
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*self.prefetch_related)
+        return queryset
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        if page is not None:
+            refdata.attach(page, *self.cached_related)
+        return page
+
+    def get_object(self):
+        obj = super().get_object()
+        refdata.attach([obj], *self.cached_related)
+        return obj
+
+
+class SupplierViewSet(LiveModelViewSet):
+    model = Supplier
+    serializer_class = serializers.SupplierSerializer
+
+
+class MaterialViewSet(LiveModelViewSet):
+    model = Material
+    serializer_class = serializers.MaterialSerializer
+    cached_related = ('supplier',)
+
+
+class StockViewSet(LiveModelViewSet):
+    model = Stock
+    serializer_class = serializers.StockSerializer
+    cached_related = ('material',)
+
+    @action(detail=False, url_path='as-of')
+    @reading_replica
+    def as_of(self, request):
+        """``GET ?at=<ISO timestamp>[&materials=<id>,...]``: ledger balances per material at ``at``."""
+        at = exporters.parse_timestamp(request.query_params.get('at', ''))
+        if at is None:
+            return Response({'at': 'Expected an ISO timestamp.'}, status=400)
+        material_ids = None
+        if request.query_params.get('materials'):
+            try:
+                material_ids = [uuid.UUID(m) for m in request.query_params['materials'].split(',') if m]
+            except ValueError:
+                return Response({'materials': 'Expected comma-separated material ids.'}, status=400)
+        balances = snapshots.as_of(at, material_ids)
+        return Response([
+            {'material': material_id, 'on_hand': on_hand, 'reserved': reserved}
+            for material_id, (on_hand, reserved) in sorted(balances.items())
+        ])
+
+
+class ProductViewSet(LiveModelViewSet):
+    model = Product
+    serializer_class = serializers.ProductSerializer
+    prefetch_related = (
+        Prefetch(
+            'productmaterial_set',
+            queryset=ProductMaterial.objects.filter(is_archived=False).select_related('material'),
+            to_attr='bom_lines',
+        ),
+    )
+
+
+class OrderViewSet(LiveModelViewSet):
+    model = Order
+    serializer_class = serializers.OrderSerializer
+    cached_related = ('client',)
+    prefetch_related = (
+        Prefetch(
+            'order_products',
+            queryset=OrderProduct.objects.filter(is_archived=False).select_related('product'),
+            to_attr='live_order_products',
+        ),
+    )
+
+    @action(detail=True, methods=['post'])
+    def status(self, request, pk=None):
+        """Queue a move to the next status; the work runs in a ``run_jobs`` worker."""
+        serializer = serializers.OrderStatusSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        order = Order.objects.filter(pk=pk, is_archived=False).only('pk', 'order_status').first()
+        if order is None:
+            raise Http404
+        try:
+            job = transitions.request_transition(order, serializer.validated_data['status'], request.user)
+        except transitions.InvalidTransition as e:
+            return Response({'status': str(e)}, status=409)
+        return Response(serializers.JobSerializer(job).data, status=202)
+
+
+class PurchaseViewSet(LiveModelViewSet):
+    model = Purchase
+    serializer_class = serializers.PurchaseSerializer
+    cached_related = ('supplier', 'material')
+
+
+class JobViewSet(mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    queryset = Job.objects.all()
+    serializer_class = serializers.JobSerializer
+
+
+class OrderDashboardView(APIView):
+    """Order counts and values per day and status (optionally per client).
+
+    Served from ``OrderSummary`` with a single query on its
+    ``(day, order_status, client)`` index.
+    """
+
+    @reading_replica
+    def get(self, request):
+        params = {}
+        for name in ('since', 'until'):
+            if request.query_params.get(name):
+                try:
+                    params[name] = parse_date(request.query_params[name])
+                except ValueError:
+                    params[name] = None
+                if params[name] is None:
+                    return Response({name: 'Expected a YYYY-MM-DD date.'}, status=400)
+        if request.query_params.get('client'):
+            try:
+                params['client_id'] = uuid.UUID(request.query_params['client'])
+            except ValueError:
+                return Response({'client': 'Expected a client id.'}, status=400)
+        rows = summary.dashboard(by_client=request.query_params.get('by') == 'client', **params)
+        return Response(list(rows))
+
+
+class SearchView(APIView):
+    """``GET ?q=<text>[&types=material,product][&limit=20]``: live rows of every type, best first."""
+    max_limit = 50
+
+    @reading_replica
+    def get(self, request):
+        text = request.query_params.get('q', '')
+        types = [t for t in request.query_params.get('types', '').split(',') if t]
+        unknown = set(types) - set(search.KINDS)
+        if unknown:
+            return Response({'types': f'Unknown types: {", ".join(sorted(unknown))}.'}, status=400)
+        try:
+            limit = min(int(request.query_params.get('limit', 20)), self.max_limit)
+        except ValueError:
+            return Response({'limit': 'Expected a number.'}, status=400)
+        if limit < 1:
+            return Response({'limit': 'Expected a positive number.'}, status=400)
+        return Response([hit.as_dict() for hit in search.search(text, types, limit)])
+
+
+class OutboxView(APIView):
+    """``GET ?after=<seq>[&kinds=order,stock][&limit=500]``: change events after ``after``, oldest first.
+
+    Returns the events and the ``next`` sequence number to pass as ``after``.
+    """
+    permission_classes = [IsAdminUser]
+    max_limit = 5000
+
+    def get(self, request):
+        kinds = [k for k in request.query_params.get('kinds', '').split(',') if k]
+        unknown = set(kinds) - set(outbox.FIELDS)
+        if unknown:
+            return Response({'kinds': f'Unknown kinds: {", ".join(sorted(unknown))}.'}, status=400)
+        try:
+            after = int(request.query_params.get('after', 0))
+            limit = min(int(request.query_params.get('limit', 500)), self.max_limit)
+        except ValueError:
+            return Response({'after': 'Expected numbers for after and limit.'}, status=400)
+        if limit < 1:
+            return Response({'limit': 'Expected a positive number.'}, status=400)
+        events, cursor = feed.pull(after, limit, kinds)
+        return Response({'events': [feed.as_dict(event) for event in events], 'next': cursor})